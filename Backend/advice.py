@@ -0,0 +1,33 @@
+def insufficient() -> dict:
+    # A city without any data in the analysis window
+    return {"recommended": False, "confidence": "low", "summary": "Insufficient data."}
+
+
+def describe(type: str, city: str, score: float, metrics: dict, reasons: list) -> dict:
+    # The advice for one city, from its score (scoring.py), the three-year
+    # averages in metrics and a reason per scoring rule
+    score = int(score) if float(score).is_integer() else round(score, 2)
+    recommended = score >= 1
+    confidence = "high" if score >= 2 else "medium" if score >= 1 else "low"
+    return {
+        "recommended": recommended,
+        "confidence": confidence,
+        "summary": f"{type.title()} businesses in {city} show {confidence} potential based on historical trends.",
+        "key_metrics": {name: round(value, 2) for name, value in metrics.items()},
+        "reasons": reasons,
+        "score": score,
+    }
+
+
+def rank(advice: list) -> list:
+    # Highest score first, then the widest revenue-over-cost margin; cities
+    # without data go last.
+    def key(item):
+        metrics = item.get("key_metrics")
+        if metrics is None:
+            return (1, 0, 0)
+        return (0, -item["score"], -(metrics["avg_revenue"] - metrics["avg_costs"]))
+    ranked = sorted(advice, key=key)
+    for position, item in enumerate(ranked, start=1):
+        item["rank"] = position
+    return ranked
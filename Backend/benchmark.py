@@ -0,0 +1,461 @@
+"""
+Latency and throughput benchmark for the insight routes, without Snowflake.
+
+The app runs in-process with the connection pool pointed at a local stand-in
+warehouse: DuckDB when it is installed, else SQLite, loaded with synthetic
+rows shaped like the five report views (generated on the fly, or a
+``datagen.py`` output directory given with ``--data``). A seeded mix of dashboard page visits
+(each page making the requests the frontend makes for it) is replayed through
+the ASGI app by concurrent clients, and per route it reports p50/p95/p99
+latency, requests per second, error count and the Python memory a cold
+request allocates. Results are written as JSON so runs can be compared::
+
+    python benchmark.py --rows 20000 --requests 3000 --concurrency 16 --output bench.json
+    python benchmark.py --rows 20000 --requests 3000 --concurrency 16 --baseline bench.json
+
+SQLite can't run Snowflake-only SQL (``QUALIFY``), so routes whose queries
+fail on the stand-in are listed under ``skipped`` rather than timed.
+"""
+
+import argparse
+import asyncio
+import csv
+import glob
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import duckdb
+except ImportError:  # SQLite is the fallback stand-in
+    duckdb = None
+
+from datagen import YEARS, Geography, generate, read_view, rows_of
+from inprocess import call
+from snapshot import COLUMNS, STRING_COLUMNS
+from views import VIEW_MAP
+
+RESULTS_VERSION = 1
+
+# Business type -> share of visits
+TYPE_WEIGHTS = {"salon": 30, "cafe": 25, "restaurant": 20, "retail": 15, "pharmacy": 10}
+
+ALL_FILTERS = {"type": "type", "province": "province", "city": "city", "year": "year"}
+
+# Dashboard page -> (share of visits, needs a city, requests it makes). A
+# request is (path, visit filter -> query parameter); the visit's filters
+# that the request doesn't take are left off.
+PAGES = {
+    "overview": (40, False, [
+        ("/api/insights/dashboard", ALL_FILTERS),
+        ("/api/filters/options", ALL_FILTERS),
+    ]),
+    "revenue": (15, False, [
+        ("/api/insights/revenue-by-type-kpi", ALL_FILTERS),
+        ("/api/insights/revenue-by-type-chart", {"type": "type", "province": "province", "city": "city"}),
+    ]),
+    "costs": (12, False, [
+        ("/api/insights/cost-breakdown", ALL_FILTERS),
+        ("/api/filters/options", ALL_FILTERS),
+    ]),
+    "wages": (10, False, [
+        ("/api/insights/wage-trends", ALL_FILTERS),
+        ("/api/filters/options", ALL_FILTERS),
+    ]),
+    "policies": (13, False, [
+        ("/api/insights/policy-distribution", ALL_FILTERS),
+        ("/api/insights/policy-impact-trend", ALL_FILTERS),
+        ("/api/insights/maximum_impact_of_policy", ALL_FILTERS),
+        ("/api/insights/minimum_impact_of_policy", ALL_FILTERS),
+    ]),
+    "predictions": (10, True, [
+        ("/api/insights/forecast-openings", {"type": "type", "province": "province", "city": "city", "year": "target_year"}),
+        ("/api/advice/should-open", ALL_FILTERS),
+    ]),
+}
+
+
+# -- Stand-in warehouse ------------------------------------------------------
+
+
+class LocalWarehouse:
+    """The report views in an in-memory DuckDB or SQLite database, behind a connector-like API."""
+
+    def __init__(self, engine: str, query_latency: float = 0.0):
+        if engine == "auto":
+            engine = "duckdb" if duckdb is not None else "sqlite"
+        if engine == "duckdb" and duckdb is None:
+            raise SystemExit("DuckDB isn't installed; use --engine sqlite or pip install duckdb.")
+        self.engine = engine
+        self.version = duckdb.__version__ if engine == "duckdb" else sqlite3.sqlite_version
+        self.query_latency = query_latency
+        self._queries = 0
+        self._lock = threading.Lock()
+        if engine == "duckdb":
+            self._db = duckdb.connect(":memory:")
+        else:
+            # Shared-cache memory database, so every pooled connection sees the tables
+            self._uri = f"file:benchmark-{os.getpid()}?mode=memory&cache=shared"
+            self._db = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+
+    def create(self, view_name: str) -> None:
+        types = ", ".join(f"{c} {'VARCHAR' if c in STRING_COLUMNS else 'DOUBLE'}" for c in COLUMNS)
+        types = types.replace("YEAR DOUBLE", "YEAR INTEGER")
+        self._db.execute(f"CREATE TABLE {view_name} ({types})")
+
+    def insert(self, view_name: str, rows) -> None:
+        if self.engine == "sqlite":
+            placeholders = ", ".join("?" * len(COLUMNS))
+            self._db.executemany(f"INSERT INTO {view_name} VALUES ({placeholders})", rows)
+            self._db.commit()
+            return
+        # DuckDB bulk-loads a CSV far faster than row inserts
+        with tempfile.NamedTemporaryFile("w", newline="", suffix=".csv", delete=False) as f:
+            csv.writer(f).writerows(rows)
+        try:
+            self._db.execute(f"INSERT INTO {view_name} SELECT * FROM read_csv(?, header=false, nullstr='')", [f.name])
+        finally:
+            os.remove(f.name)
+
+    def load_directory(self, view_name: str, path: str) -> int:
+        """Load a ``datagen.py`` view directory; returns its row count."""
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if self.engine == "duckdb":
+            files = sorted(glob.glob(os.path.join(path, f"part-*.{manifest['format']}")))
+            reader = "read_parquet(?)" if manifest["format"] == "parquet" else "read_csv(?, header=true, nullstr='')"
+            self._db.execute(f"INSERT INTO {view_name} SELECT {', '.join(COLUMNS)} FROM {reader}", [files])
+        else:
+            for rows in read_view(path):
+                self.insert(view_name, rows)
+        return manifest["rows"]
+
+    def connect(self):
+        if self.engine == "duckdb":
+            return _Connection(self, self._db.cursor())
+        return _Connection(self, sqlite3.connect(self._uri, uri=True, check_same_thread=False))
+
+    def next_query_id(self) -> str:
+        with self._lock:
+            self._queries += 1
+            return f"{self.engine}-{self._queries}"
+
+
+class _Connection:
+    def __init__(self, warehouse, raw):
+        self._warehouse = warehouse
+        self._raw = raw
+        self._closed = False
+
+    def cursor(self):
+        return _Cursor(self._warehouse, self._raw)
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+        self._raw.close()
+
+
+class _Cursor:
+    def __init__(self, warehouse, raw):
+        self._warehouse = warehouse
+        self._cursor = raw.cursor()
+        self.sfqid = None
+
+    def execute(self, sql, params=None):
+        if self._warehouse.query_latency:
+            time.sleep(self._warehouse.query_latency)
+        self._cursor.execute(sql, params or [])
+        self.sfqid = self._warehouse.next_query_id()
+        return self
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or 1)
+
+    def close(self):
+        self._cursor.close()
+
+
+# -- Traffic -----------------------------------------------------------------
+
+
+def traffic(rng: random.Random, requests: int) -> list:
+    """Seeded list of (path, params) from dashboard page visits, about *requests* long."""
+    pages = list(PAGES)
+    page_weights = [PAGES[p][0] for p in pages]
+    types = list(TYPE_WEIGHTS)
+    geography = Geography().cities_by_province()
+    provinces = list(geography)
+    plan = []
+    while len(plan) < requests:
+        page = rng.choices(pages, weights=page_weights)[0]
+        _, needs_city, page_requests = PAGES[page]
+        visit = {"type": rng.choices(types, weights=[TYPE_WEIGHTS[t] for t in types])[0]}
+        if needs_city or rng.random() < 0.6:
+            # Zipf-like: the big provinces and cities get most of the attention
+            visit["province"] = rng.choices(provinces, weights=[1 / (i + 1) for i in range(len(provinces))])[0]
+            cities = geography[visit["province"]]
+            if needs_city or rng.random() < 0.4:
+                visit["city"] = rng.choices(cities, weights=[1 / (i + 1) for i in range(len(cities))])[0]
+        if needs_city or rng.random() < 0.5:
+            visit["year"] = rng.choices(YEARS, weights=range(1, len(YEARS) + 1))[0]
+        for path, params in page_requests:
+            plan.append((path, {param: visit[key] for key, param in params.items() if key in visit}))
+    return plan[:requests]
+
+
+# -- ASGI client -------------------------------------------------------------
+
+
+async def replay(app, plan: list, concurrency: int):
+    """Run *plan* with *concurrency* clients; returns ([(path, status, seconds)], wall seconds)."""
+    results = []
+    pending = iter(plan)
+
+    async def client():
+        for path, params in pending:
+            started = time.perf_counter()
+            try:
+                status, _ = await call(app, path, params, host="benchmark")
+            except Exception:
+                status = 599
+            results.append((path, status, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+async def allocations(app, plan: list, samples: int, clear) -> dict:
+    """Peak Python allocation (KiB) of uncached requests, median and max per route."""
+    by_route = {}
+    for path, params in plan:
+        by_route.setdefault(path, [])
+        if len(by_route[path]) < samples:
+            by_route[path].append(params)
+    result = {}
+    tracemalloc.start()
+    try:
+        for path, sampled in by_route.items():
+            peaks = []
+            for params in sampled:
+                clear()
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                await call(app, path, params, host="benchmark")
+                peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+            peaks.sort()
+            result[path] = {"median": round(peaks[len(peaks) // 2], 1), "max": round(peaks[-1], 1)}
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+# -- Reporting ---------------------------------------------------------------
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def summarize(results: list, wall: float) -> dict:
+    latencies = sorted(seconds for _, _, seconds in results)
+    errors = sum(1 for _, status, _ in results if status >= 500)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / wall, 1) if wall else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(1000 * percentile(latencies, 0.50), 3),
+        "p95_ms": round(1000 * percentile(latencies, 0.95), 3),
+        "p99_ms": round(1000 * percentile(latencies, 0.99), 3),
+    }
+
+
+def _rss_mb() -> dict:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    current_mb = None
+    try:
+        with open("/proc/self/statm") as f:
+            current_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        pass
+    return {"peak_rss_mb": round(peak_mb, 1), "rss_mb": round(current_mb, 1) if current_mb else None}
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report: dict, baseline: dict = None) -> list:
+    """Print the per-route table, with changes against *baseline*; returns the p95 changes (%)."""
+    columns = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms")
+    print(f"{'route':<44}" + "".join(f"{c:>10}" for c in columns) + f"{'alloc_kib':>11}")
+    changes = []
+    rows = list(report["routes"].items()) + [("TOTAL", report["summary"])]
+    for route, stats in rows:
+        line = f"{route:<44}" + "".join(f"{stats[c]:>10}" for c in columns)
+        line += f"{stats.get('alloc_kib', {}).get('median', ''):>11}"
+        previous = (baseline or {}).get("routes", {}).get(route) if route != "TOTAL" else (baseline or {}).get("summary")
+        if previous and previous.get("p95_ms"):
+            change = 100 * (stats["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"]
+            changes.append(change)
+            line += f"   p95 {change:+.1f}%  rps {stats['rps'] - previous['rps']:+.1f}"
+        print(line)
+    for route, reason in report["skipped"].items():
+        print(f"skipped {route}: {reason}")
+    print("memory:", report["memory"])
+    return changes
+
+
+# -- Main --------------------------------------------------------------------
+
+
+async def benchmark(args) -> dict:
+    # Settings the app reads at import time
+    if not args.rollups:
+        os.environ["ROLLUP_REFRESH_INTERVAL"] = "0"
+    if args.no_cache:
+        os.environ["QUERY_CACHE_TTL"] = "0"
+    os.environ.setdefault("SLOW_QUERY_MS", "60000")
+    # DuckDB and SQLite have no HASH_AGG
+    os.environ.setdefault("VERSION_PROBE", "count")
+    # Measure cold starts, not the warm-up
+    os.environ.setdefault("WARMUP_CONCURRENCY", "0")
+
+    warehouse = LocalWarehouse(args.engine, args.query_ms / 1000)
+    rows_per_view = {}
+    for view_index, view_name in enumerate(VIEW_MAP.values()):
+        warehouse.create(view_name)
+        if args.data:
+            rows_per_view[view_name] = warehouse.load_directory(view_name, os.path.join(args.data, view_name))
+            continue
+        for columns in generate(view_index, args.rows, args.seed):
+            warehouse.insert(view_name, rows_of(columns))
+        rows_per_view[view_name] = args.rows
+
+    import db
+    db.init_pool(warehouse.connect)
+    import main as api
+    from cache import query_cache
+    from rollups import rollup_store
+
+    plan = traffic(random.Random(args.seed), args.warmup + args.requests)
+    warmup, plan = plan[:args.warmup], plan[args.warmup:]
+    app = api.app
+
+    async with app.router.lifespan_context(app):
+        if args.rollups:
+            deadline = time.monotonic() + 120
+            while not all(rollup_store.get(v) for v in VIEW_MAP.values()) and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+
+        # Routes the stand-in can't run are left out instead of timed as errors
+        skipped = {}
+        for path in dict.fromkeys(path for path, _ in plan):
+            params = next(p for route, p in plan if route == path)
+            status, _ = await call(app, path, params, host="benchmark")
+            if status >= 500:
+                skipped[path] = f"HTTP {status} on the {warehouse.engine} stand-in"
+        plan = [(path, params) for path, params in plan if path not in skipped]
+        warmup = [(path, params) for path, params in warmup if path not in skipped]
+
+        query_cache.clear()
+        await replay(app, warmup, args.concurrency)
+        results, wall = await replay(app, plan, args.concurrency)
+        alloc = await allocations(app, plan, args.memory_samples, query_cache.clear) if args.memory_samples else {}
+
+    routes = {}
+    for path in sorted({path for path, _, _ in results}):
+        route_results = [r for r in results if r[0] == path]
+        routes[path] = {**summarize(route_results, wall), "alloc_kib": alloc.get(path, {})}
+
+    return {
+        "version": RESULTS_VERSION,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            "seed": args.seed,
+            "data": args.data,
+            "rows_per_view": rows_per_view,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "query_ms": args.query_ms,
+            "rollups": args.rollups,
+            "cache": not args.no_cache,
+        },
+        "environment": {
+            "engine": f"{warehouse.engine} {warehouse.version}",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _commit(),
+        },
+        "summary": summarize(results, wall),
+        "routes": routes,
+        "skipped": skipped,
+        "memory": _rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the insight routes against a local stand-in warehouse.")
+    parser.add_argument("--engine", choices=["auto", "duckdb", "sqlite"], default="auto")
+    parser.add_argument("--rows", type=int, default=20_000, help="Synthetic rows per report view.")
+    parser.add_argument("--data", help="Load a datagen.py output directory instead of generating rows.")
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--query-ms", type=float, default=0, help="Extra latency per statement, to stand in for the network.")
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false", help="Query the warehouse instead of rollup cubes.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the query result cache.")
+    parser.add_argument("--memory-samples", type=int, default=10, help="Uncached requests per route traced for allocations (0 skips).")
+    parser.add_argument("--output", help="Write the results JSON here.")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare with.")
+    parser.add_argument("--max-regression", type=float, help="Exit non-zero if any route's p95 is this many percent slower than the baseline.")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    changes = print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.max_regression is not None and any(change > args.max_regression for change in changes):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+MISSING = object()
+
+
+class QueryCache:
+    """
+    In-process result cache for the insight endpoints.
+
+    Entries expire ``ttl`` seconds after they were stored and the cache as a
+    whole is bounded to ``max_bytes`` of serialized payload; once full, the
+    least recently used entries are evicted first. Every entry is tagged with
+    the view it was computed from so a single view can be invalidated when
+    its data is refreshed.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, view, size, expires_at)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, _, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, view: str, value) -> None:
+        size = _payload_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                self.rejected += 1
+                return
+            while self._entries and self._bytes + size > self.max_bytes:
+                _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (value, view, size, time.monotonic() + self.ttl)
+            self._bytes += size
+
+    def invalidate_view(self, view: str) -> int:
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] == view]
+            for key in stale:
+                self._remove(key, self._entries[key][2])
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += count
+            return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "rejected": self.rejected,
+            }
+
+    def _remove(self, key, size: int) -> None:
+        del self._entries[key]
+        self._bytes -= size
+
+
+def _payload_size(value) -> int:
+    # Serialized JSON length is what the entry costs on the wire and is a
+    # stable proxy for its memory footprint.
+    return len(json.dumps(value, default=str, separators=(",", ":")))
+
+
+def cache_key(endpoint: str, view: str, params: dict, version: str = None) -> tuple:
+    """Normalized key: endpoint, view, data version and the non-empty query parameters in a fixed order."""
+    return (endpoint, view, version) + tuple(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in sorted(params.items())
+        if value is not None
+    )
+
+
+query_cache = QueryCache(
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+    max_bytes=int(float(os.getenv("QUERY_CACHE_MAX_MB", "64")) * 1024 * 1024),
+)
@@ -0,0 +1,59 @@
+"""
+Comparison mode: one insight endpoint answered for several business types.
+
+Every SQL endpoint is a ``build`` and a ``shape`` step in
+``remote_queries.py``. A comparison builds the query of each type's view and
+sends them as the branches of one ``UNION ALL`` statement, tagged with a
+branch number and ordered by branch and then by the queries' own output
+order, so Snowflake is asked once. Each type's rows then go through the
+endpoint's ``shape``, giving exactly the payload of a single-type request.
+"""
+
+from db import pooled_connection
+from remote_queries import REMOTE_QUERIES
+from views import VIEW_MAP
+
+ALL_TYPES = "all"
+
+
+def parse_types(value: str):
+    """Business types named by a ``type`` of ``all`` or ``a,b,c``; None for a single type."""
+    if value.strip().lower() == ALL_TYPES:
+        return list(VIEW_MAP)
+    if "," not in value:
+        return None
+    return list(dict.fromkeys(t.strip().lower() for t in value.split(",") if t.strip()))
+
+
+def compare_views(name: str, fn, views: dict, kwargs: dict) -> dict:
+    """Payload of endpoint *name* for every ``{type: view}`` in *views*, from one query."""
+    remote = REMOTE_QUERIES.get(name)
+    if remote is None:
+        # Endpoints without SQL of their own (score lookups) answer per type
+        return {business_type: fn(**{**kwargs, "type": business_type}) for business_type in views}
+
+    filters = {k: v for k, v in kwargs.items() if k != "type"}
+    sql, params = union_query([remote.build(view_name, **filters) for view_name in views.values()])
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+    branches = [[] for _ in views]
+    for row in rows:
+        branches[int(row[0])].append(tuple(row[1:]))
+    return {
+        business_type: remote.shape(branch, business_type, **filters)
+        for business_type, branch in zip(views, branches)
+    }
+
+
+def union_query(queries: list):
+    """One statement running every ``queries.Query``, rows tagged with BRANCH_ID and in branch order."""
+    branches = [f"SELECT {i} AS BRANCH_ID, q.* FROM ({query.sql.strip()}) q" for i, query in enumerate(queries)]
+    # Branches differ only in their view, so they share the output order
+    order = ", ".join(["BRANCH_ID"] + ([queries[0].order] if queries[0].order else []))
+    sql = "SELECT * FROM (\n" + "\nUNION ALL\n".join(branches) + f"\n) ORDER BY {order}"
+    binds = [value for query in queries for value in (query.params or [])]
+    return sql, binds or None
@@ -0,0 +1,307 @@
+"""
+Synthetic report-view data for scaling tests.
+
+Generates rows with the ``*_RPT_VW`` schema the backend relies on (the
+``snapshot.COLUMNS``) at a multiple of the current view size, so endpoints
+can be exercised at 10x, 100x or 1000x today's data. The shape follows the
+real views:
+
+* Cities are Canadian municipalities, sampled in proportion to population, so
+  a handful of large cities hold most rows (Zipf-like skew). Provinces and
+  territories follow from their cities.
+* Volume grows year over year, and revenue, rent, wages and utilities grow
+  with it. Revenue is log-normal and scaled by city size. Rent and
+  utilities track revenue, and wages follow a per-province level.
+* A policy catalogue of a few hundred IDs is drawn with a skewed
+  popularity. Each policy has one type and a usual impact level.
+* Nullable columns are NULL at small per-column rates (``NULL_RATES``).
+
+Rows come from a seeded generator per block of rows and are written
+straight to disk in chunks as CSV or Parquet. Memory stays at one chunk, and
+the output is identical for the same seed however it is chunked::
+
+    python datagen.py --out data/x100 --scale 100 --format parquet
+
+Each view gets its own directory of ``part-NNNNN`` files and a
+``manifest.json``. Parquet, and faster CSV writing, need the optional
+``pyarrow`` package.
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+
+import numpy as np
+
+from impact import DEFAULT_SCORES
+from snapshot import COLUMNS
+from views import VIEW_MAP
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # CSV falls back to the csv module; Parquet needs pyarrow
+    pa = None
+
+# Rows per view at scale 1; set --base-rows to the current view size
+BASE_ROWS = 10_000
+CHUNK_ROWS = 500_000
+BLOCK_ROWS = 10_000
+
+YEARS = list(range(2015, 2025))
+YEARLY_GROWTH = 0.04
+
+# Province -> (median wage in CAD at the first year, {city: population in thousands})
+GEOGRAPHY = {
+    "Ontario": (52_000, {
+        "Toronto": 2794, "Ottawa": 1017, "Mississauga": 717, "Brampton": 656, "Hamilton": 569,
+        "London": 422, "Markham": 338, "Vaughan": 323, "Kitchener": 256, "Windsor": 229,
+        "Oakville": 213, "Burlington": 186, "Sudbury": 166, "Oshawa": 175, "Barrie": 148,
+        "Guelph": 143, "Kingston": 132, "Thunder Bay": 108, "Waterloo": 121, "Peterborough": 83,
+    }),
+    "Quebec": (46_000, {
+        "Montreal": 1762, "Quebec City": 549, "Laval": 438, "Gatineau": 291, "Longueuil": 254,
+        "Sherbrooke": 172, "Saguenay": 144, "Levis": 149, "Trois-Rivieres": 139,
+    }),
+    "British Columbia": (51_000, {
+        "Vancouver": 662, "Surrey": 568, "Burnaby": 249, "Richmond": 209, "Abbotsford": 153,
+        "Coquitlam": 148, "Kelowna": 144, "Victoria": 91, "Kamloops": 97, "Nanaimo": 99,
+    }),
+    "Alberta": (56_000, {
+        "Calgary": 1306, "Edmonton": 1010, "Red Deer": 100, "Lethbridge": 98, "St. Albert": 68,
+        "Medicine Hat": 63, "Grande Prairie": 64,
+    }),
+    "Manitoba": (47_000, {"Winnipeg": 749, "Brandon": 51, "Steinbach": 17}),
+    "Saskatchewan": (50_000, {"Saskatoon": 266, "Regina": 226, "Prince Albert": 37, "Moose Jaw": 33}),
+    "Nova Scotia": (45_000, {"Halifax": 439, "Cape Breton": 93, "Truro": 13}),
+    "New Brunswick": (44_000, {"Moncton": 79, "Saint John": 69, "Fredericton": 63}),
+    "Newfoundland and Labrador": (48_000, {"St. John's": 111, "Mount Pearl": 23, "Corner Brook": 20}),
+    "Prince Edward Island": (43_000, {"Charlottetown": 39, "Summerside": 16}),
+    "Yukon": (60_000, {"Whitehorse": 28}),
+    "Northwest Territories": (68_000, {"Yellowknife": 20}),
+    "Nunavut": (64_000, {"Iqaluit": 7}),
+}
+
+POLICY_TYPES = {"Tax": 30, "Zoning": 20, "Wage": 18, "Licensing": 14, "Subsidy": 12, "Health": 6}
+POLICY_IMPACTS = list(DEFAULT_SCORES)
+BASE_POLICIES = 200
+
+# Share of NULLs in the nullable columns
+NULL_RATES = {"RENT_COST_CAD": 0.04, "UTILITY_COST_CAD_PER_YR": 0.02, "POLICY_TYPE": 0.03, "POLICY_IMPACT": 0.05}
+
+
+class Geography:
+    """Cities with their province, sampling weight and relative size."""
+
+    def __init__(self, geography: dict = GEOGRAPHY):
+        self.provinces = list(geography)
+        self.wages = np.array([wage for wage, _ in geography.values()], dtype=np.float64)
+        cities = [(p, city, pop) for p, (_, cs) in enumerate(geography.values()) for city, pop in cs.items()]
+        self.cities = np.array([city for _, city, _ in cities], dtype=object)
+        self.province_of = np.array([p for p, _, _ in cities], dtype=np.int64)
+        population = np.array([pop for _, _, pop in cities], dtype=np.float64)
+        weights = population ** 0.9
+        self.weights = weights / weights.sum()
+        self.size = np.log1p(population) / np.log1p(population.max())  # 0..1
+
+    def cities_by_province(self) -> dict:
+        """Province -> its cities, largest first."""
+        order = np.argsort(-self.weights, kind="stable")
+        result = {province: [] for province in self.provinces}
+        for i in order.tolist():
+            result[self.provinces[self.province_of[i]]].append(self.cities[i])
+        return result
+
+
+class PolicyCatalogue:
+    """Policy IDs with a fixed type, usual impact and skewed popularity."""
+
+    def __init__(self, rng: np.random.Generator, count: int):
+        self.ids = np.array([f"POL-{i:05d}" for i in range(1, count + 1)], dtype=object)
+        type_names = list(POLICY_TYPES)
+        type_weights = np.array(list(POLICY_TYPES.values()), dtype=np.float64)
+        self.types = np.array(type_names, dtype=object)[
+            rng.choice(len(type_names), size=count, p=type_weights / type_weights.sum())
+        ]
+        self.impacts = rng.integers(0, len(POLICY_IMPACTS), size=count)
+        popularity = 1.0 / np.arange(1, count + 1) ** 0.8
+        self.weights = popularity / popularity.sum()
+
+
+def year_weights() -> np.ndarray:
+    weights = (1 + YEARLY_GROWTH) ** np.arange(len(YEARS))
+    return weights / weights.sum()
+
+
+def generate(view_index: int, rows: int, seed: int = 1, chunk_rows: int = CHUNK_ROWS, policies: int = None):
+    """
+    Yield ``{column: values}`` chunks adding up to *rows* rows of one view.
+
+    *view_index* separates the views' streams, so every view gets different
+    data from the same seed.
+    """
+    geography = Geography()
+    catalogue = PolicyCatalogue(
+        np.random.default_rng([seed, view_index]),
+        policies or max(BASE_POLICIES, int(BASE_POLICIES * (rows / BASE_ROWS) ** 0.5)),
+    )
+    years = year_weights()
+    produced = 0
+    while produced < rows:
+        # Every block has its own generator, so the data doesn't depend on the chunk size
+        n = min(chunk_rows, rows - produced)
+        blocks = []
+        first = produced // BLOCK_ROWS
+        last = (produced + n - 1) // BLOCK_ROWS
+        for block in range(first, last + 1):
+            start = max(produced, block * BLOCK_ROWS)
+            stop = min(produced + n, (block + 1) * BLOCK_ROWS)
+            rng = np.random.default_rng([seed, view_index, block])
+            columns = _block(rng, BLOCK_ROWS, geography, catalogue, years)
+            offset = block * BLOCK_ROWS
+            blocks.append({name: values[start - offset:stop - offset] for name, values in columns.items()})
+        yield {name: np.concatenate([b[name] for b in blocks]) for name in COLUMNS}
+        produced += n
+
+
+def _block(rng, n, geography, catalogue, years) -> dict:
+    city = rng.choice(len(geography.cities), size=n, p=geography.weights)
+    province = geography.province_of[city]
+    size = geography.size[city]
+    year_index = rng.choice(len(YEARS), size=n, p=years)
+    growth = (1 + YEARLY_GROWTH) ** year_index
+
+    opened = rng.poisson(2 + 30 * size ** 2)
+    closed = rng.poisson(opened * rng.uniform(0.4, 1.2, size=n))
+    revenue = rng.lognormal(mean=12.0 + 0.8 * size, sigma=0.45) * growth
+    rent = revenue * rng.uniform(0.06, 0.18, size=n)
+    utility = np.clip(rng.normal(4_500, 1_200, size=n), 800, None) * (1.03 ** year_index)
+    wage = geography.wages[province] * (1.025 ** year_index) * rng.normal(1.0, 0.08, size=n)
+    footfall = rng.gamma(4.0, 40 + 220 * size)
+    total = rng.poisson(20 + 600 * size ** 2)
+
+    policy = rng.choice(len(catalogue.ids), size=n, p=catalogue.weights)
+    # Most rows carry the policy's usual impact, the rest a neighbouring level
+    impact = np.clip(catalogue.impacts[policy] + rng.choice([-1, 0, 0, 0, 0, 1], size=n), 0, len(POLICY_IMPACTS) - 1)
+
+    columns = {
+        "YEAR": np.array(YEARS, dtype=np.int64)[year_index],
+        "PROVINCE": np.array(geography.provinces, dtype=object)[province],
+        "CITY_NAME": geography.cities[city],
+        "OPENED": opened.astype(np.int64),
+        "CLOSED": closed.astype(np.int64),
+        "REVENUE_CAD": np.round(revenue, 2),
+        "RENT_COST_CAD": np.round(rent, 2),
+        "UTILITY_COST_CAD_PER_YR": np.round(utility, 2),
+        "MEDIAN_WAGE_CAD": np.round(wage, 2),
+        "CONSUMER_FOOTFALL": np.round(footfall, 2),
+        "TOTAL_SALONS": total.astype(np.int64),
+        "POLICY_ID": catalogue.ids[policy],
+        "POLICY_TYPE": catalogue.types[policy],
+        "POLICY_IMPACT": np.array(POLICY_IMPACTS, dtype=object)[impact],
+    }
+    for name, rate in NULL_RATES.items():
+        nulls = rng.random(n) < rate
+        if columns[name].dtype == object:
+            columns[name][nulls] = None
+        else:
+            columns[name] = columns[name].astype(object)
+            columns[name][nulls] = None
+    return columns
+
+
+def rows_of(columns: dict) -> list:
+    """Chunk columns as a list of row lists, in ``COLUMNS`` order."""
+    return [list(row) for row in zip(*(columns[name].tolist() for name in COLUMNS))]
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def write_chunk(path: str, columns: dict, fmt: str) -> None:
+    if fmt == "parquet":
+        pq.write_table(_arrow_table(columns), path, compression="zstd")
+    elif pa is not None:
+        pa_csv.write_csv(_arrow_table(columns), path)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows_of(columns))
+
+
+def _arrow_table(columns: dict):
+    return pa.table({name: pa.array(columns[name]) for name in COLUMNS})
+
+
+def write_view(directory: str, view_name: str, view_index: int, rows: int, seed: int, fmt: str,
+               chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Write one view as ``part-NNNNN`` files under *directory*/*view_name*; returns its manifest."""
+    target = os.path.join(directory, view_name)
+    os.makedirs(target, exist_ok=True)
+    parts = []
+    for i, columns in enumerate(generate(view_index, rows, seed, chunk_rows)):
+        name = f"part-{i:05d}.{fmt}"
+        write_chunk(os.path.join(target, name), columns, fmt)
+        parts.append({"file": name, "rows": len(columns["YEAR"])})
+    manifest = {
+        "view": view_name,
+        "rows": rows,
+        "seed": seed,
+        "format": fmt,
+        "columns": COLUMNS,
+        "parts": parts,
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(os.path.join(target, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_view(path: str):
+    """Yield row lists of a generated view directory, chunk by chunk."""
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    for part in manifest["parts"]:
+        file = os.path.join(path, part["file"])
+        if manifest["format"] == "parquet":
+            table = pq.read_table(file)
+            yield [list(row) for row in zip(*(table.column(name).to_pylist() for name in COLUMNS))]
+            continue
+        with open(file, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader)
+            yield [[value if value != "" else None for value in row] for row in reader]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic report-view data for scaling tests.")
+    parser.add_argument("--out", required=True, help="Output directory (one subdirectory per view).")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--scale", type=float, default=1.0, help="Multiple of --base-rows per view.")
+    size.add_argument("--rows", type=int, help="Exact rows per view.")
+    parser.add_argument("--base-rows", type=int, default=BASE_ROWS, help="Current rows per view (scale 1).")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--types", nargs="*", default=list(VIEW_MAP), help="Business types to generate.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.format == "parquet" and pa is None:
+        parser.error("Parquet output needs pyarrow installed.")
+    rows = args.rows or int(args.base_rows * args.scale)
+    views = list(VIEW_MAP)
+    for business_type in args.types:
+        view_name = VIEW_MAP[business_type.lower()]
+        manifest = write_view(
+            args.out, view_name, views.index(business_type.lower()), rows, args.seed, args.format, args.chunk_rows,
+        )
+        print(f"{view_name}: {manifest['rows']} rows in {len(manifest['parts'])} {args.format} file(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,30 @@
 import snowflake.connector
+from snowflake.connector.errors import InterfaceError, OperationalError
 from dotenv import load_dotenv
+from metrics import traced_connection
+from collections import deque
+from contextlib import contextmanager
+import logging
+import threading
+import time
 import os
 
 load_dotenv()
 
+# Server-side binding: "?" placeholders keep the SQL text identical across
+# filter values, which Snowflake's result cache and plan reuse rely on.
+snowflake.connector.paramstyle = "qmark"
+
+logger = logging.getLogger(__name__)
+
+
 def get_snowflake_connection():
+    # SNOWFLAKE_FAKE=1 swaps in the local stand-in so the app and the pool can
+    # be exercised without a Snowflake account.
+    if os.getenv("SNOWFLAKE_FAKE"):
+        import fake_snowflake
+        return fake_snowflake.connect()
+
     return snowflake.connector.connect(
         user=os.getenv("SNOWFLAKE_USER"),
         password=os.getenv("SNOWFLAKE_PASSWORD"),
@@ -14,3 +34,281 @@ def get_snowflake_connection():
         schema=os.getenv("SNOWFLAKE_SCHEMA"),
         role=os.getenv("SNOWFLAKE_ROLE")
     )
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class PoolClosed(Exception):
+    """Raised when checking out from a pool that has been shut down."""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived Snowflake connections.
+
+    Connections are opened lazily up to ``max_size`` and handed out LIFO, so
+    the hottest sessions are reused and surplus ones age out. A connection
+    that sat idle longer than ``max_idle`` seconds is closed instead of being
+    reused, and one idle longer than ``health_check_after`` seconds is
+    pinged before it is handed out.
+    """
+
+    def __init__(
+        self,
+        factory,
+        max_size: int = 8,
+        min_size: int = 1,
+        checkout_timeout: float = 10.0,
+        max_idle: float = 300.0,
+        health_check_after: float = 30.0,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._factory = factory
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.checkout_timeout = checkout_timeout
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, last_used) pairs, most recent on the right
+        self._size = 0  # idle + checked out + being opened
+        self._waiting = 0
+        self._closed = False
+
+        self._created = 0
+        self._recycled = 0
+        self._discarded = 0
+        self._health_failures = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def prefill(self) -> None:
+        """Open ``min_size`` connections up front so first requests skip the handshake."""
+        opened = []
+        try:
+            while self._size < self.min_size:
+                opened.append(self.acquire())
+        finally:
+            for conn in opened:
+                self.release(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            _close_quietly(conn)
+
+    # -- checkout / return -------------------------------------------------
+
+    def acquire(self, timeout: float = None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            expired = []
+            conn = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosed("Connection pool is closed.")
+                    expired.extend(self._pop_expired())
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No Snowflake connection available within {timeout:.1f}s "
+                            f"(pool size {self.max_size})."
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            for stale in expired:
+                _close_quietly(stale)
+
+            if create:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+                    self._checkouts += 1
+                    self._wait_seconds += time.monotonic() - started
+                return conn
+
+            if time.monotonic() - last_used > self.health_check_after and not _is_healthy(conn):
+                with self._cond:
+                    self._health_failures += 1
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._checkouts += 1
+                self._wait_seconds += time.monotonic() - started
+            return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        if discard or self._closed or _is_closed(conn):
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (OperationalError, InterfaceError):
+            # Network / session level failure: the connection can't be trusted.
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    # -- metrics -----------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "waiting": self._waiting,
+                "created": self._created,
+                "recycled": self._recycled,
+                "discarded": self._discarded,
+                "health_check_failures": self._health_failures,
+                "checkouts": self._checkouts,
+                "checkout_timeouts": self._timeouts,
+                "avg_checkout_wait_ms": round(
+                    1000 * self._wait_seconds / self._checkouts, 3
+                ) if self._checkouts else 0.0,
+            }
+
+    # -- internals ---------------------------------------------------------
+
+    def _pop_expired(self) -> list:
+        # Oldest entries sit on the left; caller holds the lock and closes them.
+        expired = []
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._recycled += 1
+            expired.append(conn)
+        if expired:
+            self._cond.notify(len(expired))
+        return expired
+
+    def _discard(self, conn) -> None:
+        _close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+
+def _is_closed(conn) -> bool:
+    try:
+        return conn.is_closed()
+    except Exception:
+        return True
+
+
+def _is_healthy(conn) -> bool:
+    if _is_closed(conn):
+        return False
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        logger.debug("Ignoring error while closing pooled connection", exc_info=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(factory=None) -> ConnectionPool:
+    """Create the process-wide pool from SNOWFLAKE_POOL_* settings (called at app startup)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                factory or get_snowflake_connection,
+                max_size=int(os.getenv("SNOWFLAKE_POOL_SIZE", "8")),
+                min_size=int(os.getenv("SNOWFLAKE_POOL_MIN_SIZE", "1")),
+                checkout_timeout=float(os.getenv("SNOWFLAKE_POOL_TIMEOUT", "10")),
+                max_idle=float(os.getenv("SNOWFLAKE_POOL_MAX_IDLE", "300")),
+                health_check_after=float(os.getenv("SNOWFLAKE_POOL_HEALTH_CHECK_AFTER", "30")),
+            )
+        pool = _pool
+    try:
+        pool.prefill()
+    except Exception as e:
+        # Startup shouldn't fail because the warehouse is briefly unreachable;
+        # connections are opened on demand instead.
+        logger.warning("Could not prefill Snowflake pool: %s", e)
+    return pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def get_pool() -> ConnectionPool:
+    if _pool is None:
+        return init_pool()
+    return _pool
+
+
+def pooled_connection():
+    """Borrow a connection from the shared pool: ``with pooled_connection() as conn:``."""
+    return traced_connection(get_pool())
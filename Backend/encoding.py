@@ -0,0 +1,245 @@
+"""
+Compact encodings of the insight responses.
+
+Handlers return lists of row dicts, so most of a city-level JSON payload is
+the same key names over and over. Three opt-ins cut that down:
+
+* ``?shape=columnar`` turns every list of same-keyed row dicts into one dict
+  of column lists, ``{"year": [...], "opened": [...]}``.
+* ``Accept: application/msgpack`` answers in MessagePack. It needs the
+  optional ``msgpack`` package; without it the answer stays JSON.
+* ``Accept-Encoding: br`` or ``gzip`` compresses bodies of at least
+  ``COMPRESS_MIN_BYTES``, streams included. Brotli needs the optional
+  ``brotli`` package.
+
+JSON is written with ``orjson`` when it is installed and with the standard
+encoder otherwise. Either way the output matches FastAPI's: Decimals become
+numbers and dates become ISO strings.
+"""
+
+from decimal import Decimal
+import datetime
+import json
+import os
+import zlib
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # the standard encoder is the fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack output is optional
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MSGPACK = "application/msgpack"
+
+SHAPES = ("rows", "columnar")
+
+# Accept header media type -> format
+ACCEPTED = {
+    "application/json": "json",
+    MSGPACK: "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+}
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Dynamic responses are compressed per request; higher qualities cost far
+# more CPU for little gain.
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def negotiate(accept: str = None, shape: str = None):
+    """``(format, shape)`` of a response, from the Accept header and ``?shape=``."""
+    shape = (shape or "rows").lower()
+    if shape not in SHAPES:
+        raise HTTPException(status_code=400, detail="Unsupported shape; use rows or columnar.")
+    fmt = "json"
+    for part in (accept or "").split(","):
+        media_type = part.split(";", 1)[0].strip().lower()
+        if media_type in ACCEPTED:
+            fmt = ACCEPTED[media_type]
+            break
+    if fmt == "msgpack" and msgpack is None:
+        fmt = "json"
+    return fmt, shape
+
+
+def columnar(payload):
+    """*payload* with every non-empty list of same-keyed dicts turned into a dict of lists."""
+    if isinstance(payload, dict):
+        return {key: columnar(value) for key, value in payload.items()}
+    if isinstance(payload, list):
+        if payload and all(isinstance(row, dict) for row in payload):
+            keys = list(payload[0])
+            if all(len(row) == len(keys) and all(key in row for key in keys) for row in payload):
+                return {key: columnar([row[key] for row in payload]) for key in keys}
+        return [columnar(value) for value in payload]
+    return payload
+
+
+def render(payload, fmt: str = "json", shape: str = "rows") -> Response:
+    """A response with *payload* encoded as *fmt* in *shape*."""
+    if shape == "columnar":
+        payload = columnar(payload)
+    if fmt == "msgpack":
+        return Response(msgpack.packb(payload, default=_plain, use_bin_type=True), media_type=MSGPACK)
+    return Response(dumps(payload), media_type="application/json")
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_plain, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        payload, default=_plain, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _plain(value):
+    # What FastAPI's jsonable_encoder does with the values handlers return
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if hasattr(value, "item"):  # NumPy scalars
+        return value.item()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+# -- Compression -------------------------------------------------------------
+
+
+def accepted_coding(accept_encoding: str):
+    """``br``, ``gzip`` or None, by the client's preference, brotli on ties."""
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding] = q
+    best = None
+    for coding in supported:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+class _Compressor:
+    def __init__(self, coding: str):
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flushed, so a streamed chunk reaches the client as soon as it is sent
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Compresses response bodies with brotli or gzip, as the client accepts."""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = accepted_coding(Headers(scope=scope).get("accept-encoding"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held until the first body chunk shows how large the body is
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is not None:
+                await send({**message, "body": compressor.chunk(body) if more else compressor.finish(body)})
+                return
+
+            headers = MutableHeaders(scope=start)
+            if not _compressible(start["status"], headers):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if not more and len(body) < self.minimum_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            compressor = _Compressor(coding)
+            headers["Content-Encoding"] = coding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Same content as the identity response, different bytes
+                headers["ETag"] = "W/" + etag
+            if more:
+                del headers["Content-Length"]
+                body = compressor.chunk(body)
+            else:
+                body = compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _compressible(status: int, headers) -> bool:
+    if status < 200 or status in (204, 304) or "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return not content_type.startswith(("image/", "video/", "audio/", "application/zip", "application/gzip"))
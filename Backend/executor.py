@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import os
+
+from metrics import span
+
+
+class QueueTimeout(Exception):
+    """Raised when a request waited too long for a query slot."""
+
+
+class QueryExecutor:
+    """
+    Runs blocking Snowflake work off the event loop.
+
+    Handlers are dispatched to a dedicated, fixed-size thread pool instead of
+    Starlette's shared one, so requests that are waiting for a slot are just
+    suspended coroutines rather than parked threads. Each endpoint also has
+    its own concurrency limit so a burst of slow queries on one route can't
+    take every worker and starve the cheap ones.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        endpoint_limit: int = None,
+        endpoint_limits: dict = None,
+        queue_timeout: float = 30.0,
+    ):
+        self.max_workers = max_workers
+        self.endpoint_limit = endpoint_limit or max(1, max_workers // 2)
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.queue_timeout = queue_timeout
+        self._pool = None
+        self._semaphores = {}
+        self._in_flight = {}
+        self._queued = {}
+        self._completed = {}
+        self._rejected = {}
+
+    def start(self) -> None:
+        # Semaphores bind to the running loop, so they are rebuilt per startup.
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="query")
+        self._semaphores = {}
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def run(self, endpoint: str, fn, *args, **kwargs):
+        if self._pool is None:
+            self.start()
+
+        semaphore = self._semaphore(endpoint)
+        self._queued[endpoint] = self._queued.get(endpoint, 0) + 1
+        try:
+            with span("queue"):
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected[endpoint] = self._rejected.get(endpoint, 0) + 1
+            raise QueueTimeout(f"Timed out waiting for a query slot on {endpoint}.")
+        finally:
+            self._queued[endpoint] -= 1
+
+        self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+        try:
+            loop = asyncio.get_running_loop()
+            ctx = contextvars.copy_context()
+            call = functools.partial(ctx.run, fn, *args, **kwargs)
+            return await loop.run_in_executor(self._pool, call)
+        finally:
+            self._in_flight[endpoint] -= 1
+            self._completed[endpoint] = self._completed.get(endpoint, 0) + 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        endpoints = sorted(set(self._queued) | set(self._in_flight))
+        return {
+            "max_workers": self.max_workers,
+            "default_endpoint_limit": self.endpoint_limit,
+            "queue_timeout_seconds": self.queue_timeout,
+            "endpoints": {
+                name: {
+                    "limit": self._limit(name),
+                    "in_flight": self._in_flight.get(name, 0),
+                    "queued": self._queued.get(name, 0),
+                    "completed": self._completed.get(name, 0),
+                    "rejected": self._rejected.get(name, 0),
+                }
+                for name in endpoints
+            },
+        }
+
+    def _limit(self, endpoint: str) -> int:
+        return min(self.endpoint_limits.get(endpoint, self.endpoint_limit), self.max_workers)
+
+    def _semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(endpoint)
+        if semaphore is None:
+            semaphore = self._semaphores[endpoint] = asyncio.Semaphore(self._limit(endpoint))
+        return semaphore
+
+
+def _parse_limits(spec: str) -> dict:
+    # "policies-by-year=2,revenue-by-type-chart=2"
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+_workers = int(os.getenv("QUERY_WORKERS", os.getenv("SNOWFLAKE_POOL_SIZE", "8")))
+
+query_executor = QueryExecutor(
+    max_workers=_workers,
+    endpoint_limit=int(os.getenv("QUERY_ENDPOINT_CONCURRENCY", "0")) or None,
+    endpoint_limits=_parse_limits(os.getenv("QUERY_ENDPOINT_LIMITS", "")),
+    queue_timeout=float(os.getenv("QUERY_QUEUE_TIMEOUT", "30")),
+)
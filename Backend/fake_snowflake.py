@@ -0,0 +1,145 @@
+"""
+Local stand-in for ``snowflake.connector`` used to exercise the connection
+pool without a Snowflake account.
+
+Connections pay a configurable handshake latency on ``connect()`` and every
+``execute()`` sleeps for a configurable query latency, which is enough to see
+how the pool behaves under concurrency. Queries return no rows.
+
+Enable it for the app with ``SNOWFLAKE_FAKE=1``, or run this module directly
+for a pool load test::
+
+    python fake_snowflake.py --threads 64 --requests 2000 --pool-size 8
+"""
+
+import argparse
+import itertools
+import os
+import threading
+import time
+
+_ids = itertools.count(1)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.sfqid = None
+        self._closed = False
+
+    def execute(self, query, params=None):
+        if self._closed or self.connection.is_closed():
+            raise RuntimeError("Cursor is closed.")
+        time.sleep(self.connection.query_latency)
+        self.sfqid = f"fake-{self.connection.session_id}-{next(_ids)}"
+        return self
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def fetchmany(self, size=None):
+        return []
+
+    def close(self):
+        self._closed = True
+
+
+class FakeConnection:
+    def __init__(self, connect_latency: float = 0.25, query_latency: float = 0.02):
+        time.sleep(connect_latency)
+        self.session_id = next(_ids)
+        self.query_latency = query_latency
+        self._closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+
+
+def connect(**kwargs):
+    return FakeConnection(
+        connect_latency=float(os.getenv("FAKE_SNOWFLAKE_CONNECT_MS", "250")) / 1000,
+        query_latency=float(os.getenv("FAKE_SNOWFLAKE_QUERY_MS", "20")) / 1000,
+    )
+
+
+def _run(label, threads, requests, borrow):
+    latencies = []
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def worker():
+        while next(counter) < requests:
+            started = time.perf_counter()
+            borrow()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    pool_threads = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool_threads:
+        t.start()
+    for t in pool_threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda p: 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    print(
+        f"{label:<18} {len(latencies)} requests in {wall:.2f}s "
+        f"({len(latencies) / wall:.0f} req/s)  "
+        f"p50={pct(0.50):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms"
+    )
+
+
+def main():
+    from db import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Load-test the Snowflake connection pool against a fake connector.")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--connect-ms", type=float, default=250)
+    parser.add_argument("--query-ms", type=float, default=20)
+    parser.add_argument("--skip-unpooled", action="store_true", help="Only run the pooled scenario.")
+    args = parser.parse_args()
+
+    def factory():
+        return FakeConnection(args.connect_ms / 1000, args.query_ms / 1000)
+
+    def query(conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+
+    if not args.skip_unpooled:
+        def unpooled():
+            conn = factory()
+            query(conn)
+            conn.close()
+        _run("connect-per-request", args.threads, args.requests, unpooled)
+
+    pool = ConnectionPool(factory, max_size=args.pool_size, min_size=args.pool_size, checkout_timeout=60)
+    pool.prefill()
+
+    def pooled():
+        with pool.connection() as conn:
+            query(conn)
+
+    _run("pooled", args.threads, args.requests, pooled)
+    print("pool stats:", pool.stats())
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
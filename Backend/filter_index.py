@@ -0,0 +1,187 @@
+"""
+In-memory index of the filter dimensions of each report view.
+
+An index holds every distinct (PROVINCE, CITY_NAME, YEAR, POLICY_TYPE)
+combination of a view as a sorted int32 code matrix, plus one sorted value
+list per dimension (NULL last, as Snowflake orders them). Dependent dropdowns
+("cities in Ontario with data in 2022") are a mask over that matrix, so the
+filter panel never reaches the warehouse once the index is built.
+
+Indexes come from the rollup cube or snapshot when one is loaded, otherwise
+from one ``SELECT DISTINCT`` per view, and are rebuilt in the background.
+"""
+
+import datetime
+import logging
+import threading
+
+import numpy as np
+
+from db import pooled_connection
+from queries import build_query
+from rollups import rollup_store
+from snapshot import snapshot_store
+from versions import view_versions
+
+logger = logging.getLogger(__name__)
+
+# Response key -> view column
+DIMENSIONS = {
+    "provinces": "PROVINCE",
+    "cities": "CITY_NAME",
+    "years": "YEAR",
+    "policy_types": "POLICY_TYPE",
+}
+
+# Endpoint filter -> response key of the dimension it restricts
+FILTERS = {"province": "provinces", "city": "cities", "year": "years", "policy_type": "policy_types"}
+
+
+class FilterIndex:
+    """Distinct filter-dimension combinations of one view."""
+
+    def __init__(self, view_name: str, rows, source: str, version: str = None):
+        self.view_name = view_name
+        self.source = source
+        self.version = version
+        self.built_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        rows = list(rows)
+        self.values = {}
+        self._lookups = {}
+        codes = []
+        for j, key in enumerate(DIMENSIONS):
+            column = [row[j] for row in rows]
+            values = sorted({v for v in column if v is not None}) + ([None] if None in column else [])
+            lookup = {v: code for code, v in enumerate(values)}
+            self.values[key] = values
+            self._lookups[key] = lookup
+            codes.append(np.fromiter((lookup[v] for v in column), dtype=np.int32, count=len(column)))
+        combos = np.stack(codes, axis=1) if rows else np.empty((0, len(DIMENSIONS)), dtype=np.int32)
+        self.combos = np.unique(combos, axis=0)
+
+        # province -> city -> years with data, for building whole cascades client-side
+        self.hierarchy = {}
+        provinces, cities, years = self.values["provinces"], self.values["cities"], self.values["years"]
+        for p, c, y in np.unique(self.combos[:, :3], axis=0).tolist():
+            if provinces[p] is None or cities[c] is None:
+                continue
+            city_years = self.hierarchy.setdefault(provinces[p], {}).setdefault(cities[c], [])
+            if years[y] is not None:
+                city_years.append(years[y])
+
+    def options(self, **filters) -> dict:
+        """
+        Values of every dimension, each narrowed by the *other* selected
+        filters, so the dropdown being edited keeps all its choices.
+        """
+        masks = {}
+        for name, value in filters.items():
+            if value is None or value == "":
+                continue
+            key = FILTERS[name]
+            code = self._lookups[key].get(value, -1)  # -1 matches no combination
+            masks[key] = self.combos[:, list(DIMENSIONS).index(key)] == code
+
+        result = {}
+        for j, key in enumerate(DIMENSIONS):
+            mask = np.ones(len(self.combos), dtype=bool)
+            for other, other_mask in masks.items():
+                if other != key:
+                    mask &= other_mask
+            codes = np.unique(self.combos[mask, j])
+            result[key] = [self.values[key][code] for code in codes.tolist()]
+        return result
+
+
+class FilterIndexStore:
+    """Filter indexes per view name, built on first use and refreshed in the background."""
+
+    def __init__(self):
+        self.interval = None
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, view_name: str) -> FilterIndex:
+        index = self._indexes.get(view_name)
+        if index is not None and index.version == view_versions.version(view_name):
+            return index
+        return self.refresh(view_name)
+
+    def refresh(self, view_name: str) -> FilterIndex:
+        with self._lock:
+            # Read before loading, so a change during the load is caught next time
+            version = view_versions.version(view_name)
+            rows, source = _load(view_name)
+            index = FilterIndex(view_name, rows, source, version)
+            self._indexes[view_name] = index
+            return index
+
+    def invalidate(self, view_name: str) -> None:
+        self._indexes.pop(view_name, None)
+
+    def start(self, views, interval: float) -> None:
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(list(views),), name="filter-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, views) -> None:
+        while not self._stop.is_set():
+            for view_name in views:
+                if self._stop.is_set():
+                    return
+                try:
+                    self.refresh(view_name)
+                except Exception as e:
+                    logger.warning("Could not build filter index for %s: %s", view_name, e)
+            self._stop.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "views": {
+                name: {
+                    "source": index.source,
+                    "built_at": index.built_at,
+                    "version": index.version,
+                    "combinations": len(index.combos),
+                }
+                for name, index in sorted(self._indexes.items())
+            },
+        }
+
+
+def _load(view_name: str):
+    keys = list(DIMENSIONS.values())
+    cube = rollup_store.get(view_name)
+    snapshot = snapshot_store.get(view_name)
+    if cube is not None:
+        table, source = cube.base, "rollup"
+    elif snapshot is not None and snapshot.is_integral("YEAR"):
+        table, source = snapshot, "snapshot"
+    else:
+        # Views without a local copy, or with NULL years, go to Snowflake
+        table, source = None, "snowflake"
+    if table is not None:
+        groups = table.group_by(keys, table.select())
+        return list(zip(*(groups.key(k) for k in keys))), source
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        query = build_query("filter-index", view_name)
+        cursor.execute(query.sql, query.params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows, "snowflake"
+
+
+filter_indexes = FilterIndexStore()
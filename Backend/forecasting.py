@@ -0,0 +1,247 @@
+"""
+Yearly-openings forecasts for every city of a view at once.
+
+The (province, city, year, SUM(OPENED)) series of a whole view is pulled in
+one pass (from the rollup cube or snapshot when loaded, else one grouped
+Snowflake query) and stacked into a cities x years matrix, with NaN for years
+a city has no data. Every model is then fitted for all cities together:
+
+* ``linear``: least-squares line per city, from closed-form normal
+  equations over the stacked arrays (what ``np.polyfit(years, opened, 1)``
+  gave per city before).
+* ``ses``: simple exponential smoothing; a flat forecast at the last level.
+* ``damped``: Holt's linear trend with a damped trend, so the forecast
+  levels off instead of extrapolating the trend forever.
+
+Fitted coefficients are kept per (view, model) until the view is refreshed
+or ``FORECAST_TTL`` seconds pass, so single-city requests are lookups.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from db import pooled_connection
+from queries import build_query
+from rollups import rollup_store
+from snapshot import snapshot_store
+from versions import view_versions
+
+logger = logging.getLogger(__name__)
+
+MODELS = ("linear", "ses", "damped")
+
+# Smoothing constants for the exponential smoothing models
+LEVEL_SMOOTHING = 0.5
+TREND_SMOOTHING = 0.3
+DAMPING = 0.9
+
+MIN_POINTS = 2
+HORIZON = 3
+
+_SERIES_KEYS = ["PROVINCE", "CITY_NAME", "YEAR"]
+
+
+class Series:
+    """Opened-per-year series of every (province, city) in a view, as a matrix."""
+
+    def __init__(self, rows):
+        rows = [r for r in rows if r[2] is not None]
+        self.keys = sorted({(r[0], r[1]) for r in rows}, key=lambda k: (k[0] or "", k[1] or ""))
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.years = np.array(sorted({int(r[2]) for r in rows}), dtype=np.float64)
+        year_index = {int(year): t for t, year in enumerate(self.years.tolist())}
+
+        self.values = np.full((len(self.keys), len(self.years)), np.nan)
+        for province, city, year, opened in rows:
+            if opened is not None:
+                self.values[self.index[(province, city)], year_index[int(year)]] = float(opened)
+        self.observed = ~np.isnan(self.values)
+        self.points = self.observed.sum(axis=1)
+        # Last year with data per city (NaN for empty series)
+        last = np.where(self.observed, self.years, -np.inf).max(axis=1, initial=-np.inf)
+        self.last_year = np.where(np.isinf(last), np.nan, last)
+
+
+class Fit:
+    """One model fitted to every series of a view."""
+
+    def __init__(self, series: Series, model: str, version: str = None):
+        self.series = series
+        self.model = model
+        self.version = version
+        self.fitted_at = time.monotonic()
+        if model == "linear":
+            self.params = _fit_linear(series.years, series.values, series.observed)
+        elif model == "ses":
+            self.params = _fit_smoothing(series.values, LEVEL_SMOOTHING)
+        elif model == "damped":
+            self.params = _fit_smoothing(series.values, LEVEL_SMOOTHING, TREND_SMOOTHING, DAMPING)
+        else:
+            raise ValueError(f"Unknown forecast model {model!r}")
+
+    def predict(self, rows: np.ndarray, years: np.ndarray) -> np.ndarray:
+        """Predictions for series *rows* (indices) at *years*, shape (rows, years)."""
+        years = np.asarray(years, dtype=np.float64)[None, :]
+        if self.model == "linear":
+            slope, intercept = self.params
+            return slope[rows, None] * years + intercept[rows, None]
+        level, trend = self.params
+        if self.model == "ses":
+            return np.repeat(level[rows, None], years.shape[1], axis=1)
+        # Damped trend: level + (phi + phi^2 + ... + phi^h) * trend
+        h = np.maximum(years - self.series.last_year[rows, None], 0)
+        damped = DAMPING * (1 - DAMPING ** h) / (1 - DAMPING)
+        return level[rows, None] + damped * np.nan_to_num(trend[rows, None])
+
+    def forecast(self, province: str, city: str, target_year: int):
+        """Forecast entries for one city, or None when it has too little history."""
+        i = self.series.index.get((province, city))
+        if i is None or self.series.points[i] < MIN_POINTS:
+            return None
+        return self.forecast_rows(np.array([i]), target_year)[0]
+
+    def forecast_rows(self, rows: np.ndarray, target_year: int) -> list:
+        forecast_years = list(range(target_year, target_year + HORIZON))
+        predicted = self.predict(rows, forecast_years).tolist()
+        return [
+            [{"year": y, "predicted_openings": round(p, 2)} for y, p in zip(forecast_years, values)]
+            for values in predicted
+        ]
+
+    def forecast_all(self, target_year: int, province: str = None) -> list:
+        """Forecasts for every city with enough history, optionally in one province."""
+        keys = self.series.keys
+        rows = np.array([
+            i for i, (p, _) in enumerate(keys)
+            if self.series.points[i] >= MIN_POINTS and (not province or p == province)
+        ], dtype=np.int64)
+        if not len(rows):
+            return []
+        forecasts = self.forecast_rows(rows, target_year)
+        return [
+            {"province": keys[i][0], "city": keys[i][1], "forecast": forecast}
+            for i, forecast in zip(rows.tolist(), forecasts)
+        ]
+
+
+class ForecastEngine:
+    """Fitted models per (view, model), refitted after the view changes."""
+
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._fits = {}
+        self._lock = threading.Lock()
+        self.fits = 0
+
+    def fit(self, view_name: str, model: str) -> Fit:
+        version = view_versions.version(view_name)
+        fit = self._fits.get((view_name, model))
+        if self._fresh(fit, version):
+            return fit
+        # One fit per view at a time; concurrent callers wait and reuse it.
+        with self._lock:
+            fit = self._fits.get((view_name, model))
+            if self._fresh(fit, version):
+                return fit
+            series = self._series(view_name, version)
+            fit = Fit(series, model, version)
+            self._fits[(view_name, model)] = fit
+            self.fits += 1
+            return fit
+
+    def _fresh(self, fit: Fit, version: str) -> bool:
+        return fit is not None and fit.version == version and time.monotonic() - fit.fitted_at < self.ttl
+
+    def _series(self, view_name: str, version: str) -> Series:
+        # Another model of the same view may already hold a fresh series
+        for (view, _), fit in self._fits.items():
+            if view == view_name and self._fresh(fit, version):
+                return fit.series
+        return Series(load_series(view_name))
+
+    def invalidate(self, view_name: str) -> int:
+        with self._lock:
+            stale = [key for key in self._fits if key[0] == view_name]
+            for key in stale:
+                del self._fits[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "fits": self.fits,
+            "cached": {
+                f"{view}:{model}": {
+                    "series": len(fit.series.keys),
+                    "years": len(fit.series.years),
+                    "version": fit.version,
+                }
+                for (view, model), fit in sorted(self._fits.items())
+            },
+        }
+
+
+def load_series(view_name: str) -> list:
+    """(province, city, year, opened) rows for every city of *view_name*."""
+    cube = rollup_store.get(view_name)
+    table = cube.plan(set(_SERIES_KEYS)) if cube is not None else snapshot_store.get(view_name)
+    if table is not None:
+        groups = table.group_by(_SERIES_KEYS, table.select())
+        return list(zip(*(groups.key(k) for k in _SERIES_KEYS), groups.sum("OPENED")))
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        query = build_query("forecast-series", view_name)
+        cursor.execute(query.sql, query.params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def _fit_linear(years, values, observed):
+    # Normal equations for y = slope * x + b per row, with x centred on the
+    # year axis to keep the sums well conditioned.
+    x0 = years.mean() if len(years) else 0.0
+    x = years - x0
+    w = observed.astype(np.float64)
+    y = np.where(observed, values, 0.0)
+    n = w.sum(axis=1)
+    sx, sy = w @ x, y.sum(axis=1)
+    sxx, sxy = w @ (x * x), y @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - slope * sx) / n
+    slope = np.where(n >= MIN_POINTS, slope, np.nan)
+    return slope, intercept - slope * x0
+
+
+def _fit_smoothing(values, alpha, beta=None, phi=1.0):
+    # Runs the smoothing recursions for every row at once, one year at a
+    # time; years without data leave the state untouched.
+    rows = values.shape[0]
+    level = np.full(rows, np.nan)
+    trend = np.full(rows, np.nan)
+    for y in values.T:
+        seen = ~np.isnan(y)
+        first = seen & np.isnan(level)
+        if beta is None:
+            level = np.where(first, y, np.where(seen, alpha * y + (1 - alpha) * level, level))
+            continue
+        # Second observation initialises the trend
+        second = seen & ~first & np.isnan(trend)
+        damped = phi * np.nan_to_num(trend)
+        updated = alpha * y + (1 - alpha) * (level + damped)
+        new_level = np.where(first, y, np.where(second, y, np.where(seen, updated, level)))
+        trend = np.where(
+            second, y - level,
+            np.where(seen & ~first, beta * (new_level - level) + (1 - beta) * damped, trend),
+        )
+        level = new_level
+    return level, trend
+
+
+forecast_engine = ForecastEngine(ttl=float(os.getenv("FORECAST_TTL", "3600")))
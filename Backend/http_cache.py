@@ -0,0 +1,62 @@
+"""
+HTTP validators and conditional GET for the insight endpoints.
+
+The ETag of a response is a hash of the endpoint, the data version of every
+view it reads, the version of the policy impact scale and the normalized
+query (the same key the query cache uses), so it is known before any data is touched. A request whose ``If-None-Match``
+(or, without one, ``If-Modified-Since``) still matches gets a bodiless 304
+straight away. ``Cache-Control`` lets browsers reuse a response for
+``HTTP_CACHE_MAX_AGE`` seconds and shared caches (a CDN) for
+``HTTP_CACHE_S_MAXAGE``, revalidating with the ETag afterwards.
+"""
+
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import os
+
+from impact import impact_scale
+from versions import view_versions
+
+MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+S_MAXAGE = int(os.getenv("HTTP_CACHE_S_MAXAGE", "300"))
+STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "60"))
+
+
+def cache_control() -> str:
+    if MAX_AGE <= 0 and S_MAXAGE <= 0:
+        # Cacheable, but always revalidated with the ETag
+        return "no-cache"
+    return f"public, max-age={MAX_AGE}, s-maxage={S_MAXAGE}, stale-while-revalidate={STALE_WHILE_REVALIDATE}"
+
+
+def validators(view_names, key: tuple) -> dict:
+    """``ETag``, ``Last-Modified`` and ``Cache-Control`` headers of a response for *key*."""
+    versions = [view_versions.get(view_name) for view_name in view_names]
+    digest = hashlib.sha256(
+        repr((key, [version for version, _ in versions], impact_scale.version)).encode("utf-8")
+    ).hexdigest()
+    return {
+        "ETag": f'"{digest[:32]}"',
+        "Last-Modified": format_datetime(max(changed_at for _, changed_at in versions), usegmt=True),
+        "Cache-Control": cache_control(),
+    }
+
+
+def not_modified(request_headers, headers: dict) -> bool:
+    """Whether a GET with *request_headers* can be answered 304 for a response with *headers*."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as for any GET
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or headers["ETag"] in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False
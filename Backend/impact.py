@@ -0,0 +1,100 @@
+"""
+The numeric scale of ``POLICY_IMPACT``.
+
+The report views label a policy's impact ("Very High" ... "None"); the
+insight endpoints average it on a numeric scale. That scale is defined here
+and nowhere else:
+
+* Snapshots store the score as a precomputed int8 ``IMPACT_SCORE`` column,
+  written at export time, and rollup cubes keep its sums, so local queries
+  aggregate small integers instead of comparing labels.
+* The Snowflake queries (and rollup builds from Snowflake) use the ``CASE
+  POLICY_IMPACT`` expression from ``ImpactScale.case_sql()``.
+
+Scales are registered by name. ``IMPACT_SCALES_FILE`` can add custom ones as
+JSON, ``{"name": {"label": score, ...}}``, and ``IMPACT_SCALE`` picks the
+scale in use (``default`` otherwise). Each scale has a version derived from
+its mapping. Snapshots record the version they were encoded with, and one
+written under another scale is re-encoded from its POLICY_IMPACT dictionary
+when loaded. Response ETags include the version, so clients never keep
+scores of a previous scale.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# IMPACT_SCORE value for NULL or unmapped labels
+IMPACT_NULL = -128
+
+DEFAULT_SCORES = {
+    "Very High": 3,
+    "High": 2,
+    "Moderate": 1,
+    "Low": -1,
+    "Very Low": -2,
+    "None": 0,
+}
+
+
+class ImpactScale:
+    """One label -> integer score mapping and its version."""
+
+    def __init__(self, name: str, scores: dict):
+        for label, score in scores.items():
+            if not isinstance(score, int) or isinstance(score, bool) or not IMPACT_NULL < score <= 127:
+                raise ValueError(f"Impact scale {name!r}: score of {label!r} must be an integer from -127 to 127")
+        self.name = name
+        self.scores = dict(scores)
+        digest = hashlib.sha1(json.dumps(sorted(self.scores.items())).encode("utf-8")).hexdigest()
+        self.version = f"{name}-{digest[:10]}"
+
+    def case_sql(self, column: str = "POLICY_IMPACT") -> str:
+        """The SQL expression mapping *column* to its score (NULL when unmapped)."""
+        branches = " ".join(
+            f"WHEN '{label.replace(chr(39), chr(39) * 2)}' THEN {score}" for label, score in self.scores.items()
+        )
+        return f"CASE {column} {branches} ELSE NULL END"
+
+    def lookup(self, dictionary: list) -> np.ndarray:
+        """int8 scores of a string column's *dictionary*, plus a trailing ``IMPACT_NULL`` for code -1."""
+        return np.array([self.scores.get(label, IMPACT_NULL) for label in dictionary] + [IMPACT_NULL], dtype=np.int8)
+
+    def encode(self, labels) -> np.ndarray:
+        """int8 scores of a list of labels."""
+        return np.fromiter(
+            (self.scores.get(label, IMPACT_NULL) if label is not None else IMPACT_NULL for label in labels),
+            dtype=np.int8,
+            count=len(labels),
+        )
+
+    def describe(self) -> dict:
+        return {"name": self.name, "version": self.version, "scores": self.scores}
+
+
+SCALES = {"default": ImpactScale("default", DEFAULT_SCORES)}
+
+
+def register(name: str, scores: dict) -> ImpactScale:
+    scale = ImpactScale(name, scores)
+    SCALES[name] = scale
+    return scale
+
+
+def load_scales(path: str) -> list:
+    """Register the scales in the JSON file at *path*; returns their names."""
+    with open(path, encoding="utf-8") as fh:
+        scales = json.load(fh)
+    return [register(name, scores).name for name, scores in scales.items()]
+
+
+if os.getenv("IMPACT_SCALES_FILE"):
+    load_scales(os.environ["IMPACT_SCALES_FILE"])
+
+_selected = os.getenv("IMPACT_SCALE", "default")
+if _selected not in SCALES:
+    raise ValueError(f"Unknown IMPACT_SCALE {_selected!r}; registered scales: {', '.join(SCALES)}")
+
+impact_scale = SCALES[_selected]
@@ -0,0 +1,58 @@
+"""
+In-process GET requests against the ASGI app.
+
+The warm-up and the benchmark both drive the app through its full
+middleware and handler stack without a server or sockets; this is the one
+request builder they share.
+"""
+
+import asyncio
+from urllib.parse import urlencode
+
+
+async def call(app, path: str, params: dict, host: str = "localhost", extra: dict = None):
+    """
+    GET *path* on the ASGI *app* in-process; returns (status, body size in bytes).
+
+    *extra* is merged into the ASGI scope, for markers no network client can set.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(params).encode(),
+        "root_path": "",
+        "headers": [(b"host", host.encode())],
+        "client": ("127.0.0.1", 0),
+        "server": (host, 80),
+        **(extra or {}),
+    }
+    done = asyncio.Event()
+    sent = False
+    status = None
+    size = 0
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        done.set()
+    return status, size
@@ -0,0 +1,248 @@
+"""
+Snapshot-backed implementations of the insight endpoints.
+
+Each function mirrors the SQL of the handler with the same endpoint name in
+``main.py`` and returns the same payload, computed with vectorized group-bys
+over a ``snapshot.ViewSnapshot``. ``insight_endpoint`` dispatches here when a
+snapshot of the requested view is loaded.
+"""
+
+import numpy as np
+
+LOCAL_QUERIES = {}
+
+
+def local_query(name: str):
+    def register(fn):
+        LOCAL_QUERIES[name] = fn
+        return fn
+    return register
+
+
+def _order(values, *then, descending=False):
+    # SQL ordering: NULLs sort above every value (last ASC, first DESC).
+    # Further columns in *then* break ties, as in ORDER BY a, b.
+    columns = (values,) + then
+    ranked = sorted(
+        range(len(values)),
+        key=lambda i: tuple((c[i] is None, c[i] if c[i] is not None else 0) for c in columns),
+    )
+    return ranked[::-1] if descending else ranked
+
+
+@local_query("open-close-trends")
+def open_close_trends(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["YEAR"], snap.select(province=province, city=city, year=year))
+    years, opened, closed = groups.key("YEAR"), groups.sum("OPENED"), groups.sum("CLOSED")
+    return {"data": [{"year": years[i], "opened": opened[i], "closed": closed[i]} for i in _order(years)]}
+
+
+@local_query("footfall-by-city")
+def footfall_by_city(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["CITY_NAME", "YEAR"], snap.select(province=province, city=city, year=year))
+    cities, years, footfall = groups.key("CITY_NAME"), groups.key("YEAR"), groups.mean("CONSUMER_FOOTFALL")
+    top = _order(footfall, descending=True)[:10]
+    if year:
+        return {"data": [{"city": cities[i], "footfall": footfall[i]} for i in top]}
+    return {"data": [{"city": cities[i], "year": years[i], "footfall": footfall[i]} for i in top]}
+
+
+@local_query("wage-trends")
+def wage_trends(snap, type, province=None, city=None, year=None):
+    rows = snap.select(province=province, city=city, year=year)
+    if year:
+        groups = snap.group_by(["CITY_NAME"], rows)
+        cities, wages = groups.key("CITY_NAME"), groups.mean("MEDIAN_WAGE_CAD")
+        return {"data": [{"city": cities[i], "median_wage": wages[i]} for i in _order(cities)]}
+    groups = snap.group_by(["YEAR"], rows)
+    years, wages = groups.key("YEAR"), groups.mean("MEDIAN_WAGE_CAD")
+    return {"data": [{"year": years[i], "median_wage": wages[i]} for i in _order(years)]}
+
+
+@local_query("revenue-by-type-kpi")
+def revenue_by_type_kpi(snap, type, province=None, city=None, year=None):
+    total = snap.group_by([], snap.select(province=province, city=city, year=year))
+    return {"data": [{
+        "max_rev_cad": total.max("REVENUE_CAD")[0],
+        "min_rev_cad": total.min("REVENUE_CAD")[0],
+        "avg_rev_cad": total.mean("REVENUE_CAD")[0],
+        "years": total.count_distinct("YEAR")[0],
+    }]}
+
+
+@local_query("revenue-by-type-chart")
+def revenue_by_type_chart(snap, type, province=None, city=None):
+    rows = snap.select(province=province, city=city)
+    cities = np.asarray(snap.column("CITY_NAME"))[rows]
+    revenue = np.asarray(snap.column("REVENUE_CAD"), dtype=np.float64)[rows]
+    # Per city, the row with the highest and the lowest revenue; NULL revenue
+    # sorts highest, as with ROW_NUMBER() ... ORDER BY REVENUE_CAD DESC
+    order = np.lexsort((np.nan_to_num(revenue, nan=np.inf), cities))
+    boundaries = np.flatnonzero(np.diff(cities[order])) + 1
+    firsts = rows[order[np.r_[0, boundaries]]] if len(rows) else rows
+    lasts = rows[order[np.r_[boundaries - 1, len(order) - 1]]] if len(rows) else rows
+
+    groups = snap.group_by(["CITY_NAME"], rows)
+    averages = groups.mean("REVENUE_CAD")
+    years = snap.column("YEAR")
+    revenue_all = snap.column("REVENUE_CAD")
+    impacts = snap.decode("POLICY_IMPACT", np.asarray(snap.column("POLICY_IMPACT"))[np.r_[lasts, firsts]])
+
+    results = []
+    for i, (hi, lo) in enumerate(zip(lasts.tolist(), firsts.tolist())):
+        results.append({
+            "city": groups.key("CITY_NAME")[i],
+            "max_year": int(years[hi]),
+            "max_revenue": _value(revenue_all[hi]),
+            "max_policy_impact": impacts[i],
+            "min_year": int(years[lo]),
+            "min_revenue": _value(revenue_all[lo]),
+            "min_policy_impact": impacts[len(lasts) + i],
+            "average_revenue": averages[i],
+        })
+    results.sort(key=lambda r: (r["average_revenue"] is None, r["average_revenue"] or 0))
+    return {"business_type": type.lower(), "data": results[:10]}
+
+
+@local_query("policy-impact-trend")
+def policy_impact_trend(snap, type, province=None, city=None, year=None, policy_type=None):
+    groups = snap.group_by(
+        ["YEAR", "POLICY_TYPE"],
+        snap.select(province=province, city=city, year=year, policy_type=policy_type),
+    )
+    years, types, impact = groups.key("YEAR"), groups.key("POLICY_TYPE"), groups.mean("IMPACT_SCORE")
+    return {"data": [
+        {"year": years[i], "policy_typr": types[i], "average_impact": impact[i]}
+        for i in _order(years, types)
+    ]}
+
+
+@local_query("cost-breakdown")
+def cost_breakdown(snap, type, province=None, city=None, year=None):
+    total = snap.group_by([], snap.select(province=province, city=city, year=year))
+    values = {
+        "average_rent": total.mean("RENT_COST_CAD")[0],
+        "average_utility": total.mean("UTILITY_COST_CAD_PER_YR")[0],
+        "max_rent": total.max("RENT_COST_CAD")[0],
+        "min_rent": total.min("RENT_COST_CAD")[0],
+        "max_utility": total.max("UTILITY_COST_CAD_PER_YR")[0],
+        "min_utility": total.min("UTILITY_COST_CAD_PER_YR")[0],
+    }
+    return {"data": {name: value if value is not None else 0 for name, value in values.items()}}
+
+
+@local_query("business-population")
+def business_population(snap, type, year=None):
+    groups = snap.group_by(["PROVINCE"], snap.select(year=year))
+    provinces, totals = groups.key("PROVINCE"), groups.sum("TOTAL_SALONS")
+    return {"data": [{"province": provinces[i], "total_businesses": totals[i]} for i in _order(provinces)]}
+
+
+@local_query("business-count")
+def business_count(snap, type, province=None, city=None, year=None):
+    total = snap.group_by([], snap.select(province=province, city=city, year=year))
+    count = total.mean("TOTAL_SALONS")[0]
+    return {"data": {"total_count": count if count is not None else 0}}
+
+
+@local_query("policy-distribution")
+def policy_distribution(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["POLICY_TYPE"], snap.select(province=province, city=city, year=year))
+    types, counts, distinct = groups.key("POLICY_TYPE"), groups.count().tolist(), groups.count_distinct("POLICY_TYPE")
+    return {"data": [
+        {"policy_type": types[i], "count": counts[i], "dist_count": distinct[i]}
+        for i in _order(counts, descending=True)
+    ]}
+
+
+@local_query("city-growth-rate")
+def city_growth_rate(snap, type, province=None, min_year=None, max_year=None):
+    groups = snap.group_by(["CITY_NAME", "YEAR"], snap.select(province=province, min_year=min_year, max_year=max_year))
+    cities, opened = groups.key("CITY_NAME"), groups.sum("OPENED")
+
+    # np.unique sorts by (city, year), so each city's first/last year are adjacent
+    growth_result = []
+    start = 0
+    for i in range(1, groups.size + 1):
+        if i < groups.size and cities[i] == cities[start]:
+            continue
+        if i - start >= 2:
+            opened_start, opened_end = opened[start], opened[i - 1]
+            if opened_start:
+                growth_rate = ((opened_end - opened_start) / opened_start) * 100
+                growth_result.append({"city": cities[start], "growth_rate": round(growth_rate, 2)})
+        start = i
+    return {"data": growth_result}
+
+
+@local_query("policy-impact-by-province")
+def policy_impact_heatmap(snap, type, year=None):
+    groups = snap.group_by(["PROVINCE"], snap.select(year=year))
+    provinces, impact = groups.key("PROVINCE"), groups.mean("IMPACT_SCORE")
+    return {"data": [{"province": provinces[i], "average_impact": impact[i]} for i in _order(provinces)]}
+
+
+@local_query("failure-rate")
+def failure_rate(snap, type, province=None, city=None, year=None):
+    total = snap.group_by([], snap.select(province=province, city=city, year=year))
+    closed, opened = total.sum("CLOSED")[0], total.sum("OPENED")[0]
+    success_rate = (1 - (closed / opened)) * 100 if opened and closed is not None else None
+    return {"data": [{"success_rate": success_rate}]}
+
+
+@local_query("dashboard")
+def dashboard(snap, type, province=None, city=None, year=None):
+    filters = {"province": province, "city": city, "year": year}
+    return {"data": {
+        "business_count": business_count(snap, type, **filters)["data"],
+        "revenue_by_type_kpi": revenue_by_type_kpi(snap, type, **filters)["data"],
+        "wage_trends": wage_trends(snap, type, **filters)["data"],
+        "failure_rate": failure_rate(snap, type, **filters)["data"],
+        "open_close_trends": open_close_trends(snap, type, **filters)["data"],
+        "footfall_by_city": footfall_by_city(snap, type, **filters)["data"],
+    }}
+
+
+@local_query("policy_rent_impact")
+def policy_rent_impact(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["YEAR", "POLICY_TYPE"], snap.select(province=province, city=city, year=year))
+    years, types = groups.key("YEAR"), groups.key("POLICY_TYPE")
+    rent, impact = groups.mean("RENT_COST_CAD"), groups.mean("IMPACT_SCORE")
+    return {"data": [
+        {"year": years[i], "policy_type": types[i], "avg_rent_CAD": rent[i], "avg_impact_score": impact[i]}
+        for i in _order(years, types)
+    ]}
+
+
+@local_query("policy_cost_utility_impact")
+def policy_cost_utility_impact(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["YEAR", "POLICY_TYPE"], snap.select(province=province, city=city, year=year))
+    years, types = groups.key("YEAR"), groups.key("POLICY_TYPE")
+    utility, impact = groups.mean("UTILITY_COST_CAD_PER_YR"), groups.mean("IMPACT_SCORE")
+    return {"data": [
+        {"year": years[i], "policy_type": types[i], "avg_cost_utility": utility[i], "avg_impact_score": impact[i]}
+        for i in _order(years, types)
+    ]}
+
+
+@local_query("maximum_impact_of_policy")
+def maximum_impact_of_policy(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["CITY_NAME"], snap.select(province=province, city=city, year=year))
+    cities, impact = groups.key("CITY_NAME"), groups.mean("IMPACT_SCORE")
+    return {"data": [{"city": cities[i], "impact_score": impact[i]} for i in _order(impact, descending=True)[:10]]}
+
+
+@local_query("minimum_impact_of_policy")
+def minimum_impact_of_policy(snap, type, province=None, city=None, year=None):
+    groups = snap.group_by(["CITY_NAME"], snap.select(province=province, city=city, year=year))
+    cities, impact = groups.key("CITY_NAME"), groups.mean("IMPACT_SCORE")
+    # NULL != 0 is not true in SQL, so cities without a score drop out too
+    ranked = [i for i in _order(impact) if impact[i] is not None and impact[i] != 0]
+    return {"data": [{"city": cities[i], "impact_score": impact[i]} for i in ranked[:10]]}
+
+
+def _value(value):
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
@@ -1,10 +1,109 @@
-from fastapi import FastAPI, HTTPException, Query
-from db import get_snowflake_connection
-from typing import Optional
-import numpy as np
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
+from db import init_pool, close_pool, get_pool, pooled_connection
+from cache import MISSING, cache_key, query_cache
+from executor import QueueTimeout, query_executor
+from singleflight import single_flight
+from comparison import compare_views, parse_types
+from views import VIEW_MAP
+from queries import build_query, template_stats
+from snapshot import snapshot_store
+from rollups import rollup_store
+from local_queries import LOCAL_QUERIES
+from remote_queries import run_remote
+from streaming import negotiate, stream_query
+from forecasting import MODELS, forecast_engine
+from scoring import scoring_engine
+from impact import impact_scale
+from filter_index import filter_indexes
+from http_cache import not_modified, validators
+from encoding import CompressionMiddleware, negotiate as negotiate_encoding, render
+from versions import version_probe, view_versions
+from warmup import warmup
+from metrics import TracingMiddleware, configure_slow_query_log, current_trace, render_metrics, span
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import functools
+import inspect
+import logging
+import os
+import time
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+def _view_changed(view_name):
+    # The probe versions views from their data, and warms them up once a new
+    # version is out; without it, a change seen here is a new local version.
+    _invalidate(view_name)
+    if not version_probe.running:
+        view_versions.bump(view_name)
+        warmup.schedule([view_name])
+
+
+def _version_changed(view_name):
+    _invalidate(view_name)
+    warmup.schedule([view_name])
+
+
+def _invalidate(view_name):
+    # Results are keyed on the data version, so entries of an older one are
+    # never served again; this only frees their memory.
+    query_cache.invalidate_view(view_name)
+    forecast_engine.invalidate(view_name)
+    scoring_engine.invalidate(view_name)
+    filter_indexes.invalidate(view_name)
+
+
+def _rebuild_rollups(view_name):
+    # In-place updates do not show up as new years, so rebuild the cube
+    if rollup_store.get(view_name) is not None:
+        rollup_store.refresh(view_name, full=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_slow_query_log()
+    # Memory-map local view snapshots when snapshot mode is on; views without
+    # one keep going to Snowflake.
+    if os.getenv("SNAPSHOT_DIR"):
+        loaded = snapshot_store.load(os.getenv("SNAPSHOT_DIR"), VIEW_MAP.values())
+        logger.info("Loaded snapshots: %s", ", ".join(loaded) or "none")
+    # Open the Snowflake pool once per process instead of once per request
+    init_pool()
+    query_executor.start()
+    # Keep per-view rollup cubes current in the background; the aggregate
+    # endpoints answer from them once built. 0 turns rollups off.
+    rollup_interval = float(os.getenv("ROLLUP_REFRESH_INTERVAL", "900"))
+    if rollup_interval > 0:
+        rollup_store.start(VIEW_MAP.values(), rollup_interval, on_change=_view_changed)
+    # Filter dropdowns are served from an in-memory index of each view
+    filter_interval = float(os.getenv("FILTER_INDEX_REFRESH_INTERVAL", "600"))
+    if filter_interval > 0:
+        filter_indexes.start(VIEW_MAP.values(), filter_interval)
+    # Data versions that result caches, ETags and forecasts key on. 0 turns
+    # the probe off.
+    version_interval = float(os.getenv("VERSION_PROBE_INTERVAL", "60"))
+    if version_interval > 0:
+        version_probe.start(VIEW_MAP.values(), version_interval, prepare=_rebuild_rollups, on_change=_version_changed)
+    # Replay the common requests once the first versions are in, so the
+    # caches are hot before traffic arrives. WARMUP_WAIT holds startup for it.
+    if warmup.enabled:
+        warmup.start(app, ready=version_probe.ready if version_probe.running else None)
+        warmup.schedule(VIEW_MAP.values())
+        if os.getenv("WARMUP_WAIT"):
+            await warmup.wait()
+    yield
+    await warmup.stop()
+    version_probe.stop()
+    filter_indexes.stop()
+    rollup_store.stop()
+    query_executor.shutdown()
+    close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,27 +111,303 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Snowflake-Query-Id", "ETag", "Last-Modified"],
 )
-
-VIEW_MAP = {
-    "salon": "SALON_RPT_VW",
-    "cafe": "CAFE_RPT_VW",
-    "restaurant": "RESTAURANT_RPT_VW",
-    "retail": "RETAIL_RPT_VW",
-    "pharmacy": "PHARMACY_RPT_VW"
-}
+app.add_middleware(CompressionMiddleware)
+# Outermost, so the timings cover the whole request
+app.add_middleware(TracingMiddleware)
+
+def insight_endpoint(name: str, cache: bool = True, compare: bool = True):
+    # Serve repeat (endpoint, type, filters) lookups from the query cache and
+    # run everything else on the query executor so blocking connector calls
+    # never sit on the event loop. Identical requests that miss the cache at
+    # the same time share one execution. type=all or type=a,b,c answers for
+    # several business types at once where the endpoint allows it. Responses
+    # carry an ETag of the data version and query, and a client that already
+    # has the current one gets a 304 before anything is computed. Results are
+    # encoded here, as JSON or MessagePack, in rows or columns. Invalid types
+    # fall through so the handler can reject them as before.
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(**kwargs):
+            request = kwargs.pop("request", None)
+            representation = negotiate_encoding(
+                request.headers.get("accept") if request is not None else None, kwargs.pop("shape", None),
+            )
+            trace = current_trace()
+            view_names = _view_names(kwargs["type"], compare)
+            headers = None
+            if view_names:
+                if trace is not None:
+                    trace.endpoint, trace.view = name, ",".join(sorted(view_names))
+                key = cache_key(name, ",".join(view_names), _filters(kwargs))
+                headers = validators(view_names, key + (representation,))
+                headers["Vary"] = "Accept"
+                if request is not None and not_modified(request.headers, headers):
+                    if trace is not None:
+                        trace.cache = "not-modified"
+                    return Response(status_code=304, headers=headers)
+            try:
+                result = await serve(trace, kwargs)
+            finally:
+                if trace is not None:
+                    trace.handled_at = time.perf_counter()
+            if not isinstance(result, Response):
+                result = render(result, *representation)
+            if headers is not None:
+                result.headers.update(headers)
+            return result
+
+        async def serve(trace, kwargs):
+            types = parse_types(kwargs["type"]) if compare else None
+            if types is not None:
+                return await _compare(name, fn, types, kwargs, cache)
+
+            view_name = VIEW_MAP.get(kwargs["type"].lower())
+            if not view_name:
+                return fn(**kwargs)
+
+            key = None
+            if cache:
+                key = cache_key(name, view_name, _filters(kwargs), view_versions.version(view_name))
+                result = query_cache.get(key)
+                if trace is not None:
+                    trace.cache = "miss" if result is MISSING else "hit"
+                if result is not MISSING:
+                    return result
+
+            async def execute():
+                result = await _compute(name, fn, view_name, kwargs)
+                if cache:
+                    query_cache.put(key, view_name, result)
+                return result
+
+            try:
+                # Uncached endpoints (streams, in-memory lookups) run per request
+                return await (single_flight.do(key, execute) if cache else execute())
+            except QueueTimeout as e:
+                raise HTTPException(status_code=503, detail=str(e))
+
+        # FastAPI passes the request (for the conditional and Accept headers)
+        # and the response shape alongside the handler's own parameters.
+        signature = inspect.signature(fn)
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter(
+                "shape", inspect.Parameter.KEYWORD_ONLY, annotation=Optional[str],
+                default=Query(None, description="rows (default), or columnar for one list per field"),
+            ),
+            inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+        ])
+        return wrapper
+    return decorator
+
+def _filters(kwargs):
+    return {k: v for k, v in kwargs.items() if k != "type"}
+
+def _view_names(type, compare):
+    # Views a request for *type* reads, or None if it names an unknown type
+    types = parse_types(type) if compare else None
+    view_names = [VIEW_MAP.get(t) for t in types] if types is not None else [VIEW_MAP.get(type.lower())]
+    return view_names if view_names and all(view_names) else None
+
+async def _compute(name, fn, view_name, kwargs):
+    # Answer from the coarsest covering rollup level, else the local snapshot
+    # when there is one; Snowflake otherwise, or if the local query fails for
+    # any reason.
+    table = rollup_store.plan(view_name, name, kwargs) or snapshot_store.get(view_name)
+    local = LOCAL_QUERIES.get(name)
+    if table is not None and local is not None:
+        try:
+            return await query_executor.run(name, _timed, "local", local, table, **kwargs)
+        except QueueTimeout:
+            raise
+        except Exception:
+            logger.exception("Local query %s on %s failed; falling back to Snowflake", name, view_name)
+    return await query_executor.run(name, fn, **kwargs)
+
+async def _compare(name, fn, types, kwargs, cache):
+    # Each type's payload is cached under its single-type key, so only the
+    # types missing from the cache are computed, and those together.
+    views = {business_type: VIEW_MAP.get(business_type) for business_type in types}
+    if not views or not all(views.values()):
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+    filters = _filters(kwargs)
+    keys = {t: cache_key(name, v, filters, view_versions.version(v)) for t, v in views.items()}
+
+    results = {}
+    if cache:
+        for business_type, view_name in views.items():
+            result = query_cache.get(keys[business_type])
+            if result is not MISSING:
+                results[business_type] = result
+    missing = {t: v for t, v in views.items() if t not in results}
+
+    async def execute():
+        computed = await _compute_many(name, fn, missing, kwargs)
+        if cache:
+            for business_type, result in computed.items():
+                view_name = views[business_type]
+                query_cache.put(keys[business_type], view_name, result)
+        return computed
+
+    if missing:
+        try:
+            key = (name, "compare", *(keys[t] for t in missing))
+            results.update(await single_flight.do(key, execute))
+        except QueueTimeout as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return {"types": types, "data": {business_type: results[business_type] for business_type in types}}
+
+async def _compute_many(name, fn, views, kwargs):
+    # Types with a local table are answered from it in one executor call; the
+    # rest go to Snowflake together as one UNION ALL query.
+    local = LOCAL_QUERIES.get(name)
+    tables = {}
+    if local is not None:
+        for business_type, view_name in views.items():
+            table = rollup_store.plan(view_name, name, kwargs) or snapshot_store.get(view_name)
+            if table is not None:
+                tables[business_type] = table
+
+    results = {}
+    if tables:
+        try:
+            results = await query_executor.run(name, _run_local, local, tables, kwargs)
+        except QueueTimeout:
+            raise
+        except Exception:
+            logger.exception("Local query %s failed for %s; falling back to Snowflake", name, ", ".join(tables))
+    remote = {t: v for t, v in views.items() if t not in results}
+    if remote:
+        results.update(await query_executor.run(name, compare_views, name, fn, remote, kwargs))
+    return results
+
+def _timed(phase, fn, *args, **kwargs):
+    with span(phase):
+        return fn(*args, **kwargs)
+
+def _run_local(local, tables, kwargs):
+    with span("local"):
+        return {business_type: local(table, **{**kwargs, "type": business_type}) for business_type, table in tables.items()}
 
 @app.get("/")
 def root():
     try:
-        conn = get_snowflake_connection()
-        print("Connected to Snowflake successfully!", conn)
-        conn.close()
+        with pooled_connection() as conn:
+            logger.info("Connected to Snowflake: %s", conn)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     return {"message": "FastAPI + Snowflake Connected!"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/pool-stats")
+def pool_stats():
+    return {"data": get_pool().stats()}
+
+@app.get("/api/admin/executor-stats")
+def executor_stats():
+    return {"data": {**query_executor.stats(), "single_flight": single_flight.stats()}}
+
+@app.get("/api/admin/cache/stats")
+def cache_stats():
+    return {"data": {
+        **query_cache.stats(),
+        "compiled_templates": template_stats(),
+        "forecast_fits": forecast_engine.stats(),
+        "score_tables": scoring_engine.stats(),
+        "impact_scale": impact_scale.describe(),
+    }}
+
+@app.post("/api/admin/cache/invalidate")
+def invalidate_cache(type: str = Query(..., description="Business type whose view changed")):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+    invalidated = query_cache.invalidate_view(view_name)
+    if version_probe.running:
+        # Re-probe now rather than at the next interval
+        try:
+            version_probe.probe(view_name)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    _view_changed(view_name)
+    warmup.schedule([view_name])
+    return {"view": view_name, "invalidated": invalidated, "version": view_versions.version(view_name)}
+
+@app.get("/api/admin/snapshot/stats")
+def snapshot_stats():
+    return {"data": snapshot_store.stats()}
+
+@app.post("/api/admin/snapshot/refresh")
+def refresh_snapshot(type: str = Query(..., description="Business type to re-export from Snowflake")):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+    if not snapshot_store.enabled:
+        raise HTTPException(status_code=409, detail="Snapshot mode is not enabled (set SNAPSHOT_DIR).")
+
+    try:
+        with pooled_connection() as conn:
+            snapshot = snapshot_store.refresh(conn, view_name)
+        if version_probe.running:
+            # A new export is a new version; the probe rebuilds the rollups
+            version_probe.probe(view_name)
+        else:
+            _rebuild_rollups(view_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    _view_changed(view_name)
+    return {"view": view_name, "rows": snapshot.rows, "exported_at": snapshot.manifest["exported_at"]}
+
+@app.get("/api/admin/filter-index/stats")
+def filter_index_stats():
+    return {"data": filter_indexes.stats()}
+
+@app.get("/api/admin/versions")
+def version_stats():
+    return {"data": version_probe.stats()}
+
+@app.get("/api/admin/warmup/stats")
+def warmup_stats():
+    return {"data": warmup.stats()}
+
+@app.post("/api/admin/warmup")
+def run_warmup(type: Optional[str] = Query(None, description="Business type to warm up; all when left out")):
+    if not warmup.enabled:
+        raise HTTPException(status_code=409, detail="Warm-up is off (WARMUP_CONCURRENCY=0).")
+    view_names = list(VIEW_MAP.values())
+    if type:
+        view_names = [VIEW_MAP.get(type.lower())]
+        if not view_names[0]:
+            raise HTTPException(status_code=400, detail="Invalid business type.")
+    warmup.schedule(view_names)
+    return {"data": {"scheduled": view_names}}
+
+@app.get("/api/admin/rollups/stats")
+def rollup_stats():
+    return {"data": rollup_store.stats()}
+
+@app.post("/api/admin/rollups/refresh")
+def refresh_rollups(
+    type: str = Query(..., description="Business type whose rollups to refresh"),
+    full: bool = Query(False, description="Rebuild from scratch instead of re-reading only new years"),
+):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+    try:
+        result = rollup_store.refresh(view_name, full=full)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"data": result}
+
 @app.get("/api/insights/open-close-trends")
+@insight_endpoint("open-close-trends")
 def open_close_trends(
     type: str = Query(..., description="Business type (e.g., salon, cafe, retail)"),
     province: Optional[str] = Query(None, description="Province name"),
@@ -45,44 +420,13 @@ def open_close_trends(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Build dynamic WHERE clause
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT YEAR, SUM(OPENED) AS total_opened, SUM(CLOSED) AS total_closed
-            FROM {view_name}
-            {where_clause}
-            GROUP BY YEAR
-            ORDER BY YEAR;
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [
-            {"year": row[0], "opened": row[1], "closed": row[2]}
-            for row in rows
-        ]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("open-close-trends", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/footfall-by-city")
+@insight_endpoint("footfall-by-city")
 def footfall_by_city(
     type: str = Query(..., description="Business type (e.g., salon, cafe)"),
     province: Optional[str] = Query(None),
@@ -94,53 +438,13 @@ def footfall_by_city(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Build filters
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        # Include year only if it is not specified (to return yearly trends)
-        select_fields = "CITY_NAME, AVG(CONSUMER_FOOTFALL) AS total_footfall"
-        group_by = "GROUP BY CITY_NAME, YEAR"
-
-        if not year:
-            select_fields = "CITY_NAME, YEAR, AVG(CONSUMER_FOOTFALL) AS total_footfall"
-            group_by = "GROUP BY CITY_NAME, YEAR"
-
-        query = f"""
-            SELECT {select_fields}
-            FROM {view_name}
-            {where_clause}
-            {group_by}
-            ORDER BY total_footfall DESC
-            limit 10;
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        if year:
-            result = [{"city": row[0], "footfall": row[1]} for row in rows]
-        else:
-            result = [{"city": row[0], "year": row[1], "footfall": row[2]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("footfall-by-city", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/wage-trends")
+@insight_endpoint("wage-trends")
 def wage_trends(
     type: str = Query(..., description="Business type (e.g., salon, cafe)"),
     province: Optional[str] = Query(None),
@@ -152,54 +456,13 @@ def wage_trends(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Build WHERE clause dynamically
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        # Select and group dynamically
-        if year:
-            query = f"""
-                SELECT CITY_NAME, AVG(MEDIAN_WAGE_CAD) AS median_wage
-                FROM {view_name}
-                {where_clause}
-                GROUP BY CITY_NAME
-                ORDER BY CITY_NAME;
-            """
-        else:
-            query = f"""
-                SELECT YEAR, AVG(MEDIAN_WAGE_CAD) AS median_wage
-                FROM {view_name}
-                {where_clause}
-                GROUP BY YEAR
-                ORDER BY YEAR;
-            """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        if year:
-            result = [{"city": row[0], "median_wage": row[1]} for row in rows]
-        else:
-            result = [{"year": row[0], "median_wage": row[1]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("wage-trends", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/revenue-by-type-kpi")
+@insight_endpoint("revenue-by-type-kpi")
 def revenue_by_type_kpi(
     type: str = Query(..., description="Business type (e.g., salon, cafe)"),
     province: Optional[str] = Query(None),
@@ -211,41 +474,13 @@ def revenue_by_type_kpi(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Build WHERE clause dynamically
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-
-        query = f"""
-                SELECT MAX(REVENUE_CAD) as max_rev_cad, MIN(REVENUE_CAD) as min_rev_cad, AVG(REVENUE_CAD) as avg_rev_cad, COUNT(DISTINCT YEAR) AS num_years
-                FROM {view_name}
-                {where_clause}
-                
-            """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [{"max_rev_cad": row[0], "min_rev_cad": row[1], "avg_rev_cad": row[2], "years": row[3]} for row in rows]
-        
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("revenue-by-type-kpi", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/revenue-by-type-chart")
+@insight_endpoint("revenue-by-type-chart")
 def revenue_by_type_chart(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -257,70 +492,13 @@ def revenue_by_type_chart(
         raise HTTPException(status_code=400, detail="Invalid business type.")
     
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        filters = []
-        # if year:
-        #     filters.append(f"YEAR = {year}")
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"MAX_REV.CITY_NAME = '{city}'")
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            WITH max_rev AS (
-                SELECT city_name, year AS max_year, revenue_cad AS max_rev_cad, policy_impact AS max_policy_impact 
-                FROM {view_name} 
-                QUALIFY ROW_NUMBER() OVER (PARTITION BY CITY_NAME ORDER BY REVENUE_CAD DESC) = 1
-            ),
-            min_rev AS (
-                SELECT city_name, year AS min_year, revenue_cad AS min_rev_cad, policy_impact AS min_policy_impact 
-                FROM {view_name} 
-                QUALIFY ROW_NUMBER() OVER (PARTITION BY CITY_NAME ORDER BY REVENUE_CAD ASC) = 1
-            ),
-            avg_rev AS (
-                SELECT city_name, AVG(revenue_cad) AS avg_rev_cad 
-                FROM {view_name} 
-                GROUP BY 1
-            )
-            SELECT 
-                max_rev.city_name, max_rev.max_year, max_rev.max_rev_cad, max_rev.max_policy_impact, 
-                min_rev.min_year, min_rev.min_rev_cad, min_rev.min_policy_impact, 
-                avg_rev.avg_rev_cad 
-            FROM max_rev 
-            JOIN min_rev ON max_rev.city_name = min_rev.city_name
-            JOIN avg_rev ON max_rev.city_name = avg_rev.city_name
-            {where_clause}
-            ORDER BY avg_rev.avg_rev_cad
-            LIMIT 10;
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        results = []
-        for row in rows:
-            results.append({
-                "city": row[0],
-                "max_year": row[1],
-                "max_revenue": row[2],
-                "max_policy_impact": row[3],
-                "min_year": row[4],
-                "min_revenue": row[5],
-                "min_policy_impact": row[6],
-                "average_revenue": row[7],
-            })
-
-        cursor.close()
-        conn.close()
-        return {"business_type": type.lower(), "data": results}
+        return run_remote("revenue-by-type-chart", view_name, type, province=province, city=city)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights/policy-impact-trend")
+@insight_endpoint("policy-impact-trend")
 def policy_impact_trend(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -333,54 +511,13 @@ def policy_impact_trend(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Map policy impact to numeric scale
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-        if policy_type:
-            filters.append(f"POLICY_TYPE = '{policy_type}'")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT YEAR, POLICY_TYPE, AVG({impact_case}) AS avg_impact_score
-            FROM {view_name}
-            {where_clause}
-            GROUP BY YEAR, POLICY_TYPE
-            ORDER BY YEAR, POLICY_TYPE
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        result = [{"year": row[0], "policy_typr": row[1], "average_impact": row[2]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("policy-impact-trend", view_name, type, province=province, city=city, year=year, policy_type=policy_type)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/cost-breakdown")
+@insight_endpoint("cost-breakdown")
 def cost_breakdown(
     type: str = Query(..., description="Business type (e.g., salon, cafe)"),
     province: Optional[str] = Query(None),
@@ -392,51 +529,13 @@ def cost_breakdown(
         raise HTTPException(status_code=400, detail="Invalid business type")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT
-                AVG(RENT_COST_CAD) AS avg_rent,
-                AVG(UTILITY_COST_CAD_PER_YR) AS avg_utility,
-                MAX(RENT_COST_CAD) AS max_rent,
-                MIN(RENT_COST_CAD) AS min_rent,
-                MAX(UTILITY_COST_CAD_PER_YR) AS max_utility,
-                MIN(UTILITY_COST_CAD_PER_YR) AS min_utility
-            FROM {view_name}
-            {where_clause}
-        """
-
-        cursor.execute(query)
-        row = cursor.fetchone()
-
-        result = {
-            "average_rent": row[0] if row and row[0] is not None else 0,
-            "average_utility": row[1] if row and row[1] is not None else 0,
-            "max_rent": row[2] if row and row[2] is not None else 0,
-            "min_rent": row[3] if row and row[3] is not None else 0,
-            "max_utility": row[4] if row and row[4] is not None else 0,
-            "min_utility": row[5] if row and row[5] is not None else 0
-        }
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("cost-breakdown", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights/business-population")
+@insight_endpoint("business-population")
 def business_population(
     type: str = Query(..., description="Business type (e.g., salon, cafe)"),
     year: Optional[int] = Query(None)
@@ -446,35 +545,13 @@ def business_population(
         raise HTTPException(status_code=400, detail="Invalid business type")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        filters = []
-        if year:
-            filters.append(f"YEAR = {year}")
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT PROVINCE, SUM(TOTAL_SALONS) AS total_businesses
-            FROM {view_name}
-            {where_clause}
-            GROUP BY PROVINCE
-            ORDER BY PROVINCE
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [{"province": row[0], "total_businesses": row[1]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("business-population", view_name, type, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/business-count")
+@insight_endpoint("business-count")
 def business_count(
     type: str = Query(..., description="Business type"),
     province: Optional[str] = Query(None),
@@ -486,37 +563,13 @@ def business_count(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT AVG(TOTAL_SALONS) AS total_count
-            FROM {view_name}
-            {where_clause}
-        """
-
-        cursor.execute(query)
-        row = cursor.fetchone()
-        count = row[0] if row and row[0] is not None else 0
-
-        cursor.close()
-        conn.close()
-        return {"data": {"total_count": count}}
+        return run_remote("business-count", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights/policy-distribution")
+@insight_endpoint("policy-distribution")
 def policy_distribution(
     type: str = Query(..., description="Business type"),
     province: Optional[str] = Query(None),
@@ -528,75 +581,48 @@ def policy_distribution(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT POLICY_TYPE, COUNT(*) AS count, count(distinct POLICY_TYPE)
-            FROM {view_name}
-            {where_clause}
-            GROUP BY POLICY_TYPE
-            ORDER BY count DESC
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [{"policy_type": row[0], "count": row[1], "dist_count": row[2]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("policy-distribution", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/filters/options")
-def get_filter_options(type: str = Query(..., description="Business type (e.g., salon, cafe)")):
+@insight_endpoint("filter-options", cache=False, compare=False)
+def get_filter_options(
+    type: str = Query(..., description="Business type (e.g., salon, cafe)"),
+    province: Optional[str] = Query(None, description="Only options that have data in this province"),
+    city: Optional[str] = Query(None, description="Only options that have data in this city"),
+    year: Optional[int] = Query(None, description="Only options that have data in this year"),
+    policy_type: Optional[str] = Query(None, description="Only options that have data for this policy type")
+):
     view_name = VIEW_MAP.get(type.lower())
     if not view_name:
         raise HTTPException(status_code=400, detail="Invalid business type")
 
+    # Answered from the in-memory filter index; each list is narrowed by the
+    # other selected filters for dependent dropdowns.
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        result = {}
-
-        # Fetch provinces
-        cursor.execute(f"SELECT DISTINCT PROVINCE FROM {view_name} ORDER BY PROVINCE")
-        result["provinces"] = [row[0] for row in cursor.fetchall()]
-
-        # Fetch cities
-        cursor.execute(f"SELECT DISTINCT CITY_NAME FROM {view_name} ORDER BY CITY_NAME")
-        result["cities"] = [row[0] for row in cursor.fetchall()]
-
-        # Fetch years
-        cursor.execute(f"SELECT DISTINCT YEAR FROM {view_name} ORDER BY YEAR")
-        result["years"] = [row[0] for row in cursor.fetchall()]
-
-        # Fetch policy types
-        cursor.execute(f"SELECT DISTINCT POLICY_TYPE FROM {view_name} ORDER BY POLICY_TYPE")
-        result["policy_types"] = [row[0] for row in cursor.fetchall()]
+        index = filter_indexes.get(view_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"data": index.options(province=province, city=city, year=year, policy_type=policy_type)}
 
-        cursor.close()
-        conn.close()
-        return {"data": result}
+@app.get("/api/filters/hierarchy")
+@insight_endpoint("filter-hierarchy", cache=False, compare=False)
+def get_filter_hierarchy(type: str = Query(..., description="Business type (e.g., salon, cafe)")):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type")
 
+    try:
+        index = filter_indexes.get(view_name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    # province -> city -> years with data
+    return {"data": index.hierarchy}
 
 @app.get("/api/advice/should-open")
+@insight_endpoint("should-open")
 def should_open_business(
     type: str = Query(...),
     city: str = Query(...),
@@ -608,154 +634,113 @@ def should_open_business(
         raise HTTPException(status_code=400, detail="Invalid business type")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Map policy impact values
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        # Analyze last 3 years before target year
-        analysis_years = f"{year - 3}, {year - 2}, {year - 1}"
-
-        query = f"""
-            SELECT
-                AVG(OPENED) AS avg_opened,
-                AVG(CLOSED) AS avg_closed,
-                AVG(REVENUE_CAD) AS avg_revenue,
-                AVG(RENT_COST_CAD + UTILITY_COST_CAD_PER_YR) AS avg_costs,
-                AVG({impact_case}) AS policy_score
-            FROM {view_name}
-            WHERE CITY_NAME = '{city}'
-              AND PROVINCE = '{province}'
-              AND YEAR IN ({analysis_years})
-        """
-
-        cursor.execute(query)
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if not row or all(r is None for r in row):
-            return {"recommended": False, "confidence": "low", "summary": "Insufficient data."}
-
-        avg_opened, avg_closed, avg_revenue, avg_costs, policy_score = row
-
-        # Basic logic
-        #as per algortihm the scores are getting calculated based oon the average opened or closed business, revenues, wages and policy impact
-        score = 0
-        reasons = []
-
-        if avg_opened and avg_opened > avg_closed:
-            score += 1
-            reasons.append("More businesses are opening than closing.")
-        else:
-            score -= 1
-            reasons.append("Closures are high compared to openings.")
+        # Every city is scored for every year at once, from the three years
+        # before the target year; this is a lookup into those scores
+        return scoring_engine.table(view_name).advice(type, city, province, year)
 
-        if avg_revenue and avg_costs and avg_revenue > avg_costs:
-            score += 1
-            reasons.append("Revenue consistently exceeds cost.")
-        else:
-            score -= 1
-            reasons.append("Cost exceeds or matches revenue.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if policy_score and policy_score > 0:
-            score += 1
-            reasons.append("Positive policy impact.")
-        else:
-            score -= 1
-            reasons.append("Policies impact are neutral or negative.")
-
-        recommended = score >= 1
-        confidence = "high" if score >= 2 else "medium" if score == 1 else "low"
-
-        return {
-            "recommended": recommended,
-            "confidence": confidence,
-            "summary": f"{type.title()} businesses in {city} show {confidence} potential based on historical trends.",
-            "key_metrics": {
-                "avg_opened": round(avg_opened or 0, 2),
-                "avg_closed": round(avg_closed or 0, 2),
-                "avg_revenue": round(avg_revenue or 0, 2),
-                "avg_costs": round(avg_costs or 0, 2),
-                "policy_score": round(policy_score or 0, 2)
-            },
-            "reasons": reasons
-        }
+@app.get("/api/advice/should-open/batch")
+@insight_endpoint("should-open-batch")
+def should_open_batch(
+    type: str = Query(...),
+    year: int = Query(...),
+    province: Optional[str] = Query(None, description="Score every city in this province"),
+    cities: Optional[List[str]] = Query(None, description="Cities to compare; repeat the parameter")
+):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type")
+
+    try:
+        return scoring_engine.table(view_name).batch(type, year, province, cities)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/advice/best-cities")
+@insight_endpoint("best-cities", compare=False)
+def best_cities(
+    type: str = Query(...),
+    year: Optional[int] = Query(None, description="Target year; the year after the latest data when left out"),
+    province: Optional[str] = Query(None, description="Only cities in this province"),
+    limit: int = Query(10, ge=1, le=500)
+):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+
+    try:
+        table = scoring_engine.table(view_name)
+        if year is None:
+            year = table.next_year
+        cities = table.best(type, year, province, limit) if year is not None else []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"year": year, "data": cities}
+
+# Column names and Arrow types of the policies-by-year SELECT, in order
+POLICY_FIELDS = [
+    ("policy_id", "string"),
+    ("policy_type", "string"),
+    ("policy_impact", "string"),
+    ("city", "string"),
+    ("province", "string"),
+    ("year", "int64"),
+]
+
 @app.get("/api/insights/policies-by-year")
+@insight_endpoint("policies-by-year", cache=False, compare=False)
 def policies_by_year(
     type: str = Query(..., description="Business type"),
     year: int = Query(..., description="Year"),
     province: Optional[str] = Query(None),
-    city: Optional[str] = Query(None)
+    city: Optional[str] = Query(None),
+    format: Optional[str] = Query(None, description="json (default), ndjson or arrow"),
+    accept: Optional[str] = Header(None)
 ):
     view_name = VIEW_MAP.get(type.lower())
     if not view_name:
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
+    # NDJSON / Arrow are streamed in batches instead of built up in memory
+    fmt = negotiate(format, accept)
+    if fmt != "json":
+        query = build_query("policies-by-year", view_name, year=year, province=province, city=city)
+        return stream_query("policies-by-year", fmt, query, POLICY_FIELDS, {"business_type": type})
+
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Build WHERE clause
-        filters = [f"YEAR = {year}"]
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-
-        where_clause = f"WHERE {' AND '.join(filters)}"
-
-        query = f"""
-            SELECT
-                POLICY_ID,
-                POLICY_TYPE,
-                POLICY_IMPACT,
-                CITY_NAME,
-                PROVINCE,
-                YEAR
-            FROM {view_name}
-            {where_clause}
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [
-            {
-                "policy_id": row[0],
-                "policy_type": row[1],
-                "policy_impact": row[2],
-                "city": row[3],
-                "province": row[4],
-                "year": row[5],
-                "business_type": type
-            }
-            for row in rows
-        ]
-
-        cursor.close()
-        conn.close()
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+
+            query = build_query("policies-by-year", view_name, year=year, province=province, city=city)
+
+            cursor.execute(query.sql, query.params)
+            rows = cursor.fetchall()
+
+            result = [
+                {
+                    "policy_id": row[0],
+                    "policy_type": row[1],
+                    "policy_impact": row[2],
+                    "city": row[3],
+                    "province": row[4],
+                    "year": row[5],
+                    "business_type": type
+                }
+                for row in rows
+            ]
+
+            cursor.close()
         return {"data": result}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/city-growth-rate")
+@insight_endpoint("city-growth-rate")
 def city_growth_rate(
     type: str = Query(..., description="Business type (e.g., salon, cafe)"),
     province: Optional[str] = Query(None),
@@ -767,60 +752,13 @@ def city_growth_rate(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        year_filters = []
-        if min_year:
-            year_filters.append(f"YEAR >= {min_year}")
-        if max_year:
-            year_filters.append(f"YEAR <= {max_year}")
-
-        all_filters = []
-        if province:
-            all_filters.append(f"PROVINCE = '{province}'")
-        if year_filters:
-            all_filters.append(" AND ".join(year_filters))
-
-        where_clause = f"WHERE {' AND '.join(all_filters)}" if all_filters else ""
-
-        query = f"""
-            SELECT CITY_NAME, YEAR, SUM(OPENED) AS total_opened
-            FROM {view_name}
-            {where_clause}
-            GROUP BY CITY_NAME, YEAR
-            ORDER BY CITY_NAME, YEAR
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        from collections import defaultdict
-
-        city_year_data = defaultdict(dict)
-        for city, year, opened in rows:
-            city_year_data[city][year] = opened
-
-        growth_result = []
-        for city, year_data in city_year_data.items():
-            years = sorted(year_data.keys())
-            if len(years) < 2:
-                continue
-            first, last = years[0], years[-1]
-            opened_start = year_data[first]
-            opened_end = year_data[last]
-            if opened_start == 0:
-                continue
-            growth_rate = ((opened_end - opened_start) / opened_start) * 100
-            growth_result.append({"city": city, "growth_rate": round(growth_rate, 2)})
-
-        cursor.close()
-        conn.close()
-        return {"data": growth_result}
+        return run_remote("city-growth-rate", view_name, type, province=province, min_year=min_year, max_year=max_year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights/policy-impact-by-province")
+@insight_endpoint("policy-impact-by-province")
 def policy_impact_heatmap(
     type: str = Query(..., description="Business type"),
     year: Optional[int] = Query(None)
@@ -830,45 +768,13 @@ def policy_impact_heatmap(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        # Map POLICY_IMPACT to numeric scores
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        where_clause = f"WHERE YEAR = {year}" if year else ""
-
-        query = f"""
-            SELECT PROVINCE, AVG({impact_case}) AS average_impact
-            FROM {view_name}
-            {where_clause}
-            GROUP BY PROVINCE
-            ORDER BY PROVINCE
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [{"province": row[0], "average_impact": row[1]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("policy-impact-by-province", view_name, type, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights/failure-rate")
+@insight_endpoint("failure-rate")
 def failure_rate(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -880,102 +786,84 @@ def failure_rate(
         raise HTTPException(status_code=400, detail="Invalid business type.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT 
-                   SUM(CLOSED) AS total_closed,
-                   SUM(OPENED) AS total_opened,
-                   (1-(total_closed / total_opened)) * 100 AS success_rate
-            FROM {view_name}
-            {where_clause}
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        result = [
-            {
-    
-                "success_rate": row[2]
-            }
-            for row in rows
-        ]
+        return run_remote("failure-rate", view_name, type, province=province, city=city, year=year)
 
-        cursor.close()
-        conn.close()
-        return {"data": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/insights/dashboard")
+@insight_endpoint("dashboard")
+def dashboard(
+    type: str = Query(..., description="Business type"),
+    province: Optional[str] = Query(None),
+    city: Optional[str] = Query(None),
+    year: Optional[int] = Query(None)
+):
+    # One scan of the view feeds business-count, revenue-by-type-kpi,
+    # wage-trends, failure-rate, open-close-trends and footfall-by-city.
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+
+    try:
+        return run_remote("dashboard", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights/forecast-openings")
+@insight_endpoint("forecast-openings", compare=False)
 def forecast_openings(
     type: str = Query(...),
     city: str = Query(...),
     province: str = Query(...),
-    target_year: int = Query(...)
+    target_year: int = Query(...),
+    model: str = Query("linear", description="linear, ses (exponential smoothing) or damped (damped trend)")
 ):
     view_name = VIEW_MAP.get(type.lower())
     if not view_name:
         raise HTTPException(status_code=400, detail="Invalid business type.")
+    if model not in MODELS:
+        raise HTTPException(status_code=400, detail=f"Invalid model; use one of {', '.join(MODELS)}.")
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        query = f"""
-            SELECT YEAR, SUM(OPENED) AS total_opened
-            FROM {view_name}
-            WHERE CITY_NAME = '{city}' AND PROVINCE = '{province}'
-            GROUP BY YEAR
-            ORDER BY YEAR
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        if len(rows) < 2:
-            return {"message": "Not enough historical data to forecast."}
-
-        years = np.array([r[0] for r in rows])
-        opened = np.array([r[1] for r in rows])
-
-        # Fit linear model
-        coefficients = np.polyfit(years, opened, 1)  # degree 1 = linear
-        slope, intercept = coefficients
-
-        forecast_years = list(range(target_year, target_year + 3))
-        predictions = [
-            {
-                "year": y,
-                "predicted_openings": round(slope * y + intercept, 2)
-            } for y in forecast_years
-        ]
-
-        cursor.close()
-        conn.close()
-
-        return {
-            "city": city,
-            "forecast": predictions
-        }
+        # Every city of the view is fitted at once; this is a lookup into that fit
+        predictions = forecast_engine.fit(view_name, model).forecast(province, city, target_year)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if predictions is None:
+        return {"message": "Not enough historical data to forecast."}
 
+    return {
+        "city": city,
+        "forecast": predictions
+    }
+
+@app.get("/api/insights/forecast-openings/all")
+@insight_endpoint("forecast-openings-all", compare=False)
+def forecast_openings_all(
+    type: str = Query(...),
+    target_year: int = Query(...),
+    province: Optional[str] = Query(None, description="Only cities in this province"),
+    model: str = Query("linear", description="linear, ses (exponential smoothing) or damped (damped trend)")
+):
+    view_name = VIEW_MAP.get(type.lower())
+    if not view_name:
+        raise HTTPException(status_code=400, detail="Invalid business type.")
+    if model not in MODELS:
+        raise HTTPException(status_code=400, detail=f"Invalid model; use one of {', '.join(MODELS)}.")
+
+    try:
+        forecasts = forecast_engine.fit(view_name, model).forecast_all(target_year, province)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {"model": model, "data": forecasts}
+
 
 @app.get("/api/insights/policy_rent_impact")
+@insight_endpoint("policy_rent_impact")
 def policy_rent_impact(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -988,51 +876,13 @@ def policy_rent_impact(
         raise HTTPException(status_code=400, detail="Invalid business type.")
     
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT YEAR, POLICY_TYPE, AVG(RENT_COST_CAD) AS avg_rent_CAD, AVG({impact_case}) AS avg_impact_score
-            FROM {view_name}
-            {where_clause}
-            GROUP BY YEAR, POLICY_TYPE
-            ORDER BY YEAR, POLICY_TYPE
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        result = [{"year": row[0], "policy_type": row[1], "avg_rent_CAD": row[2], "avg_impact_score": row[3]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("policy_rent_impact", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/policy_cost_utility_impact")
+@insight_endpoint("policy_cost_utility_impact")
 def policy_cost_utility_impact(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -1045,51 +895,13 @@ def policy_cost_utility_impact(
         raise HTTPException(status_code=400, detail="Invalid business type.")
     
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT YEAR, POLICY_TYPE, AVG(UTILITY_COST_CAD_PER_YR) AS avg_cost_utility, AVG({impact_case}) AS avg_impact_score
-            FROM {view_name}
-            {where_clause}
-            GROUP BY YEAR, POLICY_TYPE
-            ORDER BY YEAR, POLICY_TYPE
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        result = [{"year": row[0], "policy_type": row[1], "avg_cost_utility": row[2], "avg_impact_score": row[3]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("policy_cost_utility_impact", view_name, type, province=province, city=city, year=year)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/maximum_impact_of_policy")
+@insight_endpoint("maximum_impact_of_policy")
 def maximum_impact_of_policy(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -1102,50 +914,13 @@ def maximum_impact_of_policy(
         raise HTTPException(status_code=400, detail="Invalid business type.")
     
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT DISTINCT CITY_NAME, AVG({impact_case}) AS max_impact_score
-            FROM {view_name}
-            {where_clause}
-            GROUP BY CITY_NAME
-            ORDER BY max_impact_score DESC
-            LIMIT 10
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        result = [{"city": row[0], "impact_score": row[1]} for row in rows]
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("maximum_impact_of_policy", view_name, type, province=province, city=city, year=year)
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/insights/minimum_impact_of_policy")
+@insight_endpoint("minimum_impact_of_policy")
 def minimum_impact_of_policy(
     type: str = Query(...),
     province: Optional[str] = Query(None),
@@ -1158,45 +933,7 @@ def minimum_impact_of_policy(
         raise HTTPException(status_code=400, detail="Invalid business type.")
     
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        impact_case = """
-            CASE POLICY_IMPACT
-                WHEN 'Very High' THEN 3
-                WHEN 'High' THEN 2
-                WHEN 'Moderate' THEN 1
-                WHEN 'Low' THEN -1
-                WHEN 'Very Low' THEN -2
-                WHEN 'None' THEN 0
-                ELSE NULL
-            END
-        """
-
-        filters = []
-        if province:
-            filters.append(f"PROVINCE = '{province}'")
-        if city:
-            filters.append(f"CITY_NAME = '{city}'")
-        if year:
-            filters.append(f"YEAR = {year}")
-
-        where_clause = f"WHERE {' AND '.join(filters)}" if filters else ""
-
-        query = f"""
-            SELECT * FROM (SELECT DISTINCT CITY_NAME, AVG({impact_case}) AS min_impact_score
-            FROM {view_name}
-            {where_clause}
-            GROUP BY CITY_NAME
-            ORDER BY min_impact_score ASC
-            ) WHERE min_impact_score != 0  LIMIT 10
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        result = [{"city": row[0], "impact_score": row[1]} for row in rows]
-        cursor.close()
-        conn.close()
-        return {"data": result}
+        return run_remote("minimum_impact_of_policy", view_name, type, province=province, city=city, year=year)
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
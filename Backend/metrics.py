@@ -0,0 +1,395 @@
+"""
+Request tracing, Prometheus metrics and the slow-query log.
+
+Every HTTP request gets a ``Trace`` in a context variable. The pieces of work
+that serve it add timed spans to that trace as they run, on the event loop or
+on a query worker:
+
+* ``queue``: waiting for a query executor slot
+* ``connect``: checking a connection out of the Snowflake pool
+* ``execute``: ``cursor.execute`` (Snowflake compiles and runs the statement)
+* ``fetch``: pulling result rows back
+* ``local``: answering from a rollup cube or snapshot instead
+* ``serialize``: turning the handler's result into the response body
+
+``TracingMiddleware`` sends the spans back as a ``Server-Timing`` header, the
+Snowflake query IDs as ``X-Snowflake-Query-Id``, and records request and
+phase histograms per route and view for ``GET /metrics``. Cache warm-up
+replays (``warmup.py``) are kept out of those and recorded in a histogram of
+their own, so they do not skew the latency of user traffic. Statements slower
+than ``SLOW_QUERY_MS`` are logged with their rendered SQL and timings, and
+appended as JSON lines to ``SLOW_QUERY_LOG`` when that is set.
+"""
+
+from contextlib import contextmanager
+from decimal import Decimal
+import contextvars
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+slow_query_logger = logging.getLogger(__name__ + ".slow_queries")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "1000"))
+
+PHASES = ("queue", "connect", "execute", "fetch", "local", "serialize")
+
+# Seconds; Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Trace:
+    """Timings and Snowflake query IDs of one request."""
+
+    def __init__(self):
+        self.route = None
+        self.endpoint = None
+        self.view = None
+        self.cache = None
+        self.spans = {}
+        self.query_ids = []
+        self.handled_at = None
+        self._lock = threading.Lock()  # spans come from worker threads too
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[phase] = self.spans.get(phase, 0.0) + seconds
+
+    def add_query_id(self, query_id) -> None:
+        if query_id:
+            with self._lock:
+                self.query_ids.append(query_id)
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{phase};dur={1000 * self.spans[phase]:.2f}" for phase in PHASES if phase in self.spans]
+        if self.cache:
+            parts.append(f'cache;desc="{self.cache}"')
+        parts.append(f"total;dur={1000 * total:.2f}")
+        return ", ".join(parts)
+
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace():
+    """The trace of the request being served, or None outside a request."""
+    return _trace.get()
+
+
+@contextmanager
+def span(phase: str):
+    """Add the time spent in the ``with`` block to the current request's *phase*."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(phase, time.perf_counter() - started)
+
+
+# -- Prometheus metrics ------------------------------------------------------
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, (counts, count, total) in series:
+            base = _labels(self.labels, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = sorted(self._series.items())
+        lines += [f"{self.name}{{{_labels(self.labels, labels)}}} {value}" for labels, value in series]
+        return lines
+
+
+def _labels(names, values) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+REQUEST_DURATION = Histogram(
+    "bizripple_request_duration_seconds", "HTTP request latency.", ("method", "route", "view", "status"),
+)
+PHASE_DURATION = Histogram(
+    "bizripple_request_phase_seconds", "Time spent per request phase.", ("route", "view", "phase"),
+)
+WARMUP_DURATION = Histogram(
+    "bizripple_warmup_request_duration_seconds", "Latency of cache warm-up requests.", ("route", "view", "status"),
+)
+QUERIES = Counter("bizripple_snowflake_queries_total", "Statements sent to Snowflake.", ("endpoint", "view"))
+SLOW_QUERIES = Counter("bizripple_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ("endpoint", "view"))
+
+REGISTRY = [REQUEST_DURATION, PHASE_DURATION, WARMUP_DURATION, QUERIES, SLOW_QUERIES]
+
+
+def render_metrics() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# -- ASGI middleware ---------------------------------------------------------
+
+
+class TracingMiddleware:
+    """Traces each HTTP request and reports it in response headers and metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                now = time.perf_counter()
+                if trace.handled_at is not None:
+                    # Encoding the handler's result into the body
+                    trace.add("serialize", now - trace.handled_at)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing(now - started).encode("latin-1")))
+                if trace.query_ids:
+                    headers.append((b"x-snowflake-query-id", ", ".join(trace.query_ids).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _trace.reset(token)
+            route = scope.get("route")
+            trace.route = getattr(route, "path", None) or "unmatched"
+            view = trace.view or ""
+            elapsed = time.perf_counter() - started
+            # Only the in-process warm-up sets this; HTTP clients cannot reach the scope
+            if scope.get("warmup"):
+                WARMUP_DURATION.observe((trace.route, view, str(status)), elapsed)
+            else:
+                REQUEST_DURATION.observe((scope["method"], trace.route, view, str(status)), elapsed)
+                for phase, seconds in trace.spans.items():
+                    PHASE_DURATION.observe((trace.route, view, phase), seconds)
+
+
+# -- Traced Snowflake connections --------------------------------------------
+
+
+@contextmanager
+def traced_connection(pool):
+    """Check a connection out of *pool*, timing the checkout and every statement on it."""
+    started = time.perf_counter()
+    with pool.connection() as conn:
+        trace = _trace.get()
+        if trace is not None:
+            trace.add("connect", time.perf_counter() - started)
+        yield _TracedConnection(conn)
+
+
+class _TracedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _TracedCursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _TracedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+
+    def execute(self, sql, params=None):
+        self._finish()
+        statement = self._statement = {"sql": sql, "params": params, "execute": 0.0, "fetch": 0.0, "rows": 0}
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(sql, params)
+        except Exception as e:
+            statement["error"] = str(e)
+            raise
+        finally:
+            statement["execute"] = time.perf_counter() - started
+            statement["query_id"] = getattr(self._cursor, "sfqid", None)
+            trace = _trace.get()
+            if trace is not None:
+                trace.add("execute", statement["execute"])
+                trace.add_query_id(statement["query_id"])
+                QUERIES.inc((trace.endpoint or "", trace.view or ""))
+            if "error" in statement:
+                # Handlers skip close() on errors, so report the statement now
+                self._finish()
+        return self if result is self._cursor else result
+
+    def fetchall(self):
+        with self._fetching() as rows:
+            rows.extend(self._cursor.fetchall())
+        return rows
+
+    def fetchmany(self, size=None):
+        with self._fetching() as rows:
+            rows.extend(self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany())
+        return rows
+
+    def fetchone(self):
+        with self._fetching() as rows:
+            row = self._cursor.fetchone()
+            if row is not None:
+                rows.append(row)
+        return row
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name == "fetch_arrow_batches":
+            return lambda *args, **kwargs: self._timed_batches(attr(*args, **kwargs))
+        return attr
+
+    def _timed_batches(self, batches):
+        batches = iter(batches)
+        while True:
+            with self._fetching() as rows:
+                table = next(batches, None)
+                if table is not None:
+                    rows.extend(range(table.num_rows))
+            if table is None:
+                return
+            yield table
+
+    @contextmanager
+    def _fetching(self):
+        rows = []
+        started = time.perf_counter()
+        try:
+            yield rows
+        finally:
+            elapsed = time.perf_counter() - started
+            if self._statement is not None:
+                self._statement["fetch"] += elapsed
+                self._statement["rows"] += len(rows)
+            trace = _trace.get()
+            if trace is not None:
+                trace.add("fetch", elapsed)
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None and 1000 * (statement["execute"] + statement["fetch"]) >= SLOW_QUERY_MS:
+            log_slow_query(statement)
+
+
+def render_sql(sql: str, params) -> str:
+    """*sql* with its qmark parameters inlined, for reading (not for running)."""
+    if not params:
+        return sql
+    pieces = sql.split("?")
+    if len(pieces) != len(params) + 1:
+        return sql
+    rendered = [pieces[0]]
+    for value, piece in zip(params, pieces[1:]):
+        rendered.append(_literal(value))
+        rendered.append(piece)
+    return "".join(rendered)
+
+
+def _literal(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def log_slow_query(statement: dict) -> None:
+    trace = _trace.get()
+    endpoint = trace.endpoint if trace is not None else None
+    view = trace.view if trace is not None else None
+    SLOW_QUERIES.inc((endpoint or "", view or ""))
+    record = {
+        "at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "endpoint": endpoint,
+        "view": view,
+        "query_id": statement.get("query_id"),
+        "execute_ms": round(1000 * statement["execute"], 2),
+        "fetch_ms": round(1000 * statement["fetch"], 2),
+        "rows": statement["rows"],
+        "error": statement.get("error"),
+        "sql": " ".join(render_sql(statement["sql"], statement["params"]).split()),
+    }
+    slow_query_logger.warning("Slow query: %s", json.dumps(record))
+
+
+def configure_slow_query_log(path: str = None) -> None:
+    """Also write the slow-query log as JSON lines to *path* (``SLOW_QUERY_LOG``)."""
+    path = path or os.getenv("SLOW_QUERY_LOG")
+    if not path or any(getattr(h, "baseFilename", None) == os.path.abspath(path) for h in slow_query_logger.handlers):
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(_JsonLineFormatter())
+    slow_query_logger.addHandler(handler)
+
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        # The message args hold the already-encoded record
+        return record.args[0] if record.args else record.getMessage()
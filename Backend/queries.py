@@ -0,0 +1,342 @@
+"""
+Bind-parameter SQL for the insight endpoints.
+
+Every endpoint query is a template with ``{source}`` (the view), ``{where}``
+and, where needed, ``{impact}`` placeholders. Filter values never end up in
+the SQL text: they are emitted as ``?`` placeholders (the connector is set to
+server-side ``qmark`` binding in ``db.py``) and passed separately. The SQL for
+one (endpoint, view, filter shape) is therefore always byte-for-byte the same,
+so Snowflake can reuse its compiled plan and its result cache, and it is
+compiled once per process.
+"""
+
+from collections import namedtuple
+import functools
+
+from impact import impact_scale
+
+# ``order`` is the statement's output ORDER BY in terms of its result
+# columns (None when unordered), for queries that wrap it (comparison.py).
+Query = namedtuple("Query", ["sql", "params", "order"])
+
+# Filter name -> predicate, in the order they are emitted. "years" and
+# "cities" take a sequence and expand to one placeholder per element.
+FILTERS = {
+    "province": "PROVINCE = ?",
+    "city": "CITY_NAME = ?",
+    "cities": "CITY_NAME IN ({placeholders})",
+    "year": "YEAR = ?",
+    "policy_type": "POLICY_TYPE = ?",
+    "years": "YEAR IN ({placeholders})",
+    "min_year": "YEAR >= ?",
+    "max_year": "YEAR <= ?",
+}
+
+SEQUENCE_FILTERS = {"cities", "years"}
+
+# Policy impact on the numeric scale of impact.py. Snowflake still maps the
+# labels per row; snapshots and rollup cubes store the score instead.
+IMPACT_CASE = impact_scale.case_sql()
+
+TEMPLATES = {
+    "open-close-trends": """
+        SELECT YEAR, SUM(OPENED) AS total_opened, SUM(CLOSED) AS total_closed
+        FROM {source}
+        {where}
+        GROUP BY YEAR
+        ORDER BY YEAR
+    """,
+    "footfall-by-city": """
+        SELECT CITY_NAME, YEAR, AVG(CONSUMER_FOOTFALL) AS total_footfall
+        FROM {source}
+        {where}
+        GROUP BY CITY_NAME, YEAR
+        ORDER BY total_footfall DESC
+        LIMIT 10
+    """,
+    "footfall-by-city:year": """
+        SELECT CITY_NAME, AVG(CONSUMER_FOOTFALL) AS total_footfall
+        FROM {source}
+        {where}
+        GROUP BY CITY_NAME, YEAR
+        ORDER BY total_footfall DESC
+        LIMIT 10
+    """,
+    "wage-trends": """
+        SELECT YEAR, AVG(MEDIAN_WAGE_CAD) AS median_wage
+        FROM {source}
+        {where}
+        GROUP BY YEAR
+        ORDER BY YEAR
+    """,
+    "wage-trends:year": """
+        SELECT CITY_NAME, AVG(MEDIAN_WAGE_CAD) AS median_wage
+        FROM {source}
+        {where}
+        GROUP BY CITY_NAME
+        ORDER BY CITY_NAME
+    """,
+    "revenue-by-type-kpi": """
+        SELECT MAX(REVENUE_CAD) as max_rev_cad, MIN(REVENUE_CAD) as min_rev_cad, AVG(REVENUE_CAD) as avg_rev_cad, COUNT(DISTINCT YEAR) AS num_years
+        FROM {source}
+        {where}
+    """,
+    "revenue-by-type-chart": """
+        WITH max_rev AS (
+            SELECT city_name, year AS max_year, revenue_cad AS max_rev_cad, policy_impact AS max_policy_impact
+            FROM {source}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY CITY_NAME ORDER BY REVENUE_CAD DESC) = 1
+        ),
+        min_rev AS (
+            SELECT city_name, year AS min_year, revenue_cad AS min_rev_cad, policy_impact AS min_policy_impact
+            FROM {source}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY CITY_NAME ORDER BY REVENUE_CAD ASC) = 1
+        ),
+        avg_rev AS (
+            SELECT city_name, AVG(revenue_cad) AS avg_rev_cad
+            FROM {source}
+            GROUP BY 1
+        )
+        SELECT
+            max_rev.city_name, max_rev.max_year, max_rev.max_rev_cad, max_rev.max_policy_impact,
+            min_rev.min_year, min_rev.min_rev_cad, min_rev.min_policy_impact,
+            avg_rev.avg_rev_cad
+        FROM max_rev
+        JOIN min_rev ON max_rev.city_name = min_rev.city_name
+        JOIN avg_rev ON max_rev.city_name = avg_rev.city_name
+        {where}
+        ORDER BY avg_rev.avg_rev_cad
+        LIMIT 10
+    """,
+    "policy-impact-trend": """
+        SELECT YEAR, POLICY_TYPE, AVG({impact}) AS avg_impact_score
+        FROM {source}
+        {where}
+        GROUP BY YEAR, POLICY_TYPE
+        ORDER BY YEAR, POLICY_TYPE
+    """,
+    "cost-breakdown": """
+        SELECT
+            AVG(RENT_COST_CAD) AS avg_rent,
+            AVG(UTILITY_COST_CAD_PER_YR) AS avg_utility,
+            MAX(RENT_COST_CAD) AS max_rent,
+            MIN(RENT_COST_CAD) AS min_rent,
+            MAX(UTILITY_COST_CAD_PER_YR) AS max_utility,
+            MIN(UTILITY_COST_CAD_PER_YR) AS min_utility
+        FROM {source}
+        {where}
+    """,
+    "business-population": """
+        SELECT PROVINCE, SUM(TOTAL_SALONS) AS total_businesses
+        FROM {source}
+        {where}
+        GROUP BY PROVINCE
+        ORDER BY PROVINCE
+    """,
+    "business-count": """
+        SELECT AVG(TOTAL_SALONS) AS total_count
+        FROM {source}
+        {where}
+    """,
+    "policy-distribution": """
+        SELECT POLICY_TYPE, COUNT(*) AS count, count(distinct POLICY_TYPE)
+        FROM {source}
+        {where}
+        GROUP BY POLICY_TYPE
+        ORDER BY count DESC
+    """,
+    "filter-index": "SELECT DISTINCT PROVINCE, CITY_NAME, YEAR, POLICY_TYPE FROM {source}",
+    "policies-by-year": """
+        SELECT
+            POLICY_ID,
+            POLICY_TYPE,
+            POLICY_IMPACT,
+            CITY_NAME,
+            PROVINCE,
+            YEAR
+        FROM {source}
+        {where}
+    """,
+    "city-growth-rate": """
+        SELECT CITY_NAME, YEAR, SUM(OPENED) AS total_opened
+        FROM {source}
+        {where}
+        GROUP BY CITY_NAME, YEAR
+        ORDER BY CITY_NAME, YEAR
+    """,
+    "policy-impact-by-province": """
+        SELECT PROVINCE, AVG({impact}) AS average_impact
+        FROM {source}
+        {where}
+        GROUP BY PROVINCE
+        ORDER BY PROVINCE
+    """,
+    "failure-rate": """
+        SELECT
+               SUM(CLOSED) AS total_closed,
+               SUM(OPENED) AS total_opened,
+               (1-(total_closed / total_opened)) * 100 AS success_rate
+        FROM {source}
+        {where}
+    """,
+    # GROUPING(...) tells apart the overall, per-year, per-city and
+    # per-city-and-year rows of the grouping sets.
+    "dashboard": """
+        SELECT
+            GROUPING(CITY_NAME) AS g_city,
+            GROUPING(YEAR) AS g_year,
+            CITY_NAME,
+            YEAR,
+            AVG(TOTAL_SALONS) AS avg_count,
+            MAX(REVENUE_CAD) AS max_rev_cad,
+            MIN(REVENUE_CAD) AS min_rev_cad,
+            AVG(REVENUE_CAD) AS avg_rev_cad,
+            COUNT(DISTINCT YEAR) AS num_years,
+            AVG(MEDIAN_WAGE_CAD) AS median_wage,
+            SUM(OPENED) AS total_opened,
+            SUM(CLOSED) AS total_closed,
+            AVG(CONSUMER_FOOTFALL) AS avg_footfall
+        FROM {source}
+        {where}
+        GROUP BY GROUPING SETS ((), (YEAR), (CITY_NAME), (CITY_NAME, YEAR))
+    """,
+    "forecast-series": """
+        SELECT PROVINCE, CITY_NAME, YEAR, SUM(OPENED) AS total_opened
+        FROM {source}
+        {where}
+        GROUP BY PROVINCE, CITY_NAME, YEAR
+    """,
+    "policy_rent_impact": """
+        SELECT YEAR, POLICY_TYPE, AVG(RENT_COST_CAD) AS avg_rent_CAD, AVG({impact}) AS avg_impact_score
+        FROM {source}
+        {where}
+        GROUP BY YEAR, POLICY_TYPE
+        ORDER BY YEAR, POLICY_TYPE
+    """,
+    "policy_cost_utility_impact": """
+        SELECT YEAR, POLICY_TYPE, AVG(UTILITY_COST_CAD_PER_YR) AS avg_cost_utility, AVG({impact}) AS avg_impact_score
+        FROM {source}
+        {where}
+        GROUP BY YEAR, POLICY_TYPE
+        ORDER BY YEAR, POLICY_TYPE
+    """,
+    "maximum_impact_of_policy": """
+        SELECT DISTINCT CITY_NAME, AVG({impact}) AS max_impact_score
+        FROM {source}
+        {where}
+        GROUP BY CITY_NAME
+        ORDER BY max_impact_score DESC
+        LIMIT 10
+    """,
+    "minimum_impact_of_policy": """
+        SELECT * FROM (SELECT DISTINCT CITY_NAME, AVG({impact}) AS min_impact_score
+        FROM {source}
+        {where}
+        GROUP BY CITY_NAME
+        ORDER BY min_impact_score ASC
+        ) WHERE min_impact_score != 0 LIMIT 10
+    """,
+}
+
+# ORDER BY of each template's result, over its output column names. The
+# templates carry their own; this is the same order for a wrapping query,
+# which cannot see table qualifiers or the ORDER BYs of windows and subqueries.
+OUTPUT_ORDER = {
+    "open-close-trends": "YEAR",
+    "footfall-by-city": "total_footfall DESC",
+    "footfall-by-city:year": "total_footfall DESC",
+    "wage-trends": "YEAR",
+    "wage-trends:year": "CITY_NAME",
+    "revenue-by-type-chart": "avg_rev_cad",
+    "policy-impact-trend": "YEAR, POLICY_TYPE",
+    "business-population": "PROVINCE",
+    "policy-distribution": "count DESC",
+    "city-growth-rate": "CITY_NAME, YEAR",
+    "policy-impact-by-province": "PROVINCE",
+    "policy_rent_impact": "YEAR, POLICY_TYPE",
+    "policy_cost_utility_impact": "YEAR, POLICY_TYPE",
+    "maximum_impact_of_policy": "max_impact_score DESC",
+    "minimum_impact_of_policy": "min_impact_score ASC",
+}
+
+# Measures kept by the rollup cubes (rollups.py): each gets a SUM and a
+# non-NULL COUNT so averages can be re-derived at any coarser grain.
+ROLLUP_DIMENSIONS = ["PROVINCE", "CITY_NAME", "YEAR", "POLICY_TYPE"]
+ROLLUP_MEASURES = {
+    "OPENED": "OPENED",
+    "CLOSED": "CLOSED",
+    "REVENUE_CAD": "REVENUE_CAD",
+    "RENT_COST_CAD": "RENT_COST_CAD",
+    "UTILITY_COST_CAD_PER_YR": "UTILITY_COST_CAD_PER_YR",
+    "MEDIAN_WAGE_CAD": "MEDIAN_WAGE_CAD",
+    "CONSUMER_FOOTFALL": "CONSUMER_FOOTFALL",
+    "TOTAL_SALONS": "TOTAL_SALONS",
+    "IMPACT_SCORE": "{impact}",
+    "COSTS": "RENT_COST_CAD + UTILITY_COST_CAD_PER_YR",
+}
+
+TEMPLATES["rollup-base"] = (
+    f"SELECT {', '.join(ROLLUP_DIMENSIONS)}, COUNT(*) AS row_count, "
+    + ", ".join(f"SUM({expr}), COUNT({expr})" for expr in ROLLUP_MEASURES.values())
+    + f" FROM {{source}} {{where}} GROUP BY {', '.join(ROLLUP_DIMENSIONS)}"
+)
+# Measures of the should-open scores (scoring.py), per city and year
+SCORE_MEASURES = ["OPENED", "CLOSED", "REVENUE_CAD", "COSTS", "IMPACT_SCORE", "MEDIAN_WAGE_CAD", "CONSUMER_FOOTFALL"]
+TEMPLATES["score-base"] = (
+    "SELECT PROVINCE, CITY_NAME, YEAR, COUNT(*) AS row_count, "
+    + ", ".join(f"SUM({ROLLUP_MEASURES[m]}), COUNT({ROLLUP_MEASURES[m]})" for m in SCORE_MEASURES)
+    + " FROM {source} {where} GROUP BY PROVINCE, CITY_NAME, YEAR"
+)
+TEMPLATES["rollup-probe"] = "SELECT MAX(YEAR), COUNT(*) FROM {source}"
+TEMPLATES["version-probe"] = "SELECT COUNT(*), HASH_AGG(*) FROM {source}"
+
+# Filters that have to name a specific relation in multi-table templates
+COLUMN_OVERRIDES = {
+    "revenue-by-type-chart": {"city": "MAX_REV.CITY_NAME"},
+}
+
+
+def build_query(template: str, view_name: str, **filters) -> Query:
+    """
+    Render *template* against *view_name* with the given filters.
+
+    Empty filters (None, "", 0) are left out, matching the handlers' old
+    ``if province:`` checks. Returns the SQL text, its positional binds and
+    the template's output order.
+    """
+    shape = []
+    params = []
+    for name in FILTERS:
+        value = filters.pop(name, None)
+        if not value:
+            continue
+        if name in SEQUENCE_FILTERS:
+            value = list(value)
+            shape.append((name, len(value)))
+            params.extend(value)
+        else:
+            shape.append((name, 1))
+            params.append(value)
+    if filters:
+        raise TypeError(f"Unknown filters for {template}: {', '.join(sorted(filters))}")
+    return Query(compile_template(template, view_name, tuple(shape)), params or None, OUTPUT_ORDER.get(template))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(template: str, view_name: str, shape: tuple) -> str:
+    overrides = COLUMN_OVERRIDES.get(template, {})
+    clauses = []
+    for name, size in shape:
+        clause = FILTERS[name]
+        if name in SEQUENCE_FILTERS:
+            clause = clause.format(placeholders=", ".join("?" * size))
+        if name in overrides:
+            clause = clause.replace(clause.split(" ", 1)[0], overrides[name], 1)
+        clauses.append(clause)
+    where_clause = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return TEMPLATES[template].format(source=view_name, where=where_clause, impact=IMPACT_CASE)
+
+
+def template_stats() -> dict:
+    info = compile_template.cache_info()
+    return {"compiled": info.currsize, "hits": info.hits, "misses": info.misses}
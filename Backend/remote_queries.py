@@ -0,0 +1,240 @@
+"""
+Snowflake implementations of the insight endpoints.
+
+Each endpoint is split in two: ``build`` renders its ``queries.Query`` for one
+view and set of filters, and ``shape`` turns the rows of that query into the
+endpoint's payload. The handlers in ``main.py`` run both through
+``run_remote``; comparison mode (``comparison.py``) sends the queries of
+several views as one statement and shapes each view's rows on their own.
+"""
+
+from collections import defaultdict, namedtuple
+
+from db import pooled_connection
+from queries import build_query
+
+RemoteQuery = namedtuple("RemoteQuery", ["build", "shape"])
+
+REMOTE_QUERIES = {}
+
+
+def remote_query(name: str, build=None):
+    """
+    Register the decorated ``shape(rows, type, **filters)`` of endpoint *name*.
+
+    *build(view_name, **filters)* renders its query; by default that is the
+    template named like the endpoint, with the filters as binds.
+    """
+    def register(shape):
+        REMOTE_QUERIES[name] = RemoteQuery(build or _template(name), shape)
+        return shape
+    return register
+
+
+def run_remote(name: str, view_name: str, type: str, **filters):
+    """Payload of endpoint *name* for *view_name*, from Snowflake."""
+    remote = REMOTE_QUERIES[name]
+    query = remote.build(view_name, **filters)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query.sql, query.params)
+        rows = cursor.fetchall()
+        cursor.close()
+    return remote.shape(rows, type, **filters)
+
+
+def _template(name):
+    def build(view_name, **filters):
+        return build_query(name, view_name, **filters)
+    return build
+
+
+def _by_year(name):
+    # Grouped by city for one year, by year otherwise
+    def build(view_name, **filters):
+        return build_query(f"{name}:year" if filters.get("year") else name, view_name, **filters)
+    return build
+
+
+@remote_query("open-close-trends")
+def open_close_trends(rows, type, province=None, city=None, year=None):
+    return {"data": [{"year": row[0], "opened": row[1], "closed": row[2]} for row in rows]}
+
+
+@remote_query("footfall-by-city", build=_by_year("footfall-by-city"))
+def footfall_by_city(rows, type, province=None, city=None, year=None):
+    # Include year only if it is not specified (to return yearly trends)
+    if year:
+        return {"data": [{"city": row[0], "footfall": row[1]} for row in rows]}
+    return {"data": [{"city": row[0], "year": row[1], "footfall": row[2]} for row in rows]}
+
+
+@remote_query("wage-trends", build=_by_year("wage-trends"))
+def wage_trends(rows, type, province=None, city=None, year=None):
+    if year:
+        return {"data": [{"city": row[0], "median_wage": row[1]} for row in rows]}
+    return {"data": [{"year": row[0], "median_wage": row[1]} for row in rows]}
+
+
+@remote_query("revenue-by-type-kpi")
+def revenue_by_type_kpi(rows, type, province=None, city=None, year=None):
+    return {"data": [{"max_rev_cad": row[0], "min_rev_cad": row[1], "avg_rev_cad": row[2], "years": row[3]} for row in rows]}
+
+
+@remote_query("revenue-by-type-chart")
+def revenue_by_type_chart(rows, type, province=None, city=None):
+    results = []
+    for row in rows:
+        results.append({
+            "city": row[0],
+            "max_year": row[1],
+            "max_revenue": row[2],
+            "max_policy_impact": row[3],
+            "min_year": row[4],
+            "min_revenue": row[5],
+            "min_policy_impact": row[6],
+            "average_revenue": row[7],
+        })
+    return {"business_type": type.lower(), "data": results}
+
+
+@remote_query("policy-impact-trend")
+def policy_impact_trend(rows, type, province=None, city=None, year=None, policy_type=None):
+    return {"data": [{"year": row[0], "policy_typr": row[1], "average_impact": row[2]} for row in rows]}
+
+
+@remote_query("cost-breakdown")
+def cost_breakdown(rows, type, province=None, city=None, year=None):
+    row = rows[0] if rows else None
+    return {"data": {
+        "average_rent": row[0] if row and row[0] is not None else 0,
+        "average_utility": row[1] if row and row[1] is not None else 0,
+        "max_rent": row[2] if row and row[2] is not None else 0,
+        "min_rent": row[3] if row and row[3] is not None else 0,
+        "max_utility": row[4] if row and row[4] is not None else 0,
+        "min_utility": row[5] if row and row[5] is not None else 0
+    }}
+
+
+@remote_query("business-population")
+def business_population(rows, type, year=None):
+    return {"data": [{"province": row[0], "total_businesses": row[1]} for row in rows]}
+
+
+@remote_query("business-count")
+def business_count(rows, type, province=None, city=None, year=None):
+    row = rows[0] if rows else None
+    return {"data": {"total_count": row[0] if row and row[0] is not None else 0}}
+
+
+@remote_query("policy-distribution")
+def policy_distribution(rows, type, province=None, city=None, year=None):
+    return {"data": [{"policy_type": row[0], "count": row[1], "dist_count": row[2]} for row in rows]}
+
+
+@remote_query("city-growth-rate")
+def city_growth_rate(rows, type, province=None, min_year=None, max_year=None):
+    city_year_data = defaultdict(dict)
+    for city, year, opened in rows:
+        city_year_data[city][year] = opened
+
+    growth_result = []
+    for city, year_data in city_year_data.items():
+        years = sorted(year_data.keys())
+        if len(years) < 2:
+            continue
+        first, last = years[0], years[-1]
+        opened_start = year_data[first]
+        opened_end = year_data[last]
+        if opened_start == 0:
+            continue
+        growth_rate = ((opened_end - opened_start) / opened_start) * 100
+        growth_result.append({"city": city, "growth_rate": round(growth_rate, 2)})
+    return {"data": growth_result}
+
+
+@remote_query("policy-impact-by-province")
+def policy_impact_heatmap(rows, type, year=None):
+    return {"data": [{"province": row[0], "average_impact": row[1]} for row in rows]}
+
+
+@remote_query("failure-rate")
+def failure_rate(rows, type, province=None, city=None, year=None):
+    return {"data": [{"success_rate": row[2]} for row in rows]}
+
+
+@remote_query("dashboard")
+def dashboard(rows, type, province=None, city=None, year=None):
+    total = None
+    by_year, by_city, by_city_year = [], [], []
+    for row in rows:
+        g_city, g_year = row[0], row[1]
+        if g_city and g_year:
+            total = row
+        elif g_city:
+            by_year.append(row)
+        elif g_year:
+            by_city.append(row)
+        else:
+            by_city_year.append(row)
+
+    # ORDER BY YEAR / CITY_NAME: NULLs last, as in Snowflake
+    by_year.sort(key=lambda r: (r[3] is None, r[3] or 0))
+    by_city.sort(key=lambda r: (r[2] is None, r[2] or ""))
+
+    business_count = {"total_count": total[4] if total and total[4] is not None else 0}
+
+    revenue_kpi = [
+        {"max_rev_cad": total[5], "min_rev_cad": total[6], "avg_rev_cad": total[7], "years": total[8]}
+    ] if total else []
+
+    if year:
+        wage = [{"city": r[2], "median_wage": r[9]} for r in by_city]
+    else:
+        wage = [{"year": r[3], "median_wage": r[9]} for r in by_year]
+
+    success_rate = None
+    if total and total[10]:
+        success_rate = (1 - (total[11] / total[10])) * 100
+    failure = [{"success_rate": success_rate}] if total else []
+
+    trends = [{"year": r[3], "opened": r[10], "closed": r[11]} for r in by_year]
+
+    # Same ordering as footfall-by-city: highest first, NULLs first on DESC
+    by_city_year.sort(key=lambda r: (r[12] is None, r[12] or 0), reverse=True)
+    top_footfall = by_city_year[:10]
+    if year:
+        footfall = [{"city": r[2], "footfall": r[12]} for r in top_footfall]
+    else:
+        footfall = [{"city": r[2], "year": r[3], "footfall": r[12]} for r in top_footfall]
+
+    return {
+        "data": {
+            "business_count": business_count,
+            "revenue_by_type_kpi": revenue_kpi,
+            "wage_trends": wage,
+            "failure_rate": failure,
+            "open_close_trends": trends,
+            "footfall_by_city": footfall,
+        }
+    }
+
+
+@remote_query("policy_rent_impact")
+def policy_rent_impact(rows, type, province=None, city=None, year=None):
+    return {"data": [{"year": row[0], "policy_type": row[1], "avg_rent_CAD": row[2], "avg_impact_score": row[3]} for row in rows]}
+
+
+@remote_query("policy_cost_utility_impact")
+def policy_cost_utility_impact(rows, type, province=None, city=None, year=None):
+    return {"data": [{"year": row[0], "policy_type": row[1], "avg_cost_utility": row[2], "avg_impact_score": row[3]} for row in rows]}
+
+
+@remote_query("maximum_impact_of_policy")
+def maximum_impact_of_policy(rows, type, province=None, city=None, year=None):
+    return {"data": [{"city": row[0], "impact_score": row[1]} for row in rows]}
+
+
+@remote_query("minimum_impact_of_policy")
+def minimum_impact_of_policy(rows, type, province=None, city=None, year=None):
+    return {"data": [{"city": row[0], "impact_score": row[1]} for row in rows]}
@@ -0,0 +1,333 @@
+"""
+Pre-aggregated rollup cubes of the ``*_RPT_VW`` report views.
+
+The base cube of a view has one row per (PROVINCE, CITY_NAME, YEAR,
+POLICY_TYPE) holding the source row count and, for every measure in
+``queries.ROLLUP_MEASURES``, its SUM and non-NULL COUNT, so SUMs and AVGs can
+be re-derived exactly at any coarser grain. The policy impact score is one of
+those measures, so the POLICY_IMPACT ``CASE`` is evaluated once per build
+instead of once per request. Coarser levels are rolled up from the base in
+memory.
+
+For a request, the planner picks the smallest level whose dimensions cover
+the endpoint's group-by keys and filters, and the endpoint's local query from
+``local_queries`` runs against that level unchanged (``RollupLevel`` is a
+``snapshot.ColumnTable``).
+
+Cubes are built from the loaded snapshot of a view when there is one and from
+a single GROUP BY on Snowflake otherwise. Refreshes are incremental: a
+``MAX(YEAR), COUNT(*)`` probe tells whether anything changed, and if so only
+the cube's latest year onwards is re-read. When the row count still disagrees
+after that (an older year was restated) the cube is rebuilt in full.
+"""
+
+import datetime
+import logging
+import threading
+
+import numpy as np
+
+from db import pooled_connection
+from queries import ROLLUP_DIMENSIONS, ROLLUP_MEASURES, build_query
+from snapshot import ColumnTable, snapshot_store
+
+logger = logging.getLogger(__name__)
+
+# Levels kept next to the base grain. The planner only considers these, so
+# each one should be the best fit for some endpoint's keys and filters.
+LEVELS = [
+    ("PROVINCE", "CITY_NAME", "YEAR"),
+    ("PROVINCE", "YEAR", "POLICY_TYPE"),
+    ("PROVINCE", "CITY_NAME"),
+    ("PROVINCE", "YEAR"),
+    ("CITY_NAME", "YEAR"),
+    ("YEAR", "POLICY_TYPE"),
+    ("PROVINCE",),
+    ("CITY_NAME",),
+    ("YEAR",),
+    (),
+]
+
+# Endpoint -> columns its local query groups by. Only endpoints built from
+# SUM/AVG/COUNT can be answered from a cube; MIN/MAX/COUNT DISTINCT and
+# row-level endpoints stay on the snapshot or Snowflake.
+ROLLUP_ENDPOINTS = {
+    "city-growth-rate": ("CITY_NAME", "YEAR"),
+    "footfall-by-city": ("CITY_NAME", "YEAR"),
+    "policy-impact-trend": ("YEAR", "POLICY_TYPE"),
+    "policy_rent_impact": ("YEAR", "POLICY_TYPE"),
+    "policy_cost_utility_impact": ("YEAR", "POLICY_TYPE"),
+    "maximum_impact_of_policy": ("CITY_NAME",),
+    "minimum_impact_of_policy": ("CITY_NAME",),
+    "policy-impact-by-province": ("PROVINCE",),
+    "open-close-trends": ("YEAR",),
+    "wage-trends": ("CITY_NAME", "YEAR"),
+    "business-population": ("PROVINCE",),
+    "business-count": (),
+    "failure-rate": (),
+}
+
+# Endpoint filter -> the dimension it restricts
+FILTER_DIMENSIONS = {
+    "province": "PROVINCE",
+    "city": "CITY_NAME",
+    "cities": "CITY_NAME",
+    "year": "YEAR",
+    "policy_type": "POLICY_TYPE",
+    "years": "YEAR",
+    "min_year": "YEAR",
+    "max_year": "YEAR",
+}
+
+_COLUMN_ORDER = (
+    ROLLUP_DIMENSIONS
+    + ["ROWS"]
+    + [f"{part}_{measure}" for measure in ROLLUP_MEASURES for part in ("SUM", "CNT")]
+)
+
+
+class RollupLevel(ColumnTable):
+    """One grain of a cube: dimension columns plus ROWS, SUM_<m> and CNT_<m>."""
+
+    def __init__(self, dims, rows: int, columns: dict, dictionaries: dict, integral):
+        super().__init__(rows, columns, {d: dictionaries[d] for d in dims if d in dictionaries})
+        self.dims = tuple(dims)
+        self.integral = frozenset(integral)
+
+    def is_integral(self, column) -> bool:
+        return column in self.integral
+
+    def measure(self, column, rows: np.ndarray):
+        if not isinstance(column, str) or f"SUM_{column}" not in self._columns:
+            raise KeyError(f"{column!r} is not a rollup measure")
+        return self._columns[f"SUM_{column}"][rows], self._columns[f"CNT_{column}"][rows]
+
+    def row_weights(self, rows: np.ndarray) -> np.ndarray:
+        return self._columns["ROWS"][rows]
+
+    def rollup(self, dims) -> "RollupLevel":
+        """Aggregate this level up to the coarser grain *dims*."""
+        groups = self.group_by(list(dims), np.arange(self.rows))
+        columns = {d: groups.key_codes(d).astype(self._columns[d].dtype) for d in dims}
+        columns["ROWS"] = groups.count()
+        for measure in ROLLUP_MEASURES:
+            columns[f"SUM_{measure}"], columns[f"CNT_{measure}"] = groups.totals(measure)
+        return RollupLevel(dims, groups.size, columns, self._dictionaries, self.integral)
+
+    def to_columns(self, rows: np.ndarray) -> dict:
+        """Decoded column lists of *rows*, in the shape ``_base_level`` takes."""
+        columns = {}
+        for name in _COLUMN_ORDER:
+            values = np.asarray(self._columns[name])[rows]
+            columns[name] = self.decode(name, values) if self.is_string(name) else values.tolist()
+        return columns
+
+
+class RollupCube:
+    """Every level of one view's cube, plus the planner that chooses between them."""
+
+    def __init__(self, view_name: str, base: RollupLevel, source: str):
+        self.view_name = view_name
+        self.source = source
+        self.base = base
+        self.levels = [base] + [base.rollup(dims) for dims in LEVELS]
+        years = base.column("YEAR")
+        self.max_year = int(years.max()) if base.rows else None
+        self.source_rows = int(base.column("ROWS").sum())
+        self.built_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._planned = {}
+
+    def plan(self, needed: set) -> RollupLevel:
+        """The smallest level with every dimension in *needed*."""
+        covering = [level for level in self.levels if needed <= set(level.dims)]
+        level = min(covering, key=lambda l: (l.rows, len(l.dims)))
+        self._planned[level.dims] = self._planned.get(level.dims, 0) + 1
+        return level
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source,
+            "built_at": self.built_at,
+            "max_year": self.max_year,
+            "source_rows": self.source_rows,
+            "levels": {
+                "+".join(level.dims) or "total": {"rows": level.rows, "planned": self._planned.get(level.dims, 0)}
+                for level in self.levels
+            },
+        }
+
+
+class RollupStore:
+    """Cubes per view name, with a background thread that keeps them current."""
+
+    def __init__(self):
+        self.interval = None
+        self.on_change = None
+        self._cubes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, view_name: str):
+        return self._cubes.get(view_name)
+
+    def plan(self, view_name: str, endpoint: str, filters: dict):
+        """The cube level to answer *endpoint* from, or None to use the raw rows."""
+        cube = self._cubes.get(view_name)
+        keys = ROLLUP_ENDPOINTS.get(endpoint)
+        if cube is None or keys is None:
+            return None
+        needed = set(keys)
+        for name, value in filters.items():
+            # Same emptiness rule as ColumnTable.select()
+            if name in FILTER_DIMENSIONS and (value or (name in ("years", "cities") and value is not None)):
+                needed.add(FILTER_DIMENSIONS[name])
+        return cube.plan(needed)
+
+    def refresh(self, view_name: str, full: bool = False) -> dict:
+        """Bring the cube of *view_name* up to date with its source."""
+        with self._lock:
+            snapshot = snapshot_store.get(view_name)
+            if snapshot is not None:
+                return self._refresh(view_name, "snapshot", full, _SnapshotSource(snapshot))
+            with pooled_connection() as conn:
+                return self._refresh(view_name, "snowflake", full, _SnowflakeSource(conn, view_name))
+
+    def _refresh(self, view_name, source_name, full, source) -> dict:
+        cube = self._cubes.get(view_name)
+        max_year, row_count = source.probe()
+        incremental = cube is not None and not full and cube.source == source_name and cube.max_year is not None
+        if incremental and (cube.max_year, cube.source_rows) == (max_year, row_count):
+            return {"view": view_name, "changed": False, "max_year": cube.max_year}
+
+        mode = "full"
+        if incremental:
+            # The cube's latest year may have been loaded only partially, so
+            # it is re-read along with anything newer.
+            columns, integral = source.fetch(min_year=cube.max_year)
+            kept = cube.base.to_columns(np.flatnonzero(cube.base.column("YEAR") < cube.max_year))
+            columns = {name: kept[name] + columns[name] for name in _COLUMN_ORDER}
+            integral &= cube.base.integral
+            mode = "incremental"
+            if sum(columns["ROWS"]) != row_count:
+                mode = "full"
+        if mode == "full":
+            columns, integral = source.fetch()
+
+        cube = RollupCube(view_name, _base_level(columns, integral), source_name)
+        self._cubes[view_name] = cube
+        logger.info("Rebuilt %s rollups (%s): %d base rows", view_name, mode, cube.base.rows)
+        if self.on_change is not None:
+            self.on_change(view_name)
+        return {"view": view_name, "changed": True, "mode": mode, "max_year": cube.max_year, "rows": cube.base.rows}
+
+    def start(self, views, interval: float, on_change=None) -> None:
+        """Build every view's cube in the background and refresh it every *interval* seconds."""
+        self.interval = interval
+        self.on_change = on_change
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(list(views),), name="rollup-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, views) -> None:
+        while not self._stop.is_set():
+            for view_name in views:
+                if self._stop.is_set():
+                    return
+                try:
+                    self.refresh(view_name)
+                except Exception as e:
+                    logger.warning("Could not refresh rollups for %s: %s", view_name, e)
+            self._stop.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "views": {name: cube.stats() for name, cube in sorted(self._cubes.items())},
+        }
+
+
+class _SnapshotSource:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def probe(self):
+        years = self.snapshot.column("YEAR")
+        return (int(years.max()) if self.snapshot.rows else None), self.snapshot.rows
+
+    def fetch(self, min_year=None):
+        snapshot = self.snapshot
+        if not snapshot.is_integral("YEAR"):
+            raise ValueError(f"{snapshot.name} has NULL or fractional years")
+        groups = snapshot.group_by(ROLLUP_DIMENSIONS, snapshot.select(min_year=min_year))
+        columns = {d: groups.key(d) for d in ROLLUP_DIMENSIONS}
+        columns["ROWS"] = groups.count().tolist()
+        for measure in ROLLUP_MEASURES:
+            sums, counts = groups.totals(measure)
+            columns[f"SUM_{measure}"], columns[f"CNT_{measure}"] = sums.tolist(), counts.tolist()
+        return columns, {m for m in ROLLUP_MEASURES if snapshot.is_integral(m)}
+
+
+class _SnowflakeSource:
+    def __init__(self, conn, view_name: str):
+        self.conn = conn
+        self.view_name = view_name
+
+    def probe(self):
+        cursor = self.conn.cursor()
+        try:
+            query = build_query("rollup-probe", self.view_name)
+            cursor.execute(query.sql, query.params)
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        if not row:
+            return None, 0
+        return (int(row[0]) if row[0] is not None else None), int(row[1])
+
+    def fetch(self, min_year=None):
+        cursor = self.conn.cursor()
+        try:
+            query = build_query("rollup-base", self.view_name, min_year=min_year)
+            cursor.execute(query.sql, query.params)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(_COLUMN_ORDER)}
+        integral = {
+            m for m in ROLLUP_MEASURES
+            if all(v is None or float(v).is_integer() for v in columns[f"SUM_{m}"])
+        }
+        return columns, integral
+
+
+def _base_level(columns: dict, integral) -> RollupLevel:
+    arrays = {}
+    dictionaries = {}
+    for name in ROLLUP_DIMENSIONS:
+        values = columns[name]
+        if name == "YEAR":
+            if any(v is None for v in values):
+                raise ValueError("Cannot build rollups over rows with a NULL YEAR")
+            arrays[name] = np.array([int(v) for v in values], dtype=np.int64)
+            continue
+        dictionary = sorted({str(v) for v in values if v is not None})
+        lookup = {value: code for code, value in enumerate(dictionary)}
+        arrays[name] = np.array([lookup[str(v)] if v is not None else -1 for v in values], dtype=np.int32)
+        dictionaries[name] = dictionary
+    arrays["ROWS"] = np.array([int(v) for v in columns["ROWS"]], dtype=np.int64)
+    for measure in ROLLUP_MEASURES:
+        arrays[f"SUM_{measure}"] = np.array(
+            [0.0 if v is None else float(v) for v in columns[f"SUM_{measure}"]], dtype=np.float64
+        )
+        arrays[f"CNT_{measure}"] = np.array([float(v) for v in columns[f"CNT_{measure}"]], dtype=np.float64)
+    return RollupLevel(ROLLUP_DIMENSIONS, len(arrays["ROWS"]), arrays, dictionaries, integral)
+
+
+rollup_store = RollupStore()
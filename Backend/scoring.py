@@ -0,0 +1,344 @@
+"""
+Precomputed should-open scores for every city of a view.
+
+The should-open advice for a target year averages a city's measures over the
+three years before it and adds up a few rules. The scoring engine evaluates
+that for every (province, city, target year) of a view in one pass and keeps
+the result as a table, so the advice endpoints are lookups:
+
+* The (province, city, year) sums and non-NULL counts of each measure come
+  from the rollup cube or snapshot when loaded, else from one grouped
+  Snowflake query, and are stacked into cities x years arrays.
+* Three-year window averages for every target year are sums of shifted
+  slices of those arrays. The features come from them:
+
+  - ``opened_closed_ratio``: average openings over average closures.
+  - ``margin``: revenue minus costs, relative to revenue.
+  - ``policy_score``: average policy impact score.
+  - ``wage_pressure``: yearly growth of the median wage across the window.
+  - ``footfall_trend``: yearly growth of consumer footfall across the window.
+
+* A weighted model turns the features into a score. Each term compares one
+  feature with a threshold and adds its weight when the feature is above it
+  and subtracts it otherwise; NULL features count as below. A term with a
+  scale moves along a ramp that wide instead of jumping. The default model
+  is the original three rules: more openings than closures, revenue above
+  costs and a positive policy score, one point each.
+
+``SCORE_MODEL`` overrides terms of the default model, as comma-separated
+``feature:weight[:threshold[:scale]]`` entries, e.g.
+``wage_pressure:-1:0.03:0.02,footfall_trend:0.5:0:0.05``. Tables are rebuilt
+when the view's data version changes.
+"""
+
+from collections import namedtuple
+import datetime
+import os
+import threading
+
+import numpy as np
+
+from advice import describe, insufficient, rank
+from db import pooled_connection
+from queries import SCORE_MEASURES, build_query
+from rollups import rollup_store
+from snapshot import snapshot_store
+from versions import view_versions
+
+# Years before the target year that its advice is based on
+WINDOW = 3
+
+Term = namedtuple("Term", ["feature", "weight", "threshold", "scale"])
+
+# Feature -> (reason when above the threshold, reason when not)
+FEATURES = {
+    "opened_closed_ratio": ("More businesses are opening than closing.", "Closures are high compared to openings."),
+    "margin": ("Revenue consistently exceeds cost.", "Cost exceeds or matches revenue."),
+    "policy_score": ("Positive policy impact.", "Policies impact are neutral or negative."),
+    "wage_pressure": ("Wages are rising quickly.", "Wage growth is moderate."),
+    "footfall_trend": ("Consumer footfall is growing.", "Consumer footfall is flat or falling."),
+}
+
+DEFAULT_MODEL = (
+    Term("opened_closed_ratio", 1.0, 1.0, 0.0),
+    Term("margin", 1.0, 0.0, 0.0),
+    Term("policy_score", 1.0, 0.0, 0.0),
+    Term("wage_pressure", 0.0, 0.0, 0.0),
+    Term("footfall_trend", 0.0, 0.0, 0.0),
+)
+
+# The five averages reported as key_metrics, in the order of SCORE_MEASURES
+_METRICS = ("avg_opened", "avg_closed", "avg_revenue", "avg_costs", "policy_score")
+
+_KEYS = ["PROVINCE", "CITY_NAME", "YEAR"]
+
+
+def parse_model(value: str, base=DEFAULT_MODEL) -> tuple:
+    """*base* with the terms listed in *value* (``feature:weight[:threshold[:scale]],...``) replaced."""
+    terms = {term.feature: term for term in base}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        feature, *numbers = [part.strip() for part in entry.split(":")]
+        if feature not in FEATURES:
+            raise ValueError(f"Unknown score feature {feature!r}; use one of {', '.join(FEATURES)}")
+        if not 1 <= len(numbers) <= 3:
+            raise ValueError(f"Score term {entry.strip()!r} must be feature:weight[:threshold[:scale]]")
+        current = terms.get(feature, Term(feature, 0.0, 0.0, 0.0))
+        try:
+            weight, threshold, scale = [float(n) for n in numbers] + list(current[len(numbers) + 1:])
+        except ValueError:
+            raise ValueError(f"Score term {entry.strip()!r} has a weight, threshold or scale that is not a number")
+        terms[feature] = Term(feature, weight, threshold, scale)
+    return tuple(terms.values())
+
+
+class ScoreTable:
+    """Features, scores and advice of every (province, city, target year) of one view."""
+
+    def __init__(self, view_name: str, measures, model, source: str, version: str = None):
+        self.view_name = view_name
+        self.model = model
+        self.source = source
+        self.version = version
+        self.built_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        keys, years, rows, sums, counts = measures
+        self.pairs = sorted(set(keys), key=lambda k: (k[0] or "", k[1] or ""))
+        self.index = {pair: i for i, pair in enumerate(self.pairs)}
+        self.first_year = int(years.min()) + 1 if len(years) else 0
+        self.latest_year = int(years.max()) if len(years) else None
+        # Cities x years (padded by WINDOW - 1 empty years on both sides) x measures
+        pad = WINDOW - 1
+        span = int(years.max()) - int(years.min()) + 1 + 2 * pad if len(years) else 0
+        shape = (len(self.pairs), span)
+        pair_rows = np.array([self.index[k] for k in keys], dtype=np.int64)
+        year_cols = (years - years.min() + pad).astype(np.int64) if len(years) else years.astype(np.int64)
+        S = np.zeros(shape + (len(SCORE_MEASURES),))
+        N = np.zeros_like(S)
+        R = np.zeros(shape)
+        np.add.at(S, (pair_rows, year_cols), sums)
+        np.add.at(N, (pair_rows, year_cols), counts)
+        np.add.at(R, (pair_rows, year_cols), rows)
+
+        # Column j is target year first_year + j: the window ends the year before it
+        windows = [slice(k, shape[1] - pad + k) for k in range(WINDOW)]
+        window_sums = sum(S[:, w] for w in windows)
+        window_counts = sum(N[:, w] for w in windows)
+        self.rows = sum(R[:, w] for w in windows)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            averages = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+            yearly = np.where(N > 0, S / N, np.nan)
+            # Growth per year from the window's first year to its last
+            growth = (yearly[:, pad:] - yearly[:, :-pad]) / np.abs(yearly[:, :-pad]) / pad
+        measure = {name: averages[..., SCORE_MEASURES.index(name)] for name in SCORE_MEASURES}
+        growth = {name: growth[..., SCORE_MEASURES.index(name)] for name in SCORE_MEASURES}
+
+        revenue, costs = measure["REVENUE_CAD"], measure["COSTS"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.features = {
+                # 0 / 0 is NaN, openings without closures are inf
+                "opened_closed_ratio": measure["OPENED"] / measure["CLOSED"],
+                # Zero revenue or costs mean missing data, not a margin
+                "margin": np.where((revenue != 0) & (costs != 0), (revenue - costs) / np.abs(revenue), np.nan),
+                "policy_score": measure["IMPACT_SCORE"],
+                "wage_pressure": growth["MEDIAN_WAGE_CAD"],
+                "footfall_trend": growth["CONSUMER_FOOTFALL"],
+            }
+        self.metrics = np.stack(
+            [measure[name] for name in ("OPENED", "CLOSED", "REVENUE_CAD", "COSTS", "IMPACT_SCORE")], axis=-1
+        )
+        self.insufficient = np.isnan(self.metrics).all(axis=-1)
+
+        self.signals = {}
+        self.scores = np.zeros(self.rows.shape)
+        for term in model:
+            signal = self._signal(self.features[term.feature], term)
+            self.signals[term.feature] = signal
+            self.scores += term.weight * signal
+
+        # Best first per target year: highest score, then widest revenue-over-cost margin
+        rounded = np.round(np.nan_to_num(self.metrics), 2)
+        spread = rounded[..., 2] - rounded[..., 3]
+        self.order = [
+            np.lexsort((-spread[:, j], -self.scores[:, j]))
+            for j in range(self.scores.shape[1])
+        ]
+
+    @staticmethod
+    def _signal(values, term):
+        with np.errstate(invalid="ignore"):
+            if term.scale > 0:
+                signal = np.clip((values - term.threshold) / term.scale, -1.0, 1.0)
+            else:
+                signal = np.where(values > term.threshold, 1.0, -1.0)
+        return np.nan_to_num(signal, nan=-1.0)
+
+    def _column(self, year: int):
+        j = year - self.first_year
+        return j if 0 <= j < self.scores.shape[1] else None
+
+    @property
+    def years(self) -> list:
+        return list(range(self.first_year, self.first_year + self.scores.shape[1]))
+
+    @property
+    def next_year(self):
+        """The year after the latest data, or None for an empty view."""
+        return self.latest_year + 1 if self.latest_year is not None else None
+
+    def entry(self, business_type: str, i: int, j: int, features: bool = False) -> dict:
+        """Advice for city row *i* in target-year column *j*."""
+        city = self.pairs[i][1]
+        if self.insufficient[i, j]:
+            return insufficient()
+        terms = [term for term in self.model if term.weight]
+        reasons = [FEATURES[t.feature][0 if self.signals[t.feature][i, j] > 0 else 1] for t in terms]
+        result = describe(
+            business_type, city, float(self.scores[i, j]),
+            dict(zip(_METRICS, np.nan_to_num(self.metrics[i, j]).tolist())), reasons,
+        )
+        if features:
+            result["features"] = {
+                name: None if np.isnan(values[i, j]) or np.isinf(values[i, j]) else round(float(values[i, j]), 4)
+                for name, values in self.features.items()
+            }
+        return result
+
+    def advice(self, business_type: str, city: str, province: str, year: int) -> dict:
+        """The should-open advice for one city."""
+        i = self.index.get((province, city))
+        j = self._column(year)
+        if i is None or j is None:
+            return insufficient()
+        result = self.entry(business_type, i, j)
+        result.pop("score", None)
+        return result
+
+    def batch(self, business_type: str, year: int, province: str = None, cities: list = None) -> dict:
+        """Ranked advice for the cities with data in *year*'s window; requested cities without any are listed last."""
+        j = self._column(year)
+        wanted = set(cities) if cities else None
+        items = []
+        if j is not None:
+            for i, (p, c) in enumerate(self.pairs):
+                if self.rows[i, j] and (not province or p == province) and (wanted is None or c in wanted):
+                    items.append({"city": c, "province": p, **self.entry(business_type, i, j)})
+        found = {item["city"] for item in items}
+        items.extend(
+            {"city": city, "province": None, **insufficient()}
+            for city in dict.fromkeys(cities or []) if city not in found
+        )
+        return {"data": rank(items)}
+
+    def best(self, business_type: str, year: int, province: str = None, limit: int = 10) -> list:
+        """The *limit* highest-scoring cities for *year*, with their features."""
+        j = self._column(year)
+        if j is None:
+            return []
+        result = []
+        for i in self.order[j].tolist():
+            if len(result) >= limit:
+                break
+            p, c = self.pairs[i]
+            if not self.rows[i, j] or self.insufficient[i, j] or (province and p != province):
+                continue
+            result.append({
+                "rank": len(result) + 1, "city": c, "province": p,
+                **self.entry(business_type, i, j, features=True),
+            })
+        return result
+
+
+class ScoringEngine:
+    """Score tables per view, rebuilt after the view changes."""
+
+    def __init__(self, model=DEFAULT_MODEL):
+        self.model = tuple(model)
+        self.builds = 0
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, view_name: str) -> ScoreTable:
+        version = view_versions.version(view_name)
+        table = self._tables.get(view_name)
+        if table is not None and table.version == version:
+            return table
+        # One build per view at a time; concurrent callers wait and reuse it.
+        with self._lock:
+            table = self._tables.get(view_name)
+            if table is not None and table.version == version:
+                return table
+            measures, source = load_measures(view_name)
+            table = ScoreTable(view_name, measures, self.model, source, version)
+            self._tables[view_name] = table
+            self.builds += 1
+            return table
+
+    def invalidate(self, view_name: str) -> bool:
+        with self._lock:
+            return self._tables.pop(view_name, None) is not None
+
+    def stats(self) -> dict:
+        return {
+            "model": [term._asdict() for term in self.model],
+            "builds": self.builds,
+            "views": {
+                name: {
+                    "source": table.source,
+                    "built_at": table.built_at,
+                    "version": table.version,
+                    "cities": len(table.pairs),
+                    "years": [table.years[0], table.years[-1]] if table.years else [],
+                }
+                for name, table in sorted(self._tables.items())
+            },
+        }
+
+
+def load_measures(view_name: str):
+    """
+    ``(keys, years, rows, sums, counts)`` per (province, city, year) of
+    *view_name*, plus where they came from. *sums* and *counts* have one
+    column per ``SCORE_MEASURES`` entry.
+    """
+    cube = rollup_store.get(view_name)
+    snapshot = snapshot_store.get(view_name)
+    if cube is not None:
+        table, source = cube.plan(set(_KEYS)), "rollup"
+    elif snapshot is not None and snapshot.is_integral("YEAR"):
+        table, source = snapshot, "snapshot"
+    else:
+        table, source = None, "snowflake"
+    if table is not None:
+        groups = table.group_by(_KEYS, table.select())
+        totals = [groups.totals(name) for name in SCORE_MEASURES]
+        keys = list(zip(groups.key("PROVINCE"), groups.key("CITY_NAME")))
+        return (
+            keys,
+            np.asarray(groups.key("YEAR"), dtype=np.int64),
+            groups.count().astype(np.float64),
+            np.stack([sums for sums, _ in totals], axis=1),
+            np.stack([counts for _, counts in totals], axis=1),
+        ), source
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        query = build_query("score-base", view_name)
+        cursor.execute(query.sql, query.params)
+        rows = [row for row in cursor.fetchall() if row[2] is not None]
+        cursor.close()
+    width = len(SCORE_MEASURES)
+    values = np.array(
+        [[0.0 if v is None else float(v) for v in row[3:]] for row in rows], dtype=np.float64
+    ).reshape(len(rows), 1 + 2 * width)
+    return (
+        [(row[0], row[1]) for row in rows],
+        np.array([int(row[2]) for row in rows], dtype=np.int64),
+        values[:, 0],
+        values[:, 1::2],
+        values[:, 2::2],
+    ), source
+
+
+scoring_engine = ScoringEngine(parse_model(os.getenv("SCORE_MODEL", "")))
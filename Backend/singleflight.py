@@ -0,0 +1,52 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one execution.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running await that same task instead of starting
+    another, and all of them get its result (or its exception). The task is
+    shielded, so a caller that goes away doesn't cancel the work for the rest.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self._executions = {}
+        self._coalesced = {}
+
+    async def do(self, key: tuple, fn):
+        """Await ``fn()`` for *key*, sharing an execution already in flight."""
+        endpoint = key[0]
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self._executions[endpoint] = self._executions.get(endpoint, 0) + 1
+        else:
+            self._coalesced[endpoint] = self._coalesced.get(endpoint, 0) + 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        endpoints = sorted(set(self._executions) | set(self._coalesced))
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": sum(self._executions.values()),
+            "coalesced": sum(self._coalesced.values()),
+            "endpoints": {
+                name: {"executions": self._executions.get(name, 0), "coalesced": self._coalesced.get(name, 0)}
+                for name in endpoints
+            },
+        }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,476 @@
+"""
+Local columnar snapshots of the ``*_RPT_VW`` report views.
+
+Each view is exported to its own directory with one ``.npy`` file per column
+and a ``manifest.json``. String columns are dictionary-encoded: the ``.npy``
+file holds int32 codes into a sorted ``<COLUMN>.dict.json`` value list, with
+-1 standing for NULL. Numeric columns are stored as int64 when every value is
+a non-NULL integer and as float64 (NaN for NULL) otherwise. POLICY_IMPACT is
+also stored as its int8 ``IMPACT_SCORE`` on the scale in ``impact.py``.
+
+At startup the files are memory-mapped, so loading is instant and pages are
+shared between worker processes. ``local_queries`` answers the aggregate
+endpoints from them with vectorized NumPy group-bys; Snowflake remains the
+refresh source and the fallback for views without a snapshot.
+
+Export every view from Snowflake with::
+
+    python snapshot.py export --dir ./snapshots
+"""
+
+from decimal import Decimal
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from impact import IMPACT_NULL, impact_scale
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "YEAR",
+    "PROVINCE",
+    "CITY_NAME",
+    "OPENED",
+    "CLOSED",
+    "REVENUE_CAD",
+    "RENT_COST_CAD",
+    "UTILITY_COST_CAD_PER_YR",
+    "MEDIAN_WAGE_CAD",
+    "CONSUMER_FOOTFALL",
+    "TOTAL_SALONS",
+    "POLICY_ID",
+    "POLICY_TYPE",
+    "POLICY_IMPACT",
+]
+
+STRING_COLUMNS = {"PROVINCE", "CITY_NAME", "POLICY_ID", "POLICY_TYPE", "POLICY_IMPACT"}
+
+MANIFEST = "manifest.json"
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def write_view(directory: str, view_name: str, columns: dict, source: str = "snowflake") -> str:
+    """
+    Write one view's column lists (``{"YEAR": [...], ...}``) as a snapshot.
+
+    The new snapshot is built next to the old one and swapped in with a
+    rename, so readers never see a half-written directory.
+    """
+    target = os.path.join(directory, view_name)
+    staging = f"{target}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    row_count = None
+    encodings = {}
+    for name in COLUMNS:
+        values = columns.get(name, [])
+        if row_count is None:
+            row_count = len(values)
+        elif len(values) != row_count:
+            raise ValueError(f"Column {name} has {len(values)} rows, expected {row_count}.")
+
+        if name in STRING_COLUMNS:
+            dictionary = sorted({str(v) for v in values if v is not None})
+            lookup = {value: code for code, value in enumerate(dictionary)}
+            codes = np.fromiter(
+                (lookup[str(v)] if v is not None else -1 for v in values),
+                dtype=np.int32,
+                count=len(values),
+            )
+            np.save(os.path.join(staging, f"{name}.npy"), codes)
+            with open(os.path.join(staging, f"{name}.dict.json"), "w", encoding="utf-8") as fh:
+                json.dump(dictionary, fh)
+            encodings[name] = "dictionary"
+        else:
+            array = _numeric_array(values)
+            np.save(os.path.join(staging, f"{name}.npy"), array)
+            encodings[name] = str(array.dtype)
+
+    # Precomputed, so queries aggregate the score instead of mapping labels
+    np.save(os.path.join(staging, "IMPACT_SCORE.npy"), impact_scale.encode(columns.get("POLICY_IMPACT", [])))
+    encodings["IMPACT_SCORE"] = "int8"
+
+    manifest = {
+        "view": view_name,
+        "rows": row_count or 0,
+        "columns": encodings,
+        "impact_scale": impact_scale.version,
+        "source": source,
+        "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+
+    previous = f"{target}.old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(target):
+        os.rename(target, previous)
+    os.rename(staging, target)
+    shutil.rmtree(previous, ignore_errors=True)
+    return target
+
+
+def export_view(conn, view_name: str, directory: str, batch_size: int = 50000) -> str:
+    """Pull every row of *view_name* from Snowflake and write it as a snapshot."""
+    columns = {name: [] for name in COLUMNS}
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(COLUMNS)} FROM {view_name}")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            for row in batch:
+                for name, value in zip(COLUMNS, row):
+                    columns[name].append(value)
+    finally:
+        cursor.close()
+    return write_view(directory, view_name, columns)
+
+
+def _numeric_array(values) -> np.ndarray:
+    integral = all(
+        v is not None
+        and not isinstance(v, bool)
+        and (isinstance(v, int) or (isinstance(v, Decimal) and v == v.to_integral_value()))
+        for v in values
+    )
+    if integral:
+        return np.array([int(v) for v in values], dtype=np.int64)
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+class ColumnTable:
+    """
+    Dictionary-encoded columns plus the filter and group-by helpers the local
+    queries are written against.
+
+    Aggregates go through ``measure()``, which returns per-row partial sums
+    and non-NULL counts. On raw rows those are the value itself and 0/1; a
+    pre-aggregated table (``rollups.RollupLevel``) returns its stored sums and
+    counts instead, so the same SUM/AVG code answers from either.
+    """
+
+    def __init__(self, rows: int, columns: dict, dictionaries: dict):
+        self.rows = rows
+        self._columns = columns
+        self._dictionaries = dictionaries
+        self._lookups = {
+            name: {value: code for code, value in enumerate(dictionary)}
+            for name, dictionary in dictionaries.items()
+        }
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column: codes for string columns, values for numeric ones."""
+        return self._columns[name]
+
+    def is_string(self, name: str) -> bool:
+        return name in self._dictionaries
+
+    def is_integral(self, column) -> bool:
+        return (
+            isinstance(column, str)
+            and not self.is_string(column)
+            and np.asarray(self.column(column)).dtype.kind in "iu"
+        )
+
+    def decode(self, name: str, codes) -> list:
+        dictionary = self._dictionaries[name]
+        return [dictionary[c] if c >= 0 else None for c in np.asarray(codes).tolist()]
+
+    def dictionary(self, name: str) -> list:
+        return self._dictionaries[name]
+
+    def code_of(self, name: str, value) -> int:
+        return self._lookups[name].get(str(value), -2)  # -2 never matches a row
+
+    def measure(self, column, rows: np.ndarray):
+        """Per-row (partial sum, non-NULL count) of *column* over *rows*."""
+        values = np.asarray(self.column(column) if isinstance(column, str) else column)[rows]
+        valid = self.valid(column, values)
+        if valid is not None:
+            return np.where(valid, values, 0), valid.astype(np.float64)
+        return values, np.ones(len(values), dtype=np.float64)
+
+    def valid(self, column, values: np.ndarray):
+        """Non-NULL mask of *values* of *column*, or None when none can be NULL."""
+        if values.dtype.kind == "f":
+            return ~np.isnan(values)
+        if isinstance(column, str) and column == "IMPACT_SCORE":
+            return values != IMPACT_NULL
+        return None
+
+    def row_weights(self, rows: np.ndarray) -> np.ndarray:
+        """How many source rows each of *rows* stands for."""
+        return np.ones(len(rows), dtype=np.int64)
+
+    def select(
+        self,
+        province=None,
+        city=None,
+        year=None,
+        policy_type=None,
+        years=None,
+        cities=None,
+        min_year=None,
+        max_year=None,
+    ) -> np.ndarray:
+        """Indices of the rows matching the endpoint filters."""
+        mask = np.ones(self.rows, dtype=bool)
+        if province:
+            mask &= self._columns["PROVINCE"] == self.code_of("PROVINCE", province)
+        if city:
+            mask &= self._columns["CITY_NAME"] == self.code_of("CITY_NAME", city)
+        if cities is not None:
+            codes = [self.code_of("CITY_NAME", c) for c in cities]
+            mask &= np.isin(self._columns["CITY_NAME"], codes)
+        if policy_type:
+            mask &= self._columns["POLICY_TYPE"] == self.code_of("POLICY_TYPE", policy_type)
+        if year or years is not None or min_year or max_year:
+            year_column = self._columns["YEAR"]
+            if year:
+                mask &= year_column == year
+            if years is not None:
+                mask &= np.isin(year_column, list(years))
+            if min_year:
+                mask &= year_column >= min_year
+            if max_year:
+                mask &= year_column <= max_year
+        return np.flatnonzero(mask)
+
+    def group_by(self, keys: list, rows: np.ndarray) -> "GroupBy":
+        return GroupBy(self, keys, rows)
+
+
+class ViewSnapshot(ColumnTable):
+    """Memory-mapped columns of one view."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as fh:
+            self.manifest = json.load(fh)
+
+        columns = {}
+        dictionaries = {}
+        for column in COLUMNS:
+            columns[column] = np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+            if column in STRING_COLUMNS:
+                with open(os.path.join(path, f"{column}.dict.json"), encoding="utf-8") as fh:
+                    dictionaries[column] = json.load(fh)
+        super().__init__(int(self.manifest["rows"]), columns, dictionaries)
+        self._impact_scores = None
+        if self.manifest.get("impact_scale") == impact_scale.version:
+            self._impact_scores = np.load(os.path.join(path, "IMPACT_SCORE.npy"), mmap_mode="r")
+        self._costs = None
+
+    def column(self, name: str) -> np.ndarray:
+        if name == "IMPACT_SCORE":
+            return self.impact_scores()
+        if name == "COSTS":
+            return self.costs()
+        return self._columns[name]
+
+    def impact_scores(self) -> np.ndarray:
+        """POLICY_IMPACT as its int8 score (``IMPACT_NULL`` where unmapped or NULL)."""
+        if self._impact_scores is None:
+            # Exported before the precomputed column or under another scale:
+            # encode from the dictionary; code -1 (NULL) indexes the trailing NULL
+            self._impact_scores = impact_scale.lookup(self._dictionaries["POLICY_IMPACT"])[self._columns["POLICY_IMPACT"]]
+        return self._impact_scores
+
+    def costs(self) -> np.ndarray:
+        """RENT_COST_CAD + UTILITY_COST_CAD_PER_YR (NULL where either is)."""
+        if self._costs is None:
+            self._costs = np.asarray(self._columns["RENT_COST_CAD"]) + np.asarray(self._columns["UTILITY_COST_CAD_PER_YR"])
+        return self._costs
+
+
+class GroupBy:
+    """
+    Vectorized GROUP BY over a row selection with SQL aggregate semantics:
+    NULLs are ignored, and SUM/AVG/MIN/MAX of a group with no values is NULL.
+    With no keys the whole selection forms one group, even when it is empty.
+    """
+
+    def __init__(self, table: ColumnTable, keys: list, rows: np.ndarray):
+        self.table = table
+        self.keys = list(keys)
+        self.rows = rows
+        if self.keys:
+            stacked = np.stack(
+                [np.asarray(table.column(k))[rows].astype(np.int64) for k in self.keys], axis=1
+            )
+            self._unique, self.inverse = np.unique(stacked, axis=0, return_inverse=True)
+            self.inverse = self.inverse.reshape(-1)
+            self.size = len(self._unique)
+        else:
+            self._unique = np.empty((1, 0), dtype=np.int64)
+            self.inverse = np.zeros(len(rows), dtype=np.int64)
+            self.size = 1
+
+    def key(self, name: str) -> list:
+        values = self._unique[:, self.keys.index(name)]
+        if self.table.is_string(name):
+            return self.table.decode(name, values)
+        return values.tolist()
+
+    def key_codes(self, name: str) -> np.ndarray:
+        return self._unique[:, self.keys.index(name)]
+
+    def _values(self, column):
+        if isinstance(column, str):
+            return np.asarray(self.table.column(column))[self.rows]
+        return np.asarray(column)[self.rows]
+
+    def _valid(self, column, values):
+        valid = self.table.valid(column, values)
+        if valid is not None:
+            return values[valid], self.inverse[valid]
+        return values, self.inverse
+
+    def count(self) -> np.ndarray:
+        weights = self.table.row_weights(self.rows)
+        return np.bincount(self.inverse, weights=weights, minlength=self.size).astype(np.int64)
+
+    def totals(self, column):
+        """Per-group (sum, non-NULL count) arrays of *column*."""
+        values, counts = self.table.measure(column, self.rows)
+        sums = np.bincount(self.inverse, weights=values, minlength=self.size)
+        return sums, np.bincount(self.inverse, weights=counts, minlength=self.size)
+
+    def sum(self, column) -> list:
+        totals, counts = self.totals(column)
+        integral = self.table.is_integral(column)
+        return [
+            (int(round(t)) if integral else float(t)) if c else None
+            for t, c in zip(totals.tolist(), counts.tolist())
+        ]
+
+    def mean(self, column) -> list:
+        totals, counts = self.totals(column)
+        return [t / c if c else None for t, c in zip(totals.tolist(), counts.tolist())]
+
+    def max(self, column) -> list:
+        return self._extreme(column, np.maximum, -np.inf)
+
+    def min(self, column) -> list:
+        return self._extreme(column, np.minimum, np.inf)
+
+    def count_distinct(self, column) -> list:
+        values, groups = self._valid(column, self._values(column))
+        if isinstance(column, str) and self.table.is_string(column):
+            keep = values >= 0
+            values, groups = values[keep], groups[keep]
+        pairs = np.unique(np.stack([groups, values.astype(np.float64)], axis=1), axis=0)
+        return np.bincount(pairs[:, 0].astype(np.int64), minlength=self.size).tolist()
+
+    def _extreme(self, column, ufunc, start) -> list:
+        values, groups = self._valid(column, self._values(column))
+        out = np.full(self.size, start, dtype=np.float64)
+        ufunc.at(out, groups, values.astype(np.float64))
+        counts = np.bincount(groups, minlength=self.size)
+        integral = values.dtype.kind in "iu"
+        return [
+            (int(v) if integral else v) if c else None
+            for v, c in zip(out.tolist(), counts.tolist())
+        ]
+
+
+class SnapshotStore:
+    """Registry of loaded view snapshots, keyed by view name."""
+
+    def __init__(self):
+        self.directory = None
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def load(self, directory: str, views) -> list:
+        self.directory = directory
+        loaded = []
+        for view_name in views:
+            path = os.path.join(directory, view_name)
+            if not os.path.exists(os.path.join(path, MANIFEST)):
+                continue
+            try:
+                snapshot = ViewSnapshot(view_name, path)
+            except Exception as e:
+                logger.warning("Could not load snapshot for %s: %s", view_name, e)
+                continue
+            with self._lock:
+                self._views[view_name] = snapshot
+            loaded.append(view_name)
+        return loaded
+
+    def refresh(self, conn, view_name: str) -> ViewSnapshot:
+        if not self.directory:
+            raise RuntimeError("Snapshot mode is not enabled (set SNAPSHOT_DIR).")
+        path = export_view(conn, view_name, self.directory)
+        snapshot = ViewSnapshot(view_name, path)
+        with self._lock:
+            self._views[view_name] = snapshot
+        return snapshot
+
+    def get(self, view_name: str):
+        return self._views.get(view_name)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "views": {
+                name: {
+                    "rows": s.rows,
+                    "exported_at": s.manifest.get("exported_at"),
+                    "source": s.manifest.get("source"),
+                    "impact_scale": s.manifest.get("impact_scale"),
+                }
+                for name, s in sorted(self._views.items())
+            },
+        }
+
+
+snapshot_store = SnapshotStore()
+
+
+def main():
+    from db import get_snowflake_connection
+    from views import VIEW_MAP
+
+    parser = argparse.ArgumentParser(description="Export report views to local columnar snapshots.")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--dir", default=os.getenv("SNAPSHOT_DIR", "snapshots"))
+    parser.add_argument("--types", nargs="*", default=list(VIEW_MAP), help="Business types to export.")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    conn = get_snowflake_connection()
+    try:
+        for business_type in args.types:
+            view_name = VIEW_MAP[business_type.lower()]
+            path = export_view(conn, view_name, args.dir)
+            print(f"Exported {view_name} -> {path}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Streaming responses for the row-level endpoints.
+
+Instead of ``fetchall()`` plus a dict per row, rows are pulled from the cursor
+in batches and written out as they arrive, either as NDJSON (one JSON object
+per line) or as an Arrow IPC stream. Memory per request is bounded by the
+batch size, and the first bytes go out as soon as the first batch is fetched.
+
+The format comes from ``?format=json|ndjson|arrow`` or, failing that, the
+Accept header; plain JSON keeps the buffered response. Arrow needs the
+optional ``pyarrow`` package, which is also what the Snowflake connector uses
+to hand out result batches without building Python rows.
+"""
+
+from decimal import Decimal
+import datetime
+import io
+import json
+import logging
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from db import pooled_connection
+from executor import query_executor
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+NDJSON = "application/x-ndjson"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+MEDIA_TYPES = {"ndjson": NDJSON, "arrow": ARROW_STREAM}
+
+# Accept header media type -> format
+ACCEPTED = {
+    "application/json": "json",
+    NDJSON: "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    ARROW_STREAM: "arrow",
+}
+
+BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "5000"))
+
+_DONE = object()
+
+
+def negotiate(format: str = None, accept: str = None) -> str:
+    """Pick ``json``, ``ndjson`` or ``arrow`` from the query parameter or Accept header."""
+    if format:
+        chosen = format.lower()
+        if chosen not in ("json", "ndjson", "arrow"):
+            raise HTTPException(status_code=400, detail="Unsupported format; use json, ndjson or arrow.")
+    else:
+        chosen = "json"
+        for part in (accept or "").split(","):
+            media_type = part.split(";", 1)[0].strip().lower()
+            if media_type in ACCEPTED:
+                chosen = ACCEPTED[media_type]
+                break
+    if chosen == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output needs pyarrow installed on the server.")
+    return chosen
+
+
+def stream_query(endpoint: str, fmt: str, query, fields, constants=None, batch_size: int = BATCH_SIZE):
+    """
+    Stream the rows of *query* (a ``queries.Query``) as *fmt*.
+
+    *fields* names the selected columns in order, with the Arrow type alias
+    of each (``"string"``, ``"int64"``, ...); *constants* are extra fields
+    added to every record.
+    """
+    constants = dict(constants or {})
+    if fmt == "arrow":
+        chunks = _arrow_chunks(query, fields, constants, batch_size)
+    else:
+        chunks = _ndjson_chunks(query, [name for name, _ in fields], constants, batch_size)
+    return StreamingResponse(_drain(endpoint, chunks), media_type=MEDIA_TYPES[fmt])
+
+
+async def _drain(endpoint, chunks):
+    # Each fetch is blocking connector work, so it goes through the query
+    # executor like any other handler; the event loop only forwards bytes.
+    try:
+        while True:
+            chunk = await query_executor.run(endpoint, next, chunks, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    except Exception:
+        logger.exception("Streaming %s failed mid-response", endpoint)
+        raise
+    finally:
+        # Releases the cursor and the pooled connection if the client went away
+        try:
+            chunks.close()
+        except ValueError:
+            # Still running on a worker after a cancellation; the generator
+            # closes itself when it is garbage collected.
+            pass
+
+
+def _batches(query, batch_size):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query.sql, query.params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+def _ndjson_chunks(query, names, constants, batch_size):
+    for rows in _batches(query, batch_size):
+        lines = [json.dumps({**dict(zip(names, row)), **constants}, default=_json_default) for row in rows]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _arrow_chunks(query, fields, constants, batch_size):
+    schema = pa.schema(
+        [(name, pa.type_for_alias(alias)) for name, alias in fields]
+        + [(name, pa.scalar(value).type) for name, value in constants.items()]
+    )
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield _take(sink)  # schema message
+        for columns in _arrow_columns(query, batch_size):
+            writer.write_table(_conform(columns, schema, constants))
+            yield _take(sink)
+    yield _take(sink)  # end-of-stream marker
+
+
+def _arrow_columns(query, batch_size):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query.sql, query.params)
+            if hasattr(cursor, "fetch_arrow_batches"):
+                # Snowflake's result chunks, already columnar
+                for table in cursor.fetch_arrow_batches():
+                    yield table.columns
+                return
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [pa.array([row[i] for row in rows]) for i in range(len(rows[0]))]
+        finally:
+            cursor.close()
+
+
+def _conform(columns, schema, constants):
+    length = len(columns[0]) if columns else 0
+    arrays = [column.cast(field.type) for column, field in zip(columns, schema)]
+    arrays += [pa.array([value] * length, type=schema.field(name).type) for name, value in constants.items()]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _take(sink) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -0,0 +1,234 @@
+"""
+Data versions of the report views.
+
+Every view has an opaque version string and the time it last changed.
+Anything derived from a view's data keys on the version: query-cache
+entries, HTTP validators, forecast fits and filter indexes. A change to the
+view is then a new key, not a scan for stale entries.
+
+Versions come from a cheap probe of each view, run every
+``VERSION_PROBE_INTERVAL`` seconds. The ``VERSION_PROBE`` setting picks how:
+
+* ``hash`` (default): ``COUNT(*)`` and ``HASH_AGG(*)`` over the view, which
+  changes with any row. Snowflake answers a repeat of it from its result
+  cache while the underlying tables are unchanged, so most probes are free.
+* ``count``: ``MAX(YEAR)`` and ``COUNT(*)``; cheaper, but blind to in-place
+  updates.
+* ``last_altered``: the newest ``LAST_ALTERED`` of the tables behind the view,
+  from ``INFORMATION_SCHEMA.TABLES``. The tables are listed in
+  ``VERSION_PROBE_TABLES`` as ``VIEW=TABLE|TABLE;VIEW=...``. Views without
+  tables listed fall back to ``hash``.
+
+The version is a hash of the probe result, plus the export time of the
+view's snapshot when one is loaded, so every process derives the same one.
+Until the first probe answers, a view has a placeholder version. It is
+random per process unless ``DEPLOY_ID`` is set, so a restart never revives
+ETags of older data; workers then disagree, which only costs full answers
+instead of 304s. Setting ``DEPLOY_ID`` to something that changes with each
+release (a commit or build ID) makes every worker of the release share the
+placeholder, on the promise that the data does not change under it without
+a probe noticing. ``VERSION_PROBE_INTERVAL=0`` turns the probe off; views
+then keep the placeholder and get a new local version, unique to this
+process, whenever it sees them change (a rollup rebuild, an admin refresh).
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import secrets
+import threading
+
+from db import pooled_connection
+from queries import build_query
+from snapshot import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("hash", "count", "last_altered")
+
+
+class ViewVersions:
+    """Current data version and change time per view name."""
+
+    def __init__(self):
+        # Never the same for two processes, so restarts cannot repeat a version
+        self._nonce = secrets.token_hex(4)
+        deploy_id = os.getenv("DEPLOY_ID")
+        self._placeholder = f"local-{fingerprint_version(('placeholder', deploy_id))[:8] if deploy_id else self._nonce}"
+        self._started = _now()
+        self._generation = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, view_name: str):
+        """``(version, changed_at)`` of *view_name*."""
+        return self._versions.get(view_name, (self._placeholder, self._started))
+
+    def version(self, view_name: str) -> str:
+        return self.get(view_name)[0]
+
+    def published(self, view_name: str):
+        """Version a probe published for *view_name*, or None before the first."""
+        entry = self._versions.get(view_name)
+        return entry[0] if entry is not None else None
+
+    def publish(self, view_name: str, fingerprint, changed_at: datetime.datetime = None) -> bool:
+        """Set *view_name*'s version from a probe *fingerprint*; True if it changed."""
+        version = fingerprint_version(fingerprint)
+        with self._lock:
+            current = self._versions.get(view_name)
+            if current is not None and current[0] == version:
+                return False
+            self._versions[view_name] = (version, _http_time(changed_at) if changed_at else _now())
+            return True
+
+    def bump(self, view_name: str) -> str:
+        """Give *view_name* a new local version, for changes seen without the probe."""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self.publish(view_name, (self._placeholder, self._nonce, generation))
+        return self.version(view_name)
+
+    def stats(self) -> dict:
+        return {
+            name: {"version": version, "changed_at": changed_at.isoformat()}
+            for name, (version, changed_at) in sorted(self._versions.items())
+        }
+
+
+class VersionProbe:
+    """Polls each view's data fingerprint and publishes changes to ``view_versions``."""
+
+    def __init__(self, versions: ViewVersions):
+        self.versions = versions
+        self.strategy = os.getenv("VERSION_PROBE", "hash").lower()
+        self.tables = _parse_tables(os.getenv("VERSION_PROBE_TABLES", ""))
+        self.interval = None
+        self.prepare = None
+        self.on_change = None
+        self.probes = 0
+        self.changes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Set once every view has been probed, so warm-ups key on real versions
+        self.ready = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def probe(self, view_name: str) -> bool:
+        """Probe *view_name* now; True if its version changed."""
+        with self._lock:
+            fingerprint, changed_at = self._fingerprint(view_name)
+            self.probes += 1
+            current = self.versions.published(view_name)
+            if fingerprint_version(fingerprint) == current:
+                return False
+            # Local copies (rollup cubes) catch up before anything is keyed
+            # on the new version, so nothing stale gets cached under it. The
+            # first probe only replaces the placeholder; they are fresh then.
+            if self.prepare is not None and current is not None:
+                self.prepare(view_name)
+            self.versions.publish(view_name, fingerprint, changed_at)
+            self.changes += 1
+        logger.info("Data version of %s is now %s", view_name, self.versions.version(view_name))
+        if self.on_change is not None:
+            self.on_change(view_name)
+        return True
+
+    def _fingerprint(self, view_name):
+        snapshot = snapshot_store.get(view_name)
+        local = snapshot.manifest.get("exported_at") if snapshot is not None else None
+        tables = self.tables.get(view_name.upper())
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if self.strategy == "last_altered" and tables:
+                    placeholders = ", ".join("?" * len(tables))
+                    cursor.execute(
+                        "SELECT MAX(LAST_ALTERED) FROM INFORMATION_SCHEMA.TABLES "
+                        f"WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME IN ({placeholders})",
+                        tables,
+                    )
+                    (last_altered,) = cursor.fetchone()
+                    return (last_altered, local), last_altered
+                template = "rollup-probe" if self.strategy == "count" else "version-probe"
+                query = build_query(template, view_name)
+                cursor.execute(query.sql, query.params)
+                return (tuple(cursor.fetchone()), local), None
+            finally:
+                cursor.close()
+
+    def start(self, views, interval: float, prepare=None, on_change=None) -> None:
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"VERSION_PROBE must be one of {', '.join(STRATEGIES)}, not {self.strategy!r}")
+        self.interval = interval
+        self.prepare = prepare
+        self.on_change = on_change
+        self.ready.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(list(views),), name="version-probe", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, views) -> None:
+        while not self._stop.is_set():
+            for view_name in views:
+                if self._stop.is_set():
+                    return
+                try:
+                    self.probe(view_name)
+                except Exception as e:
+                    self.failures += 1
+                    logger.warning("Could not probe the data version of %s: %s", view_name, e)
+            self.ready.set()
+            self._stop.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "interval_seconds": self.interval,
+            "probes": self.probes,
+            "changes": self.changes,
+            "failures": self.failures,
+            "views": self.versions.stats(),
+        }
+
+
+def fingerprint_version(fingerprint) -> str:
+    return hashlib.sha256(repr(fingerprint).encode("utf-8")).hexdigest()[:16]
+
+
+def _parse_tables(value: str) -> dict:
+    # "SALON_RPT_VW=SALONS|POLICIES;CAFE_RPT_VW=CAFES" -> {view: [tables]}
+    tables = {}
+    for entry in value.split(";"):
+        view_name, _, names = entry.partition("=")
+        if view_name.strip() and names.strip():
+            tables[view_name.strip().upper()] = [t.strip().upper() for t in names.split("|") if t.strip()]
+    return tables
+
+
+def _http_time(value) -> datetime.datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).replace(microsecond=0)
+
+
+def _now() -> datetime.datetime:
+    # HTTP dates have whole seconds
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+view_versions = ViewVersions()
+version_probe = VersionProbe(view_versions)
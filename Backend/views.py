@@ -0,0 +1,7 @@
+VIEW_MAP = {
+    "salon": "SALON_RPT_VW",
+    "cafe": "CAFE_RPT_VW",
+    "restaurant": "RESTAURANT_RPT_VW",
+    "retail": "RETAIL_RPT_VW",
+    "pharmacy": "PHARMACY_RPT_VW"
+}
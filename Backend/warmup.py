@@ -0,0 +1,239 @@
+"""
+Cache warm-up for the insight endpoints.
+
+After a deploy or a data change the first visitors would otherwise pay for
+every cold query. The warm-up replays a plan of requests against the app
+in-process, through the same handlers, caches and executor limits as real
+traffic, so the results are cached before anyone asks for them.
+
+The plan is the ``WARMUP_TOP_N`` most frequent successful GETs in the access
+logs matching ``WARMUP_ACCESS_LOG`` (a glob; uvicorn's and nginx's formats
+both work). Without logs, or with nothing for the views being warmed, it is
+every ``WARMUP_ROUTES`` route for each business type: unfiltered, for the
+latest year, and for each province in the latest year.
+
+It runs on startup, once the first data versions are known, and again for a
+view whenever its version changes. ``WARMUP_CONCURRENCY`` requests run at a
+time; 0 turns warm-up off.
+"""
+
+import asyncio
+import collections
+import datetime
+import glob
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from filter_index import filter_indexes
+from inprocess import call
+from views import VIEW_MAP
+
+logger = logging.getLogger(__name__)
+
+# What a dashboard visit loads first
+DEFAULT_ROUTES = [
+    "/api/insights/dashboard",
+    "/api/insights/revenue-by-type-kpi",
+    "/api/insights/cost-breakdown",
+    "/api/insights/wage-trends",
+    "/api/insights/policy-distribution",
+    "/api/insights/policy-impact-trend",
+    "/api/advice/best-cities",
+]
+
+# The request line of a common/combined or uvicorn access log entry
+_REQUEST_LINE = re.compile(r'"GET (/api/[^ "]+) HTTP/[\d.]+" (\d{3})')
+
+
+def access_log_plan(pattern: str, view_names, top_n: int) -> list:
+    """The *top_n* most requested (path, params) in the logs matching *pattern* that read *view_names*."""
+    counts = collections.Counter()
+    for log_path in sorted(glob.glob(pattern)):
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = _REQUEST_LINE.search(line)
+                if match is None or match.group(2) not in ("200", "304"):
+                    continue
+                url = urlsplit(match.group(1))
+                if url.path.startswith("/api/admin/"):
+                    continue
+                params = tuple(sorted(parse_qsl(url.query)))
+                if _reads(dict(params).get("type", ""), view_names):
+                    counts[(url.path, params)] += 1
+    return [(path, dict(params)) for (path, params), _ in counts.most_common(top_n)]
+
+
+def grid_plan(routes, view_names, top_n: int) -> list:
+    """Every route per type of *view_names*: unfiltered, latest year, then each province in it."""
+    levels = ([], [], [])
+    for business_type, view_name in VIEW_MAP.items():
+        if view_name not in view_names:
+            continue
+        try:
+            index = filter_indexes.get(view_name)
+        except Exception as e:
+            logger.warning("Could not plan the warm-up of %s: %s", view_name, e)
+            continue
+        years = [year for year in index.values["years"] if year is not None]
+        levels[0].append({"type": business_type})
+        if years:
+            latest = max(years)
+            levels[1].append({"type": business_type, "year": latest})
+            levels[2].extend(
+                {"type": business_type, "province": province, "year": latest}
+                for province in index.values["provinces"] if province is not None
+            )
+    # Broadest first, so a small top_n still covers every type
+    return [(route, params) for level in levels for params in level for route in routes][:top_n]
+
+
+def _reads(type_param: str, view_names) -> bool:
+    types = [t.strip().lower() for t in type_param.split(",")]
+    if types == ["all"]:
+        types = list(VIEW_MAP)
+    return any(VIEW_MAP.get(t) in view_names for t in types)
+
+
+class Warmup:
+    """Replays warm-up plans against the app, one at a time, for the views scheduled."""
+
+    def __init__(self):
+        self.routes = [r.strip() for r in os.getenv("WARMUP_ROUTES", ",".join(DEFAULT_ROUTES)).split(",") if r.strip()]
+        self.access_log = os.getenv("WARMUP_ACCESS_LOG", "")
+        self.top_n = int(os.getenv("WARMUP_TOP_N", "500"))
+        self.concurrency = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+        self.ready_timeout = float(os.getenv("WARMUP_READY_TIMEOUT", "60"))
+        self.runs = 0
+        self.current = None
+        self.last = None
+        self._app = None
+        self._loop = None
+        self._ready = None
+        self._pending = set()
+        self._task = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.concurrency > 0
+
+    def start(self, app, ready=None) -> None:
+        """Bind to *app* and the running loop; runs wait for the *ready* event, if any."""
+        self._app = app
+        self._loop = asyncio.get_running_loop()
+        self._ready = ready
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        self._pending.clear()
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self._loop = None
+
+    def schedule(self, view_names) -> None:
+        """Warm *view_names* up soon. Safe to call from any thread."""
+        if not self.enabled or self._loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._enqueue(list(view_names))
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, list(view_names))
+
+    async def wait(self) -> None:
+        """Until everything scheduled so far has been warmed up."""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    def _enqueue(self, view_names) -> None:
+        self._pending.update(view_names)
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        if self._ready is not None and not self._ready.is_set():
+            await asyncio.to_thread(self._ready.wait, self.ready_timeout)
+        # Views scheduled while a run is going are picked up by the next one
+        while self._pending:
+            view_names = sorted(self._pending)
+            self._pending.clear()
+            try:
+                await self.run(view_names)
+            except Exception:
+                logger.exception("Warm-up of %s failed", ", ".join(view_names))
+
+    async def run(self, view_names) -> dict:
+        """Replay the plan for *view_names*; returns the run's summary."""
+        plan, source = await asyncio.to_thread(self.plan, view_names)
+        progress = self.current = {
+            "views": list(view_names),
+            "source": source,
+            "total": len(plan),
+            "done": 0,
+            "failed": 0,
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        started = time.perf_counter()
+        logger.info("Warming up %d requests for %s from the %s", len(plan), ", ".join(view_names), source)
+        pending = iter(plan)
+        step = max(100, len(plan) // 10)
+
+        async def worker():
+            for path, params in pending:
+                try:
+                    status, _ = await call(self._app, path, params, extra={"warmup": True})
+                except Exception:
+                    status = None
+                if status is None or status >= 400:
+                    progress["failed"] += 1
+                    logger.debug("Warm-up request %s %s failed with %s", path, params, status)
+                progress["done"] += 1
+                if progress["done"] % step == 0 and progress["done"] < len(plan):
+                    logger.info("Warm-up %d/%d", progress["done"], len(plan))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(plan)) or 1)))
+        finally:
+            progress["duration_seconds"] = round(time.perf_counter() - started, 3)
+            self.current = None
+            self.last = progress
+            self.runs += 1
+        logger.info(
+            "Warmed up %d requests (%d failed) for %s in %.1fs",
+            progress["done"], progress["failed"], ", ".join(view_names), progress["duration_seconds"],
+        )
+        return progress
+
+    def plan(self, view_names):
+        if self.access_log:
+            plan = access_log_plan(self.access_log, view_names, self.top_n)
+            if plan:
+                return plan, "access log"
+        return grid_plan(self.routes, view_names, self.top_n), "route grid"
+
+    def stats(self) -> dict:
+        current = self.current
+        if current is not None:
+            started = datetime.datetime.fromisoformat(current["started_at"])
+            elapsed = datetime.datetime.now(datetime.timezone.utc) - started
+            current = {**current, "elapsed_seconds": round(elapsed.total_seconds(), 3)}
+        return {
+            "enabled": self.enabled,
+            "concurrency": self.concurrency,
+            "access_log": self.access_log or None,
+            "routes": self.routes,
+            "top_n": self.top_n,
+            "runs": self.runs,
+            "pending": sorted(self._pending),
+            "current": current,
+            "last": self.last,
+        }
+
+
+warmup = Warmup()
@@ -4,18 +4,58 @@ Daily cross-repo maintenance bot.
 Runs from niketbhatt2002/BizRipple, targets all three repos in a
 deterministic daily rotation, creates exactly 1 PR/day with ≥ 9 real
 maintenance commits.
+
+Commits are written one Contents API call per file (``write_mode:
+contents``, the default and the cheapest), or collected and pushed together
+through the Git Data API (``write_mode: batched``): one tree and commit per
+change, then a single ref update. Batched runs make about twice the calls
+and writes; what they buy is that the branch moves (and CI fires) once.
+
+Repos are checked in parallel, up to ``max_parallel_repos`` at a time, and
+claim PRs in rotation order so ``max_prs_per_day_total`` picks the same repos
+as a one-by-one run. Every request goes through one token bucket that follows
+GitHub's rate-limit headers, and repeated GETs are sent as conditional
+requests (``If-None-Match``) that cost no quota when answered 304.
 """
 
+import base64
+import concurrent.futures
 import datetime
+import hashlib
+import json
 import os
 import sys
+import threading
+import time
 
 import yaml
-from github import Github, GithubException
+from github import Github, GithubException, InputGitTreeElement
+from github.Requester import (
+    HTTPRequestsConnectionClass,
+    HTTPSRequestsConnectionClass,
+    Requester,
+    RequestsResponse,
+)
+from urllib3.util.retry import Retry
 
 # Hard cap on the number of ops-note files created in a single run.
 MAX_OPS_NOTES = 50
 
+WRITE_MODES = ("contents", "batched")
+
+# GitHub asks for at least a second between content-creating requests.
+SECONDS_BETWEEN_WRITES = 1.0
+# How often a rate-limited request is retried, and the longest pause waited
+# out; a longer one (an exhausted hourly quota) fails the run instead.
+RATE_LIMIT_RETRIES = 5
+MAX_RATE_LIMIT_WAIT = 900
+# Secondary rate limits without a Retry-After: wait at least a minute.
+SECONDARY_RATE_LIMIT_WAIT = 60
+# Below this many requests left, the bucket spreads the rest until the reset,
+# but sends no fewer than MIN_RATE requests per second.
+LOW_QUOTA = 100
+MIN_RATE = 1.0
+
 
 # ---------------------------------------------------------------------------
 # Config / auth
@@ -33,6 +73,253 @@ def utc_today() -> datetime.date:
     return datetime.datetime.now(datetime.timezone.utc).date()
 
 
+_output_lock = threading.Lock()
+
+
+def log(message: str, **kwargs) -> None:
+    """``print`` that keeps lines from parallel repos whole."""
+    with _output_lock:
+        print(message, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# HTTP: rate limiting and conditional requests
+# ---------------------------------------------------------------------------
+
+class RateLimiter:
+    """
+    Token bucket shared by every request of a run, across threads.
+
+    Requests go out at up to *rate* per second, in bursts of up to *burst*;
+    writes are also kept *write_interval* seconds apart. GitHub's response
+    headers steer it: a ``Retry-After`` or an exhausted
+    ``X-RateLimit-Remaining`` pauses every thread until the time given, and a
+    quota below ``LOW_QUOTA`` slows the bucket down towards spreading the
+    rest until ``X-RateLimit-Reset``.
+
+    Args:
+        rate: Requests per second.
+        burst: Requests that may go out back to back; defaults to *rate*.
+        write_interval: Seconds between two write requests.
+    """
+
+    def __init__(self, rate: float, burst: float = None, write_interval: float = SECONDS_BETWEEN_WRITES):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.write_interval = write_interval
+        self.requests = 0
+        self.pauses = 0
+        self.remaining = None
+        self._current_rate = self.rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._next_write = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, write: bool = False) -> None:
+        """Block until a request (a write, if *write*) may go out."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._current_rate)
+                self._updated = now
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._tokens) / self._current_rate,
+                    self._next_write - now if write else 0.0,
+                )
+                if wait <= 0:
+                    self._tokens -= 1
+                    self.requests += 1
+                    if write:
+                        self._next_write = now + self.write_interval
+                    return
+            time.sleep(wait)
+
+    def observe(self, headers) -> float:
+        """
+        Adjust to a response's rate-limit headers.
+
+        Returns:
+            The seconds every request now waits before the next one goes out,
+            0 if none, or the wait GitHub asked for if it is longer than
+            ``MAX_RATE_LIMIT_WAIT`` (not waited out).
+        """
+        wait = 0.0
+        reset = headers.get("X-RateLimit-Reset")
+        until_reset = max(float(reset) - time.time(), 1.0) if reset else None
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            self.remaining = int(float(remaining))
+        if "Retry-After" in headers:
+            wait = float(headers["Retry-After"])
+        elif self.remaining is not None and until_reset is not None:
+            if self.remaining <= 0:
+                wait = until_reset
+            with self._lock:
+                if self.remaining < LOW_QUOTA:
+                    self._current_rate = min(self.rate, max(self.remaining / until_reset, MIN_RATE))
+                else:
+                    self._current_rate = self.rate
+        if wait > 0:
+            self.pause(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request back for *seconds*, unless that is too long to wait."""
+        if seconds > MAX_RATE_LIMIT_WAIT:
+            return
+        with self._lock:
+            self.pauses += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class ETagCache:
+    """
+    Bodies of GET responses by URL, with their ``ETag`` and pagination ``Link``.
+
+    A GET for a cached URL goes out with ``If-None-Match``; GitHub answers an
+    unchanged resource with an empty 304, which does not count against the
+    rate limit, and the cached body stands in for it. With *path*, the cache
+    is read from and saved to that JSON file, so reads also repeat cheaply
+    across runs. Only entries used during the run are saved.
+
+    Args:
+        path: JSON file to persist the cache in, or None to keep it in memory.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.hits = 0
+        self._entries = {}
+        self._used = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    self._entries = {url: tuple(entry) for url, entry in json.load(fh).items()}
+            except (OSError, ValueError) as exc:
+                print(f"WARNING: ignoring HTTP cache {path}: {exc}", file=sys.stderr)
+
+    def get(self, url: str):
+        """``(etag, body, link)`` cached for *url*, or None."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._used.add(url)
+            return entry
+
+    def put(self, url: str, etag: str, body: str, link: str = None) -> None:
+        with self._lock:
+            self._entries[url] = (etag, body, link)
+            self._used.add(url)
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            entries = {url: list(self._entries[url]) for url in sorted(self._used)}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as fh:
+            json.dump(entries, fh)
+
+
+class _ThrottledConnection:
+    """
+    Mixin over PyGithub's connection classes: every request waits for the
+    shared ``limiter``, retries rate limits, and GETs go through ``etags``.
+    """
+
+    limiter = None
+    etags = None
+    _sessions = threading.local()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # PyGithub makes a connection per request once the classes are
+        # injected; sharing the session per thread keeps connections alive.
+        sessions = getattr(self._sessions, "by_host", None)
+        if sessions is None:
+            sessions = self._sessions.by_host = {}
+        self.session = sessions.setdefault((self.protocol, self.host, self.port), self.session)
+
+    def getresponse(self) -> RequestsResponse:
+        verb = self.verb.upper()
+        url = f"{self.protocol}://{self.host}:{self.port}{self.url}"
+        headers = dict(self.headers)
+        cached = self.etags.get(url) if verb == "GET" else None
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self.limiter.acquire(write=verb not in ("GET", "HEAD"))
+            r = self.session.request(
+                verb,
+                url,
+                headers=headers,
+                data=self.input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False,
+            )
+            wait = self.limiter.observe(r.headers)
+            if r.status_code not in (403, 429):
+                break
+            if not wait and "rate limit" in r.text.lower():
+                wait = SECONDARY_RATE_LIMIT_WAIT
+                self.limiter.pause(wait)
+            if not wait or wait > MAX_RATE_LIMIT_WAIT or attempt == RATE_LIMIT_RETRIES:
+                break
+            log(f"Rate limited on {verb} {self.url}; pausing {wait:.0f}s.")
+
+        if cached is not None and r.status_code == 304:
+            self.etags.hit()
+            r.status_code = 200
+            r.encoding = "utf-8"
+            r._content = cached[1].encode("utf-8")
+            if cached[2] and "Link" not in r.headers:
+                r.headers["Link"] = cached[2]
+        elif verb == "GET" and r.status_code == 200 and r.headers.get("ETag"):
+            self.etags.put(url, r.headers["ETag"], r.text, r.headers.get("Link"))
+        return RequestsResponse(r)
+
+    def close(self) -> None:
+        # The session is shared; it is closed with the process
+        pass
+
+
+def install_http(limiter: RateLimiter, etags: ETagCache) -> None:
+    """Route every PyGithub request of this process through *limiter* and *etags*."""
+    shared = {"limiter": limiter, "etags": etags}
+    Requester.injectConnectionClasses(
+        type("ThrottledHTTPConnection", (_ThrottledConnection, HTTPRequestsConnectionClass), shared),
+        type("ThrottledHTTPSConnection", (_ThrottledConnection, HTTPSRequestsConnectionClass), shared),
+    )
+
+
+def connect(token: str) -> Github:
+    """
+    A client whose requests go through the installed limiter.
+
+    PyGithub's own per-client throttling and its handling of rate-limited
+    403s are turned off, as the shared limiter covers both for all clients;
+    server errors are still retried.
+    """
+    return Github(
+        token,
+        # GH_API_URL points the bot at GitHub Enterprise or a local stand-in
+        base_url=os.getenv("GH_API_URL", "https://api.github.com"),
+        retry=Retry(total=5, backoff_factor=1, status_forcelist=(500, 502, 503, 504)),
+        seconds_between_requests=None,
+        seconds_between_writes=None,
+    )
+
+
 # ---------------------------------------------------------------------------
 # File helpers
 # ---------------------------------------------------------------------------
@@ -52,18 +339,125 @@ def ensure_file(repo, path: str, content: str, message: str, branch: str) -> boo
         True if a write was performed (file absent or content differed),
         False if the existing content was already identical (no-op skipped).
     """
-    try:
-        existing = repo.get_contents(path, ref=branch)
-        current = existing.decoded_content.decode("utf-8")
-        if current == content:
+    return ContentsWriter(repo, branch).write(path, content, message)
+
+
+def git_blob_sha(content: str) -> str:
+    """The git object id *content* gets as a blob, as listed in a tree."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class ContentsWriter:
+    """
+    Writes each change as its own commit through the Contents API.
+
+    The branch's files are listed once, with their blob SHAs, from one
+    recursive tree read. A write whose content hashes to the listed SHA is
+    skipped without downloading anything; only files that are read, such as
+    the append-only logs, are fetched, by blob SHA.
+
+    Args:
+        repo: PyGithub ``Repository`` object for the target repo.
+        branch: Branch name to write to.
+    """
+
+    def __init__(self, repo, branch: str):
+        self.repo = repo
+        self.branch = branch
+        self._blobs = None
+        self._complete = False
+
+    def read(self, path: str):
+        """Return the current content of *path* on the branch, or None if absent."""
+        sha = self._sha(path)
+        if sha is None:
+            return None
+        blob = self.repo.get_git_blob(sha)
+        return base64.b64decode(blob.content).decode("utf-8")
+
+    def write(self, path: str, content: str, message: str) -> bool:
+        """Commit *content* to *path*; False if it was already identical."""
+        sha = self._sha(path)
+        new_sha = git_blob_sha(content)
+        if sha == new_sha:
             return False
-        repo.update_file(path, message, content, existing.sha, branch=branch)
+        if sha is None:
+            self.repo.create_file(path, message, content, branch=self.branch)
+        else:
+            self.repo.update_file(path, message, content, sha, branch=self.branch)
+        self._blobs[path] = new_sha
         return True
-    except GithubException as exc:
-        if exc.status == 404:
-            repo.create_file(path, message, content, branch=branch)
-            return True
-        raise
+
+    def flush(self) -> int:
+        """Nothing is held back; every write is already on the branch."""
+        return 0
+
+    def _sha(self, path: str):
+        """Blob SHA of *path* as this writer last saw or left it, None if absent."""
+        if self._blobs is None:
+            tree = self.repo.get_git_tree(self.branch, recursive=True)
+            self._blobs = {entry.path: entry.sha for entry in tree.tree if entry.type == "blob"}
+            # Very large trees come back cut short; unlisted paths are then unknown
+            self._complete = not tree.truncated
+        if path not in self._blobs and not self._complete:
+            try:
+                self._blobs[path] = self.repo.get_contents(path, ref=self.branch).sha
+            except GithubException as exc:
+                if exc.status != 404:
+                    raise
+                self._blobs[path] = None
+        return self._blobs.get(path)
+
+
+class BatchWriter(ContentsWriter):
+    """
+    Collects changes and pushes them as one commit chain through the Git
+    Data API when flushed.
+
+    Each change becomes one tree (its content inline, so no separate blob
+    calls) and one commit on top of the previous one; the branch ref is
+    updated once at the end. A branch that moved in the meantime makes the
+    final, non-forced ref update fail instead of dropping anyone's commits.
+    """
+
+    def __init__(self, repo, branch: str):
+        super().__init__(repo, branch)
+        self._changes = []
+        self._pending = {}
+
+    def read(self, path: str):
+        if path in self._pending:
+            return self._pending[path]
+        return super().read(path)
+
+    def write(self, path: str, content: str, message: str) -> bool:
+        new_sha = git_blob_sha(content)
+        if self._sha(path) == new_sha:
+            return False
+        self._changes.append((path, content, message))
+        self._pending[path] = content
+        self._blobs[path] = new_sha
+        return True
+
+    def flush(self) -> int:
+        """Push the collected changes; returns the number of commits pushed."""
+        if not self._changes:
+            return 0
+        ref = self.repo.get_git_ref(f"heads/{self.branch}")
+        parent = self.repo.get_git_commit(ref.object.sha)
+        tree = parent.tree
+        for path, content, message in self._changes:
+            tree = self.repo.create_git_tree(
+                [InputGitTreeElement(path, "100644", "blob", content=content)], base_tree=tree
+            )
+            parent = self.repo.create_git_commit(message, tree, [parent])
+        ref.edit(parent.sha)
+
+        pushed = len(self._changes)
+        self._changes.clear()
+        self._pending.clear()
+        return pushed
 
 
 # ---------------------------------------------------------------------------
@@ -71,7 +465,7 @@ def ensure_file(repo, path: str, content: str, message: str, branch: str) -> boo
 # ---------------------------------------------------------------------------
 
 def apply_maintenance_changes(
-    repo, branch: str, today: datetime.date, min_commits: int
+    repo, branch: str, today: datetime.date, min_commits: int, writer=None
 ) -> int:
     """
     Apply at least *min_commits* real, small maintenance edits to *branch*.
@@ -82,82 +476,52 @@ def apply_maintenance_changes(
         today: The current UTC date (used to stamp log/changelog entries).
         min_commits: Minimum number of file writes required before a PR is
             considered ready.
+        writer: ``ContentsWriter`` or ``BatchWriter`` to write through;
+            defaults to one Contents API commit per file.
 
     Returns:
         The number of commits actually made during this run.
     """
+    writer = writer or ContentsWriter(repo, branch)
     date_str = today.isoformat()
     committed = 0
 
     # 1) Daily maintenance log — append today's entry if not already present
     log_path = "docs/MAINTENANCE_LOG.md"
     log_entry = f"## {date_str}\n- Automated repo maintenance run.\n"
-    try:
-        existing_log = repo.get_contents(log_path, ref=branch)
-        current_log = existing_log.decoded_content.decode("utf-8")
-        if date_str not in current_log:
-            new_log = current_log.rstrip("\n") + f"\n\n{log_entry}"
-            repo.update_file(
-                log_path,
-                f"docs: add maintenance log for {date_str}",
-                new_log,
-                existing_log.sha,
-                branch=branch,
-            )
-            committed += 1
-    except GithubException as exc:
-        if exc.status == 404:
-            repo.create_file(
-                log_path,
-                f"docs: add maintenance log for {date_str}",
-                f"# Maintenance Log\n\n{log_entry}",
-                branch=branch,
-            )
-            committed += 1
-        else:
-            raise
+    current_log = writer.read(log_path)
+    if current_log is None:
+        new_log = f"# Maintenance Log\n\n{log_entry}"
+    elif date_str not in current_log:
+        new_log = current_log.rstrip("\n") + f"\n\n{log_entry}"
+    else:
+        new_log = current_log
+    if writer.write(log_path, new_log, f"docs: add maintenance log for {date_str}"):
+        committed += 1
 
     # 2) Changelog — append today's entry if not already present
     changelog_path = "CHANGELOG.md"
     cl_entry = f"## {date_str}\n- Maintenance: docs/meta/housekeeping updates.\n"
-    try:
-        existing_cl = repo.get_contents(changelog_path, ref=branch)
-        current_cl = existing_cl.decoded_content.decode("utf-8")
-        if date_str not in current_cl:
-            new_cl = current_cl.rstrip("\n") + f"\n\n{cl_entry}"
-            repo.update_file(
-                changelog_path,
-                f"chore(changelog): add entry for {date_str}",
-                new_cl,
-                existing_cl.sha,
-                branch=branch,
-            )
-            committed += 1
-    except GithubException as exc:
-        if exc.status == 404:
-            repo.create_file(
-                changelog_path,
-                f"chore(changelog): add entry for {date_str}",
-                f"# Changelog\n\n{cl_entry}",
-                branch=branch,
-            )
-            committed += 1
-        else:
-            raise
+    current_cl = writer.read(changelog_path)
+    if current_cl is None:
+        new_cl = f"# Changelog\n\n{cl_entry}"
+    elif date_str not in current_cl:
+        new_cl = current_cl.rstrip("\n") + f"\n\n{cl_entry}"
+    else:
+        new_cl = current_cl
+    if writer.write(changelog_path, new_cl, f"chore(changelog): add entry for {date_str}"):
+        committed += 1
 
     # 3) CODEOWNERS baseline
-    if ensure_file(
-        repo,
+    if writer.write(
         ".github/CODEOWNERS",
         "* @niketbhatt2002\n",
         "chore(github): ensure CODEOWNERS baseline",
-        branch,
     ):
         committed += 1
 
     # 4) PR template
-    if ensure_file(
-        repo,
+    if writer.write(
         ".github/pull_request_template.md",
         (
             "## Summary\n\n"
@@ -167,7 +531,6 @@ def apply_maintenance_changes(
             "- [ ] Docs updated\n"
         ),
         "chore(github): add PR template baseline",
-        branch,
     ):
         committed += 1
 
@@ -180,18 +543,17 @@ def apply_maintenance_changes(
             f"- Repository: {repo.full_name}\n"
             f"- Action: Daily maintenance trace record.\n"
         )
-        if ensure_file(
-            repo,
+        if writer.write(
             f"docs/ops-notes/{date_str}-note-{note_index}.md",
             content,
             f"docs(ops): add maintenance note {note_index} for {date_str}",
-            branch,
         ):
             committed += 1
         note_index += 1
         if note_index > MAX_OPS_NOTES:  # hard safety cap — should never be reached
             break
 
+    writer.flush()
     return committed
 
 
@@ -214,36 +576,112 @@ def open_pr_exists(repo, branch_name: str, base_branch: str) -> bool:
     return pulls.totalCount > 0
 
 
+def branch_exists(repo, branch_name: str) -> bool:
+    """Return True if *branch_name* exists in *repo*."""
+    try:
+        repo.get_branch(branch_name)
+    except GithubException as exc:
+        if exc.status != 404:
+            raise
+        return False
+    return True
+
+
+class PRBudget:
+    """
+    The ``max_prs_per_day_total`` limit, shared by repos processed in parallel.
+
+    Repos claim a PR in rotation order, so the limit goes to the same repos
+    as when they are processed one after another: a claim first waits for
+    every earlier repo to claim or pass, then, while the claims still in
+    flight would use up the limit, for those to finish.
+
+    Args:
+        limit: Maximum number of PRs opened in the run.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.opened = 0
+        self._held = 0
+        self._turn = 0
+        self._cond = threading.Condition()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.opened >= self.limit
+
+    def claim(self, turn: int, wanted: bool = True) -> bool:
+        """
+        Take rotation position *turn*'s place in line.
+
+        Args:
+            turn: Position of the repo in today's rotation, from 0.
+            wanted: False to only pass the turn on, without claiming.
+
+        Returns:
+            True if the repo may open a PR; it must then call ``release``.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._turn == turn)
+            if wanted:
+                self._cond.wait_for(lambda: self.opened + self._held < self.limit or not self._held)
+            granted = wanted and self.opened + self._held < self.limit
+            self._held += granted
+            self._turn += 1
+            self._cond.notify_all()
+            return granted
+
+    def release(self, opened: bool) -> None:
+        """Settle a granted claim; *opened* says whether the PR was opened."""
+        with self._cond:
+            self._held -= 1
+            self.opened += opened
+            self._cond.notify_all()
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
-def main() -> None:
+def main(config_path: str = "bot-config.yml") -> None:
     """
     Entry point for the daily maintenance bot.
 
     Workflow:
     1. Validate ``GH_TOKEN`` and load ``bot-config.yml``.
-    2. Determine today's target repo via deterministic ordinal-based rotation.
-    3. Ensure the ``bot/maintenance-YYYY-MM-DD`` branch exists in that repo.
-    4. Skip if an open PR for that branch already exists (duplicate guard).
-    5. Apply ≥ ``min_commits_per_pr`` real maintenance edits.
-    6. Open one PR; enforce the ``max_prs_per_day_total`` hard limit.
-    7. Print a summary and exit cleanly.
+    2. Order the target repos by the deterministic ordinal-based rotation.
+    3. Check up to ``max_parallel_repos`` repos at a time: skip one whose
+       ``bot/maintenance-YYYY-MM-DD`` branch already has an open PR
+       (duplicate guard).
+    4. Claim one of the ``max_prs_per_day_total`` PRs, in rotation order.
+    5. Ensure the branch exists and apply ≥ ``min_commits_per_pr`` real
+       maintenance edits, written as ``write_mode`` says.
+    6. Open the PR.
+    7. Print a summary and exit cleanly, or with status 1 if a repo failed.
     """
     token = os.getenv("GH_TOKEN")
     if not token:
         print("ERROR: GH_TOKEN environment variable is required.", file=sys.stderr)
         sys.exit(1)
 
-    cfg = load_config()
+    cfg = load_config(config_path)
     owner: str = cfg["owner"]
     target_repos: list = cfg["target_repos"]
     max_prs: int = int(cfg["max_prs_per_day_total"])
     min_commits: int = int(cfg["min_commits_per_pr"])
     default_branch: str = cfg.get("default_branch", "main")
+    write_mode: str = cfg.get("write_mode", "contents")
+    max_parallel: int = int(cfg.get("max_parallel_repos", len(target_repos)))
+    requests_per_second: float = float(cfg.get("max_requests_per_second", 10))
+    if write_mode not in WRITE_MODES:
+        print(f"ERROR: write_mode must be one of {', '.join(WRITE_MODES)}.", file=sys.stderr)
+        sys.exit(1)
 
-    gh = Github(token)
+    limiter = RateLimiter(requests_per_second)
+    # BOT_HTTP_CACHE keeps ETags and bodies between runs (see the workflow)
+    etags = ETagCache(os.getenv("BOT_HTTP_CACHE"))
+    install_http(limiter, etags)
     today = utc_today()
     date_str = today.isoformat()
     branch_name = f"bot/maintenance-{date_str}"
@@ -252,64 +690,92 @@ def main() -> None:
     # chosen on the same calendar day regardless of when the workflow fires.
     idx = today.toordinal() % len(target_repos)
     ordered = target_repos[idx:] + target_repos[:idx]
+    budget = PRBudget(max_prs)
 
-    prs_created = 0
-    for repo_name in ordered:
-        if prs_created >= max_prs:
-            break
-
+    def process(turn: int, repo_name: str) -> None:
         full_name = f"{owner}/{repo_name}"
-        print(f"[{full_name}] Checking …")
-
-        repo = gh.get_repo(full_name)
-
-        # Ensure maintenance branch exists (create from default branch if absent)
+        claimed = None
+        opened = False
         try:
-            repo.get_branch(branch_name)
-            print(f"[{full_name}] Branch '{branch_name}' already exists.")
-        except GithubException as exc:
-            if exc.status == 404:
-                base_sha = repo.get_branch(default_branch).commit.sha
-                repo.create_git_ref(
-                    ref=f"refs/heads/{branch_name}", sha=base_sha
-                )
-                print(f"[{full_name}] Created branch '{branch_name}'.")
+            if budget.exhausted:
+                return
+            log(f"[{full_name}] Checking …")
+            repo = connect(token).get_repo(full_name)
+            has_branch = branch_exists(repo, branch_name)
+
+            # Skip if a PR is already open for today's branch
+            if has_branch and open_pr_exists(repo, branch_name, default_branch):
+                log(f"[{full_name}] Open PR already exists — skipping.")
+                return
+
+            claimed = budget.claim(turn)
+            if not claimed:
+                log(f"[{full_name}] PR limit reached — skipping.")
+                return
+
+            # Ensure maintenance branch exists (create from default branch if absent)
+            if has_branch:
+                log(f"[{full_name}] Branch '{branch_name}' already exists.")
             else:
-                raise
-
-        # Skip if a PR is already open for today's branch
-        if open_pr_exists(repo, branch_name, default_branch):
-            print(f"[{full_name}] Open PR already exists — skipping.")
-            continue
-
-        # Apply changes
-        commits_made = apply_maintenance_changes(
-            repo, branch_name, today, min_commits
-        )
-        print(f"[{full_name}] Commits applied: {commits_made}")
+                base_sha = repo.get_branch(default_branch).commit.sha
+                repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=base_sha)
+                log(f"[{full_name}] Created branch '{branch_name}'.")
 
-        if commits_made < min_commits:
-            print(
-                f"[{full_name}] Only {commits_made}/{min_commits} commits made "
-                "(content already up-to-date) — skipping PR."
+            # Apply changes
+            writer_cls = BatchWriter if write_mode == "batched" else ContentsWriter
+            commits_made = apply_maintenance_changes(
+                repo, branch_name, today, min_commits, writer_cls(repo, branch_name)
             )
-            continue
-
-        # Open the PR
-        pr = repo.create_pull(
-            title=f"chore: daily maintenance {date_str}",
-            body=(
-                f"Automated daily maintenance PR for `{full_name}`.\n\n"
-                f"Contains {commits_made} small, legitimate maintenance commits "
-                "(docs / changelog / GitHub meta / ops trace updates).\n"
-            ),
-            head=branch_name,
-            base=default_branch,
-        )
-        print(f"[{full_name}] PR opened: {pr.html_url}")
-        prs_created += 1
+            log(f"[{full_name}] Commits applied: {commits_made}")
 
-    print(f"\nDone. PRs created today: {prs_created}")
+            if commits_made < min_commits:
+                log(
+                    f"[{full_name}] Only {commits_made}/{min_commits} commits made "
+                    "(content already up-to-date) — skipping PR."
+                )
+                return
+
+            # Open the PR
+            pr = repo.create_pull(
+                title=f"chore: daily maintenance {date_str}",
+                body=(
+                    f"Automated daily maintenance PR for `{full_name}`.\n\n"
+                    f"Contains {commits_made} small, legitimate maintenance commits "
+                    "(docs / changelog / GitHub meta / ops trace updates).\n"
+                ),
+                head=branch_name,
+                base=default_branch,
+            )
+            log(f"[{full_name}] PR opened: {pr.html_url}")
+            opened = True
+        finally:
+            # Later repos wait on this one's turn, whatever happened to it
+            if claimed is None:
+                budget.claim(turn, wanted=False)
+            elif claimed:
+                budget.release(opened)
+
+    failed = False
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(ordered)))) as pool:
+            futures = {pool.submit(process, turn, name): name for turn, name in enumerate(ordered)}
+            for future, repo_name in futures.items():
+                try:
+                    future.result()
+                except Exception as exc:
+                    log(f"[{owner}/{repo_name}] ERROR: {exc}", file=sys.stderr)
+                    failed = True
+    finally:
+        etags.save()
+
+    print(f"\nDone. PRs created today: {budget.opened}")
+    print(
+        f"API requests: {limiter.requests} ({etags.hits} answered 304, not counted "
+        f"against the quota), rate-limit pauses: {limiter.pauses}, "
+        f"remaining quota: {limiter.remaining if limiter.remaining is not None else 'unknown'}"
+    )
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
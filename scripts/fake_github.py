@@ -0,0 +1,552 @@
+"""
+Local stand-in for the parts of the GitHub REST API the maintenance bot uses.
+
+Repositories live in memory as real git blobs over flat path -> blob trees,
+with branches, pull requests and the Contents and Git Data endpoints on top.
+Every request sleeps for a configurable latency and is counted per route, which
+is enough to compare how many calls, and how much waiting, each write mode of
+the bot costs. Responses carry GitHub's ``X-RateLimit-*`` headers against an
+hourly quota, GETs have ETags and answer a matching ``If-None-Match`` with a
+304 that costs no quota, and every ``--throttle-every``-th request can be
+refused as a secondary rate limit with a ``Retry-After``.
+
+Run it directly to put the bot through a full run per write mode::
+
+    python scripts/fake_github.py --latency-ms 50
+
+or start just the server and point the bot at it with ``GH_API_URL``::
+
+    python scripts/fake_github.py --serve --port 8765
+"""
+
+import argparse
+import base64
+import collections
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import yaml
+
+_ids = itertools.count(1)
+
+
+def blob_sha(data: bytes) -> str:
+    """The git object id of a blob holding *data*."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class FakeRepo:
+    def __init__(self, owner: str, name: str, default_branch: str = "main"):
+        self.owner = owner
+        self.name = name
+        self.default_branch = default_branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.branches = {}
+        self.pulls = []
+        self.lock = threading.Lock()
+        readme = self.put_blob(f"# {name}\n".encode())
+        tree = self.put_tree({"README.md": readme})
+        self.branches[default_branch] = self.put_commit(tree, [], "Initial commit")
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner}/{self.name}"
+
+    def put_blob(self, data: bytes) -> str:
+        sha = blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def put_tree(self, entries: dict) -> str:
+        sha = hashlib.sha1(json.dumps(sorted(entries.items())).encode()).hexdigest()
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def put_commit(self, tree: str, parents: list, message: str) -> str:
+        sha = hashlib.sha1(f"{tree} {parents} {message} {next(_ids)}".encode()).hexdigest()
+        self.commits[sha] = {"tree": tree, "parents": list(parents), "message": message}
+        return sha
+
+    def files(self, branch: str) -> dict:
+        return self.trees[self.commits[self.branches[branch]]["tree"]]
+
+
+class FakeGitHub:
+    """The server: repositories by full name, call counts and the HTTP handler."""
+
+    def __init__(self, latency: float = 0.0, quota: int = 5000, throttle_every: int = 0):
+        self.latency = latency
+        self.quota = quota
+        self.used = 0
+        self.reset = int(time.time()) + 3600
+        self.throttle_every = throttle_every
+        self.repos = {}
+        self.calls = collections.Counter()
+        self._requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def add_repo(self, owner: str, name: str, default_branch: str = "main") -> FakeRepo:
+        repo = FakeRepo(owner, name, default_branch)
+        self.repos[repo.full_name] = repo
+        return repo
+
+    def start(self, port: int = 0) -> str:
+        """Serve in a background thread; returns the base URL."""
+        handler = type("Handler", (_Handler,), {"github": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.calls[route] += 1
+
+    def admit(self):
+        """None if a request may be served, or the (status, message, headers) refusing it."""
+        with self._lock:
+            self._requests += 1
+            if self.throttle_every and self._requests % self.throttle_every == 0:
+                return 403, "You have exceeded a secondary rate limit.", {"Retry-After": "1"}
+            if self.used >= self.quota:
+                return 403, "API rate limit exceeded.", {}
+            return None
+
+    def charge(self) -> dict:
+        """Count a served request against the quota; returns the rate-limit headers."""
+        with self._lock:
+            self.used += 1
+            return self.rate_headers()
+
+    def rate_headers(self) -> dict:
+        return {
+            "X-RateLimit-Limit": str(self.quota),
+            "X-RateLimit-Remaining": str(max(self.quota - self.used, 0)),
+            "X-RateLimit-Used": str(self.used),
+            "X-RateLimit-Reset": str(self.reset),
+            "X-RateLimit-Resource": "core",
+        }
+
+
+# method, path pattern -> handler method name
+ROUTES = [
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)", "get_repo"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/branches/(?P<branch>.+)", "get_branch"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/pulls", "list_pulls"),
+    ("POST", r"/repos/(?P<repo>[^/]+/[^/]+)/pulls", "create_pull"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/contents/(?P<path>.+)", "get_contents"),
+    ("PUT", r"/repos/(?P<repo>[^/]+/[^/]+)/contents/(?P<path>.+)", "put_contents"),
+    ("POST", r"/repos/(?P<repo>[^/]+/[^/]+)/git/blobs", "create_blob"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/git/blobs/(?P<sha>\w+)", "get_blob"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/git/trees/(?P<sha>.+)", "get_tree"),
+    ("POST", r"/repos/(?P<repo>[^/]+/[^/]+)/git/trees", "create_tree"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/git/commits/(?P<sha>\w+)", "get_commit"),
+    ("POST", r"/repos/(?P<repo>[^/]+/[^/]+)/git/commits", "create_commit"),
+    ("GET", r"/repos/(?P<repo>[^/]+/[^/]+)/git/refs?/heads/(?P<branch>.+)", "get_ref"),
+    ("PATCH", r"/repos/(?P<repo>[^/]+/[^/]+)/git/refs?/heads/(?P<branch>.+)", "update_ref"),
+    ("POST", r"/repos/(?P<repo>[^/]+/[^/]+)/git/refs", "create_ref"),
+]
+ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+
+class _NotFound(Exception):
+    pass
+
+
+class _Unprocessable(Exception):
+    pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    github = None  # set per server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null") if length else None
+        time.sleep(self.github.latency)
+
+        refused = self.github.admit()
+        if refused is not None:
+            status, message, headers = refused
+            self.github.count("refused")
+            self._send(status, {"message": message}, {**headers, **self.github.rate_headers()})
+            return
+
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if route_method != method or match is None:
+                continue
+            params = match.groupdict()
+            repo = self.github.repos.get(params.pop("repo"))
+            try:
+                if repo is None:
+                    raise _NotFound()
+                with repo.lock:
+                    status, data = getattr(self, name)(repo, body=body, query=parse_qs(url.query), **params)
+            except _NotFound:
+                status, data = 404, {"message": "Not Found"}
+            except _Unprocessable as exc:
+                status, data = 422, {"message": str(exc)}
+            payload = json.dumps(data).encode()
+            etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+            if method == "GET" and status == 200 and self.headers.get("If-None-Match") == etag:
+                # Unchanged: no body, and no charge against the quota
+                self.github.count(f"{method} {name} (304)")
+                self._send(304, None, {"ETag": etag, **self.github.rate_headers()})
+                return
+            self.github.count(f"{method} {name}")
+            headers = self.github.charge()
+            if method == "GET" and status == 200:
+                headers["ETag"] = etag
+            self._send(status, data, headers)
+            return
+        self.github.count(f"{method} unknown")
+        self._send(404, {"message": "Not Found"}, self.github.charge())
+
+    def _send(self, status, data, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status == 304:
+            self.end_headers()
+            return
+        payload = json.dumps(data).encode()
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # -- JSON shapes --------------------------------------------------------
+
+    def _api(self, repo, suffix=""):
+        return f"{self.github.url}/repos/{repo.full_name}{suffix}"
+
+    def _commit_json(self, repo, sha):
+        commit = repo.commits[sha]
+        return {
+            "sha": sha,
+            "url": self._api(repo, f"/git/commits/{sha}"),
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"], "url": self._api(repo, f"/git/trees/{commit['tree']}")},
+            "parents": [{"sha": p, "url": self._api(repo, f"/git/commits/{p}")} for p in commit["parents"]],
+        }
+
+    def _tree_json(self, repo, sha):
+        entries = [
+            {"path": path, "mode": "100644", "type": "blob", "sha": blob, "size": len(repo.blobs[blob])}
+            for path, blob in sorted(repo.trees[sha].items())
+        ]
+        return {"sha": sha, "url": self._api(repo, f"/git/trees/{sha}"), "tree": entries, "truncated": False}
+
+    def _ref_json(self, repo, branch):
+        sha = repo.branches[branch]
+        return {
+            "ref": f"refs/heads/{branch}",
+            "url": self._api(repo, f"/git/refs/heads/{branch}"),
+            "object": {"sha": sha, "type": "commit", "url": self._api(repo, f"/git/commits/{sha}")},
+        }
+
+    def _content_json(self, repo, path, sha):
+        data = repo.blobs[sha]
+        return {
+            "type": "file",
+            "encoding": "base64",
+            "name": path.rsplit("/", 1)[-1],
+            "path": path,
+            "sha": sha,
+            "size": len(data),
+            "content": base64.b64encode(data).decode(),
+            "url": self._api(repo, f"/contents/{path}"),
+        }
+
+    def _commit_files(self, repo, branch, files, message):
+        if branch not in repo.branches:
+            raise _NotFound()
+        tree = repo.put_tree(files)
+        repo.branches[branch] = repo.put_commit(tree, [repo.branches[branch]], message)
+        return repo.branches[branch]
+
+    # -- Endpoints ----------------------------------------------------------
+
+    def get_repo(self, repo, **_):
+        owner = repo.owner
+        return 200, {
+            "id": hash(repo.full_name) & 0xFFFFFF,
+            "name": repo.name,
+            "full_name": repo.full_name,
+            "owner": {"login": owner, "url": f"{self.github.url}/users/{owner}"},
+            "default_branch": repo.default_branch,
+            "url": self._api(repo),
+            "html_url": f"https://github.invalid/{repo.full_name}",
+        }
+
+    def get_branch(self, repo, branch, **_):
+        if branch not in repo.branches:
+            raise _NotFound()
+        sha = repo.branches[branch]
+        return 200, {
+            "name": branch,
+            "commit": {"sha": sha, "url": self._api(repo, f"/commits/{sha}"), "commit": self._commit_json(repo, sha)},
+        }
+
+    def list_pulls(self, repo, query, **_):
+        head = query.get("head", [None])[0]
+        base = query.get("base", [None])[0]
+        state = query.get("state", ["open"])[0]
+        pulls = [
+            pull for pull in repo.pulls
+            if pull["state"] == state
+            and (head is None or f"{repo.owner}:{pull['head']['ref']}" == head)
+            and (base is None or pull["base"]["ref"] == base)
+        ]
+        return 200, pulls
+
+    def create_pull(self, repo, body, **_):
+        if body["head"] not in repo.branches:
+            raise _Unprocessable("head branch not found")
+        number = len(repo.pulls) + 1
+        pull = {
+            "number": number,
+            "state": "open",
+            "title": body["title"],
+            "body": body.get("body"),
+            "head": {"ref": body["head"]},
+            "base": {"ref": body["base"]},
+            "url": self._api(repo, f"/pulls/{number}"),
+            "html_url": f"https://github.invalid/{repo.full_name}/pull/{number}",
+        }
+        repo.pulls.append(pull)
+        return 201, pull
+
+    def get_contents(self, repo, path, query, **_):
+        branch = query.get("ref", [repo.default_branch])[0]
+        if branch not in repo.branches:
+            raise _NotFound()
+        sha = repo.files(branch).get(path)
+        if sha is None:
+            raise _NotFound()
+        return 200, self._content_json(repo, path, sha)
+
+    def put_contents(self, repo, path, body, **_):
+        branch = body.get("branch", repo.default_branch)
+        if branch not in repo.branches:
+            raise _NotFound()
+        files = dict(repo.files(branch))
+        if files.get(path) != body.get("sha"):
+            # Creating over an existing file, or updating from a stale sha
+            raise _Unprocessable("sha does not match")
+        files[path] = repo.put_blob(base64.b64decode(body["content"]))
+        commit = self._commit_files(repo, branch, files, body["message"])
+        return (201 if body.get("sha") is None else 200), {
+            "content": self._content_json(repo, path, files[path]),
+            "commit": self._commit_json(repo, commit),
+        }
+
+    def create_blob(self, repo, body, **_):
+        data = body["content"].encode() if body.get("encoding", "utf-8") == "utf-8" else base64.b64decode(body["content"])
+        sha = repo.put_blob(data)
+        return 201, {"sha": sha, "url": self._api(repo, f"/git/blobs/{sha}")}
+
+    def get_blob(self, repo, sha, **_):
+        if sha not in repo.blobs:
+            raise _NotFound()
+        data = repo.blobs[sha]
+        return 200, {
+            "sha": sha,
+            "size": len(data),
+            "encoding": "base64",
+            "content": base64.b64encode(data).decode(),
+            "url": self._api(repo, f"/git/blobs/{sha}"),
+        }
+
+    def get_tree(self, repo, sha, **_):
+        # Trees are flat, so every listing is already recursive. Like GitHub,
+        # a commit SHA or a branch name stands for its tree.
+        sha = repo.branches.get(sha, sha)
+        if sha in repo.commits:
+            sha = repo.commits[sha]["tree"]
+        if sha not in repo.trees:
+            raise _NotFound()
+        return 200, self._tree_json(repo, sha)
+
+    def create_tree(self, repo, body, **_):
+        files = dict(repo.trees[body["base_tree"]]) if body.get("base_tree") else {}
+        for entry in body["tree"]:
+            if entry.get("sha", "") is None:
+                files.pop(entry["path"], None)
+            elif "content" in entry:
+                files[entry["path"]] = repo.put_blob(entry["content"].encode())
+            elif entry["sha"] in repo.blobs:
+                files[entry["path"]] = entry["sha"]
+            else:
+                raise _Unprocessable("blob not found")
+        return 201, self._tree_json(repo, repo.put_tree(files))
+
+    def get_commit(self, repo, sha, **_):
+        if sha not in repo.commits:
+            raise _NotFound()
+        return 200, self._commit_json(repo, sha)
+
+    def create_commit(self, repo, body, **_):
+        if body["tree"] not in repo.trees or any(p not in repo.commits for p in body["parents"]):
+            raise _Unprocessable("tree or parent not found")
+        return 201, self._commit_json(repo, repo.put_commit(body["tree"], body["parents"], body["message"]))
+
+    def get_ref(self, repo, branch, **_):
+        if branch not in repo.branches:
+            raise _NotFound()
+        return 200, self._ref_json(repo, branch)
+
+    def update_ref(self, repo, branch, body, **_):
+        if branch not in repo.branches:
+            raise _NotFound()
+        if not body.get("force") and not self._descends(repo, body["sha"], repo.branches[branch]):
+            raise _Unprocessable("Update is not a fast forward")
+        repo.branches[branch] = body["sha"]
+        return 200, self._ref_json(repo, branch)
+
+    def create_ref(self, repo, body, **_):
+        branch = body["ref"].removeprefix("refs/heads/")
+        if branch in repo.branches:
+            raise _Unprocessable("Reference already exists")
+        if body["sha"] not in repo.commits:
+            raise _Unprocessable("Object does not exist")
+        repo.branches[branch] = body["sha"]
+        return 201, self._ref_json(repo, branch)
+
+    @staticmethod
+    def _descends(repo, sha, ancestor):
+        pending = [sha]
+        while pending:
+            current = pending.pop()
+            if current == ancestor:
+                return True
+            pending.extend(repo.commits[current]["parents"])
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Bot runs
+# ---------------------------------------------------------------------------
+
+def run_bot(config: dict, write_mode: str, latency: float, runs: int = 1, quota: int = 5000,
+            throttle_every: int = 0) -> None:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import daily_maintenance_bot
+
+    github = FakeGitHub(latency, quota, throttle_every)
+    for name in config["target_repos"]:
+        github.add_repo(config["owner"], name, config.get("default_branch", "main"))
+    os.environ["GH_API_URL"] = github.start()
+    os.environ.setdefault("GH_TOKEN", "fake-token")
+
+    workdir = tempfile.mkdtemp()
+    config_path = os.path.join(workdir, "bot-config.yml")
+    with open(config_path, "w", encoding="utf-8") as fh:
+        yaml.safe_dump({**config, "write_mode": write_mode}, fh)
+    # Later runs of the day start from the ETags the earlier ones saved
+    os.environ["BOT_HTTP_CACHE"] = os.path.join(workdir, "http-cache.json")
+    try:
+        started = time.perf_counter()
+        for _ in range(runs):
+            daily_maintenance_bot.main(config_path)
+        wall = time.perf_counter() - started
+    finally:
+        del os.environ["BOT_HTTP_CACHE"]
+        shutil.rmtree(workdir)
+        github.stop()
+
+    print(f"\n{write_mode}: {sum(github.calls.values())} API calls in {runs} run(s), {wall:.2f}s, "
+          f"{github.used} counted against the quota")
+    for route, count in sorted(github.calls.items()):
+        print(f"  {route:<28} {count}")
+    for repo in github.repos.values():
+        for pull in repo.pulls:
+            head = repo.branches[pull["head"]["ref"]]
+            commits = 0
+            while repo.commits[head]["parents"] and head != repo.branches[repo.default_branch]:
+                head = repo.commits[head]["parents"][0]
+                commits += 1
+            print(f"  {repo.full_name} PR #{pull['number']}: {commits} commits, "
+                  f"{len(repo.files(pull['head']['ref']))} files")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the maintenance bot against a local GitHub stand-in.")
+    parser.add_argument("--config", default="bot-config.yml")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Added to every request.")
+    parser.add_argument("--mode", choices=["contents", "batched", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=1, help="Bot runs per mode, as on a day with reruns.")
+    parser.add_argument("--max-prs", type=int, help="Overrides max_prs_per_day_total.")
+    parser.add_argument("--quota", type=int, default=5000, help="Requests per hour before 403s.")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="Refuse every Nth request with a secondary rate limit.")
+    parser.add_argument("--serve", action="store_true", help="Only run the server, with the configured repos.")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as fh:
+        config = yaml.safe_load(fh)
+    if args.max_prs is not None:
+        config["max_prs_per_day_total"] = args.max_prs
+
+    if args.serve:
+        github = FakeGitHub(args.latency_ms / 1000, args.quota, args.throttle_every)
+        for name in config["target_repos"]:
+            github.add_repo(config["owner"], name, config.get("default_branch", "main"))
+        print(f"Serving {', '.join(github.repos)} at {github.start(args.port)} (Ctrl+C stops)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        print(dict(github.calls))
+        return
+
+    for mode in (["contents", "batched"] if args.mode == "both" else [args.mode]):
+        run_bot(config, mode, args.latency_ms / 1000, args.runs, args.quota, args.throttle_every)
+
+
+if __name__ == "__main__":
+    main()